@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Acquisition service: the one process that owns the bioreactor hardware.
+
+    python acquisition_service.py
+    ACQUISITION=remote LOG_FILE= TELEMETRY_FILE= gunicorn -w 4 -b 0.0.0.0:5050 app:app
+
+It runs the reactors (sensors, fan control, history store) like app.py does
+on its own, and publishes every sample and the history ring of each reactor
+into shared memory (see shared_state.py), where any number of web workers
+read them. Fan and threshold commands from the workers arrive on the control
+socket, one JSON object per line:
+
+    {"cmd": "reactors"}
+    {"cmd": "fan", "reactor": "default", "action": "start"}
+    {"cmd": "config", "reactor": "default", "fan_temp_threshold": 27.5}
+    {"cmd": "adc", "reactor": "default"}
+
+Each answer is one JSON line, {"error": "..."} if the command was refused.
+"""
+
+import json
+import logging
+import os
+import signal
+import socketserver
+import threading
+from typing import Dict, List
+
+from bioreactor_backend import ReactorRegistry
+from shared_state import SharedHistoryBuffer, control_socket_path, state_path
+
+logger = logging.getLogger(__name__)
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.execute(json.loads(line))
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    """Control socket of the acquisition service (see module docstring)"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, registry: ReactorRegistry):
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a previous run
+        super().__init__(path, ControlHandler)
+        os.chmod(path, 0o660)
+        self.registry = registry
+
+    def execute(self, request: Dict) -> Dict:
+        cmd = request.get('cmd')
+        if cmd == 'reactors':
+            reactors = self.registry.describe()
+            if request.get('paths'):
+                # web workers open the history databases themselves for windows beyond 24h
+                for r in reactors:
+                    store = self.registry.reactors[r['name']].store
+                    r['history_db'] = store.path if store is not None else None
+            return {'reactors': reactors}
+
+        name = request.get('reactor')
+        try:
+            reactor = self.registry.get(name)
+        except KeyError:
+            raise ValueError(f"Unknown reactor '{name}'")
+        if cmd == 'fan':
+            action = request.get('action')
+            if action not in ('start', 'stop'):
+                raise ValueError("Invalid action. Use 'start' or 'stop'.")
+            return {'fan_running': reactor.set_fan(action == 'start')}
+        if cmd == 'config':
+            if 'fan_temp_threshold' in request:
+                reactor.set_fan_threshold(float(request['fan_temp_threshold']))
+            return {'fan_temp_threshold': reactor.get_fan_threshold()}
+        if cmd == 'adc':
+            return {'adc': reactor.adc_stats()}
+        raise ValueError(f"Unknown command {cmd!r}")
+
+
+def share_state(registry: ReactorRegistry) -> List[SharedHistoryBuffer]:
+    """Move every reactor's history into a shared file and publish its samples there"""
+    buffers = []
+    for name, monitor in registry.reactors.items():
+        shared = SharedHistoryBuffer(state_path(name), monitor.history.capacity, create=True)
+        cols = monitor.history.columns()
+        for ts, t, ph, fan in zip(cols['ts'], cols['temperature_c'], cols['ph'], cols['fan_running']):
+            shared.append(ts, t, ph, fan)
+        monitor.history = shared
+        shared.publish(monitor.snapshot)
+        monitor.sample_listeners.append(shared.publish)
+        buffers.append(shared)
+        logger.info(f"Reactor '{name}' shared at {shared.path} ({len(shared)} samples)")
+    return buffers
+
+
+def main():
+    registry = ReactorRegistry.from_env()
+    buffers = share_state(registry)
+    registry.start_monitoring(interval=float(os.environ.get('MONITOR_INTERVAL', '1.0')))
+    server = ControlServer(control_socket_path(), registry)
+    threading.Thread(target=server.serve_forever, name="control-socket", daemon=True).start()
+    logger.info(f"Acquisition service running, control socket {server.server_address}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    try:
+        while not stop.wait(1.0):
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        try:
+            os.unlink(server.server_address)
+        except OSError:
+            pass
+        registry.stop_monitoring()
+        for shared in buffers:
+            shared.close()
+        logger.info("Acquisition service stopped")
+
+
+if __name__ == "__main__":
+    main()
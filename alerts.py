@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Rolling statistics and alert rules over the sample stream of a reactor.
+
+Every sample updates, for each signal (temperature_c, ph) and window (5 min
+and 1 h by default, ROLLING_WINDOWS="5m,1h"): count, mean, standard
+deviation, min, max, least-squares slope (per hour) and an EWMA whose time
+constant is the window. Each update is O(1) (amortised): running sums for
+the moments and the regression, monotonic deques for min/max; history is
+never rescanned.
+
+Alert rules compare one of these (or the raw value) with a limit and fire
+once the condition has held for a time or a number of consecutive samples,
+optionally only while other fields of the sample match. Rules on a window
+statistic wait until samples have covered at least half of the window. Rules come from
+ALERT_RULES_FILE (a JSON list) or DEFAULT_RULES, e.g.
+
+    {"name": "ph_falling", "signal": "ph", "stat": "slope", "window": "1h",
+     "op": "<", "value": -0.1, "for": "20m"}
+    {"name": "overheating", "signal": "temperature_c", "op": ">", "value": "fan_threshold",
+     "for_samples": 30, "when": {"fan_running": true}, "severity": "critical"}
+
+A string `value` names a field of the sample or of the context the monitor
+passes (fan_threshold). Durations are seconds or "30s", "20m", "1h", "2d".
+"""
+
+import json
+import logging
+import math
+import operator
+import os
+from collections import deque
+from typing import Dict, List, Mapping, Optional
+
+from metrics import REGISTRY as metrics
+
+logger = logging.getLogger(__name__)
+
+ALERTS_FIRED = metrics.counter('bioreactor_alerts_fired_total', 'Alert rules that started firing')
+
+SIGNALS = ('temperature_c', 'ph')
+STATS = ('value', 'n', 'mean', 'std', 'min', 'max', 'slope', 'ewma')
+
+DEFAULT_RULES = [
+    {"name": "ph_falling", "signal": "ph", "stat": "slope", "window": "1h", "op": "<", "value": -0.1,
+     "for": "20m", "message": "pH falling faster than 0.1 per hour"},
+    {"name": "ph_low", "signal": "ph", "stat": "mean", "window": "5m", "op": "<", "value": 6.5, "for": "5m"},
+    {"name": "ph_high", "signal": "ph", "stat": "mean", "window": "5m", "op": ">", "value": 8.5, "for": "5m"},
+    {"name": "overheating", "signal": "temperature_c", "op": ">", "value": "fan_threshold", "for_samples": 30,
+     "when": {"fan_running": True}, "severity": "critical",
+     "message": "Temperature above the fan threshold although the fan is running"},
+]
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value) -> float:
+    """Seconds of 90, "90", "30s", "20m", "1h" or "2d"; ValueError otherwise"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    if text and text[-1] in _UNITS:
+        return float(text[:-1]) * _UNITS[text[-1]]
+    return float(text)
+
+
+def format_duration(seconds: float) -> str:
+    for unit in ('d', 'h', 'm'):
+        if seconds >= _UNITS[unit] and seconds % _UNITS[unit] == 0:
+            return f"{int(seconds // _UNITS[unit])}{unit}"
+    return f"{seconds:g}s"
+
+
+class RollingWindow:
+    """Statistics of the samples of the last `seconds` (by sample time), O(1) per sample"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.samples = deque()   # (t, x)
+        self._min = deque()      # increasing values: the front is the minimum
+        self._max = deque()      # decreasing values: the front is the maximum
+        # sums of x, x², u, u², u·x with u = t - t0 (small numbers for the regression)
+        self._t0 = None
+        self._sums = [0.0] * 5
+        self._evicted = 0
+        self.ewma = None
+        self._ewma_t = None
+        self.first = None        # time of the first sample ever added
+
+    def covered(self, now: float) -> float:
+        """Fraction of the window for which samples have been arriving (up to 1)"""
+        return 0.0 if self.first is None else min(1.0, (now - self.first) / self.seconds)
+
+    def add(self, t: float, x: float):
+        """Sample x at time t (seconds, not decreasing)"""
+        if self._t0 is None:
+            self._t0 = t
+        if self.first is None:
+            self.first = t
+        u = t - self._t0
+        self.samples.append((t, x))
+        s = self._sums
+        s[0] += x
+        s[1] += x * x
+        s[2] += u
+        s[3] += u * u
+        s[4] += u * x
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((t, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((t, x))
+        if self.ewma is None:
+            self.ewma = x
+        else:
+            self.ewma += (1 - math.exp(-max(0.0, t - self._ewma_t) / self.seconds)) * (x - self.ewma)
+        self._ewma_t = t
+        self.expire(t)
+
+    def expire(self, now: float):
+        """Drop the samples that are older than the window at time `now`"""
+        cutoff = now - self.seconds
+        s = self._sums
+        while self.samples and self.samples[0][0] <= cutoff:
+            t, x = self.samples.popleft()
+            u = t - self._t0
+            s[0] -= x
+            s[1] -= x * x
+            s[2] -= u
+            s[3] -= u * u
+            s[4] -= u * x
+            self._evicted += 1
+        while self._min and self._min[0][0] <= cutoff:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= cutoff:
+            self._max.popleft()
+        if self._evicted > max(64, len(self.samples)):
+            self._rebase()
+
+    def _rebase(self):
+        # Sums afresh from the window, relative to its oldest sample: undoes the rounding
+        # error of the subtractions. Runs once per window length of evictions, so O(1) amortised.
+        self._t0 = self.samples[0][0] if self.samples else None
+        s = self._sums = [0.0] * 5
+        for t, x in self.samples:
+            u = t - self._t0
+            s[0] += x
+            s[1] += x * x
+            s[2] += u
+            s[3] += u * u
+            s[4] += u * x
+        self._evicted = 0
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        n = len(self.samples)
+        if not n:
+            return {'n': 0, 'mean': None, 'std': None, 'min': None, 'max': None, 'slope': None, 'ewma': None}
+        sx, sxx, su, suu, sux = self._sums
+        mean = sx / n
+        std = math.sqrt(max(0.0, (sxx - sx * mean) / (n - 1))) if n > 1 else 0.0
+        slope = None
+        denominator = n * suu - su * su
+        if n > 1 and denominator > 1e-9 * n * suu:
+            slope = (n * sux - su * sx) / denominator * 3600  # per hour
+        return {'n': n, 'mean': mean, 'std': std, 'min': self._min[0][1], 'max': self._max[0][1],
+                'slope': slope, 'ewma': self.ewma}
+
+
+class AlertRule:
+    """One rule (see module docstring); `hold` seconds or `hold_samples` samples before it fires"""
+
+    OPS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+    def __init__(self, name: str, signal: str, op: str, value, stat: str = 'value', window: Optional[float] = None,
+                 hold: float = 0.0, hold_samples: int = 0, when: Optional[Dict] = None, severity: str = 'warning',
+                 message: Optional[str] = None):
+        if signal not in SIGNALS:
+            raise ValueError(f"Alert rule {name}: unknown signal {signal!r} (use {', '.join(SIGNALS)})")
+        if stat not in STATS:
+            raise ValueError(f"Alert rule {name}: unknown stat {stat!r} (use {', '.join(STATS)})")
+        if op not in self.OPS:
+            raise ValueError(f"Alert rule {name}: unknown op {op!r} (use {', '.join(self.OPS)})")
+        if stat != 'value' and not window:
+            raise ValueError(f"Alert rule {name}: stat {stat!r} needs a window")
+        self.name = name
+        self.signal = signal
+        self.op = op
+        self.value = value
+        self.stat = stat
+        self.window = window if stat != 'value' else None
+        self.hold = hold
+        self.hold_samples = hold_samples
+        self.when = dict(when or {})
+        self.severity = severity
+        what = signal if stat == 'value' else f"{signal} {stat} ({format_duration(window)})"
+        self.message = message or f"{what} {op} {value}"
+
+    @classmethod
+    def from_dict(cls, d: Mapping) -> 'AlertRule':
+        return cls(d['name'], d['signal'], d['op'], d['value'], stat=d.get('stat', 'value'),
+                   window=parse_duration(d['window']) if d.get('window') else None,
+                   hold=parse_duration(d.get('for', 0)), hold_samples=int(d.get('for_samples', 0)),
+                   when=d.get('when'), severity=d.get('severity', 'warning'), message=d.get('message'))
+
+
+class AlertEngine:
+    """Rolling statistics of one reactor's samples and the state of its alert rules.
+
+    `update()` is called by the monitor loop with every sample and returns what
+    goes into it: {'stats': {signal: {window: {...}}}, 'alerts': [active alerts]}.
+    """
+
+    def __init__(self, rules: Optional[List[AlertRule]] = None, windows: Optional[List[float]] = None):
+        self.rules = list(rules or [])
+        windows = set(windows or [])
+        windows.update(r.window for r in self.rules if r.window)
+        self.windows = {signal: {w: RollingWindow(w) for w in sorted(windows)} for signal in SIGNALS}
+        # rule name -> [condition true since (sample time), consecutive samples, firing since (ts ms) or None, value]
+        self.state = {r.name: [None, 0, None, None] for r in self.rules}
+
+    @classmethod
+    def from_env(cls, rules: Optional[List[Dict]] = None) -> 'AlertEngine':
+        """Rules given (e.g. per reactor in REACTORS_FILE), else ALERT_RULES_FILE, else DEFAULT_RULES"""
+        if rules is None:
+            path = os.environ.get('ALERT_RULES_FILE')
+            if path:
+                with open(path) as f:
+                    rules = json.load(f)
+            else:
+                rules = DEFAULT_RULES
+        windows = [parse_duration(w) for w in os.environ.get('ROLLING_WINDOWS', '5m,1h').split(',') if w.strip()]
+        return cls([AlertRule.from_dict(r) for r in rules], windows)
+
+    def smoothed(self, t: float) -> Dict[str, Optional[float]]:
+        """Mean of each signal over its shortest window, once samples cover half of it (else None)"""
+        means = {}
+        for signal, windows in self.windows.items():
+            window = windows[min(windows)] if windows else None
+            means[signal] = window.stats()['mean'] if window and window.covered(t) >= 0.5 else None
+        return means
+
+    def _limit(self, rule: AlertRule, data: Mapping, context: Mapping) -> Optional[float]:
+        if isinstance(rule.value, str):
+            return context.get(rule.value, data.get(rule.value))
+        return rule.value
+
+    def update(self, data: Mapping, context: Optional[Mapping] = None) -> Dict:
+        context = context or {}
+        ts = data.get('ts')
+        if ts is None:
+            return {'stats': {}, 'alerts': []}
+        t = ts / 1000.0
+        for signal, windows in self.windows.items():
+            x = data.get(signal)
+            for window in windows.values():
+                if x is not None:
+                    window.add(t, x)
+                else:
+                    window.expire(t)  # a sensor that stopped reporting leaves its windows empty in time
+
+        stats = {signal: {w: window.stats() for w, window in windows.items()}
+                 for signal, windows in self.windows.items()}
+        active = []
+        for rule in self.rules:
+            state = self.state[rule.name]
+            if rule.stat == 'value':
+                observed = data.get(rule.signal)
+            elif self.windows[rule.signal][rule.window].covered(t) >= 0.5:
+                observed = stats[rule.signal][rule.window][rule.stat]
+            else:
+                observed = None  # e.g. the "1h slope" of the first minutes after a start is mostly noise
+            limit = self._limit(rule, data, context)
+            holds = (observed is not None and limit is not None
+                     and all(data.get(k) == v for k, v in rule.when.items())
+                     and rule.OPS[rule.op](observed, limit))
+            if not holds:
+                if state[2] is not None:
+                    logger.info(f"Alert {rule.name} cleared on reactor {data.get('reactor')}")
+                self.state[rule.name] = state = [None, 0, None, None]
+                continue
+            if state[0] is None:
+                state[0] = t
+            state[1] += 1
+            state[3] = observed
+            if state[2] is None and t - state[0] >= rule.hold and state[1] >= rule.hold_samples:
+                state[2] = ts
+                ALERTS_FIRED.inc(reactor=data.get('reactor'), rule=rule.name)
+                logger.warning(f"Alert {rule.name} on reactor {data.get('reactor')}: {rule.message} "
+                               f"({observed:.4g} {rule.op} {limit:g})")
+            if state[2] is not None:
+                active.append({'name': rule.name, 'severity': rule.severity, 'message': rule.message,
+                               'since': state[2], 'value': round(observed, 4), 'limit': limit})
+        return {
+            'stats': {
+                signal: {format_duration(w): {k: round(v, 4) if isinstance(v, float) else v for k, v in st.items()}
+                         for w, st in windows.items()}
+                for signal, windows in stats.items()
+            },
+            'alerts': active,
+        }
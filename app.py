@@ -1,74 +1,290 @@
 #!/usr/bin/env python3
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, abort, g, jsonify, make_response, render_template, request
 from threading import Event
-from bioreactor_backend import BioreactorMonitor
+from datetime import datetime, timezone
+import json
+import math
+import queue
+import time
+from bioreactor_backend import ReactorRegistry, export_chunks, export_rows
+from metrics import REGISTRY as metrics, PROFILER as profiler
+from shared_state import ControlError, RemoteRegistry
 import logging
+import os
 
 app = Flask(__name__)
 logger = logging.getLogger(__name__)
 
-# Initialize monitor
-monitor = BioreactorMonitor()
-monitor.start_monitoring(interval=1.0)
+# Initialize monitors: one per reactor in REACTORS_FILE, or a single one from the environment.
+# With ACQUISITION=remote, acquisition_service.py owns the hardware and this process only
+# reads its shared state, so the app can run in any number of worker processes.
+# ACQUISITION=simulated replays a sensor trace on simulated hardware (see simulator.py).
+acquisition = os.environ.get("ACQUISITION", "local")
+if acquisition == "remote":
+    registry = RemoteRegistry.from_env()
+elif acquisition == "simulated":
+    from simulator import SimulatedHardware
+    registry = SimulatedHardware.from_env().registry()
+else:
+    registry = ReactorRegistry.from_env()
+registry.start_monitoring(interval=1.0)
+monitor = registry.default
 shutdown_event = Event()
 
+HTTP_REQUEST_SECONDS = metrics.histogram("bioreactor_http_request_seconds", "Time spent in a request handler")
+HTTP_REQUESTS = metrics.counter("bioreactor_http_requests_total", "HTTP requests by endpoint and status")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = profiler.begin()
+
+
+@app.after_request
+def record_request(response):
+    # For /api/stream this is the time to set up the stream, not its lifetime
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    started = g.pop("request_started", None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(exception=None):
+    profiler.end(g.pop("profile", None))
+
+
+def get_reactor():
+    """Monitor selected with ?reactor=<name> (the first reactor by default); 404 if unknown"""
+    name = request.args.get("reactor")
+    try:
+        return registry.get(name)
+    except KeyError:
+        abort(make_response(jsonify({"error": f"Unknown reactor '{name}'",
+                                     "reactors": list(registry.reactors)}), 404))
+
+
+@app.errorhandler(ControlError)
+def acquisition_unavailable(e):
+    return jsonify({"error": str(e)}), 503
+
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
 
+@app.route("/api/reactors", methods=["GET"])
+def api_reactors():
+    return jsonify({"reactors": registry.describe()})
+
+
 @app.route("/api/status", methods=["GET"])
 def api_status():
-    data = monitor.get_current_data()
-    return jsonify(data)
+    reactor = get_reactor()
+    # Same bytes for every request until the next sample; 304 if the client already has it
+    ts, payload = reactor.get_current_json()
+    resp = Response(payload, mimetype="application/json")
+    resp.headers["Cache-Control"] = "no-cache"
+    if ts is not None:
+        resp.set_etag(str(ts))
+        resp.last_modified = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+    return resp.make_conditional(request)
+
+
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    """Server-Sent Events: one `data:` message per new sample, keep-alive comments in between"""
+    reactor = get_reactor()
+    q = reactor.broadcaster.subscribe()
+    if q is None:
+        return jsonify({"error": "Too many stream clients, use /api/status"}), 503
+
+    def events():
+        try:
+            yield b"data: " + reactor.get_current_json()[1] + b"\n\n"
+            while True:
+                try:
+                    payload = q.get(timeout=15)
+                except queue.Empty:
+                    yield b": keep-alive\n\n"
+                    continue
+                if payload is None:  # dropped as a slow client
+                    return
+                yield b"data: " + payload + b"\n\n"
+        finally:
+            reactor.broadcaster.unsubscribe(q)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/api/history", methods=["GET"])
 def api_history():
+    reactor = get_reactor()
     try:
         minutes = int(request.args.get("minutes", 30))
     except Exception:
         minutes = 30
-    history = monitor.get_history(minutes=minutes)
-    return jsonify({"minutes": minutes, "data": history})
+    # Optional server-side reduction: bucket=<seconds> or points=<count>, method=minmax|lttb
+    # and since=<ts ms> to get only samples newer than what the client already has
+    try:
+        bucket_s = float(request.args["bucket"]) if "bucket" in request.args else None
+        points = int(request.args["points"]) if "points" in request.args else None
+        since = int(request.args["since"]) if "since" in request.args else None
+    except ValueError:
+        return jsonify({"error": "bucket, points and since must be numbers"}), 400
+    method = request.args.get("method", "minmax").lower()
+    if method not in ("minmax", "lttb"):
+        return jsonify({"error": "Invalid method. Use 'minmax' or 'lttb'."}), 400
+    if (bucket_s is not None and bucket_s <= 0) or (points is not None and points <= 0):
+        return jsonify({"error": "bucket and points must be positive"}), 400
+
+    def build():
+        history = reactor.get_history(minutes=minutes, bucket_s=bucket_s, points=points, method=method,
+                                      since_ms=since)
+        body = {"minutes": reactor.clamp_minutes(minutes), "data": history}
+        if since is not None:
+            # Cursor for the next call: newest ts returned (or the old cursor if nothing is new)
+            body["since"] = since
+            body["cursor"] = history[-1]["ts"] if history else since
+        if bucket_s is not None:
+            body["bucket"] = bucket_s
+        if points is not None:
+            body["points"] = points
+        if bucket_s is not None or points is not None or method == "lttb":
+            body["method"] = method
+        return json.dumps(body).encode()
+
+    # Dashboards opening at the same time ask for the same window: built and encoded once per sample
+    payload = reactor.derived(("history", minutes, bucket_s, points, method, since), build)
+    return Response(payload, mimetype="application/json")
+
+
+def parse_time_ms(value):
+    """Epoch milliseconds, or an ISO 8601 date / time (local time unless it has an offset)"""
+    if value.lstrip("-").isdigit():
+        ms = int(value)
+    else:
+        ms = int(datetime.fromisoformat(value).timestamp() * 1000)
+    if abs(ms) >= 2 ** 62:  # beyond what SQLite stores
+        raise ValueError(f"time out of range: {value}")
+    return ms
+
+
+@app.route("/api/export", methods=["GET"])
+def api_export():
+    """Stream history for download: ?start=&end= (epoch ms or ISO 8601; default the last `minutes`, 1440),
+    format=csv|ndjson, bucket=<seconds> to resample, gzip=1 to compress"""
+    reactor = get_reactor()
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "Invalid format. Use 'csv' or 'ndjson'."}), 400
+    try:
+        end_ms = parse_time_ms(request.args["end"]) if "end" in request.args else int(reactor.clock() * 1000) + 1
+        if "start" in request.args:
+            start_ms = parse_time_ms(request.args["start"])
+        else:
+            start_ms = max(0, end_ms - int(float(request.args.get("minutes", 24 * 60)) * 60 * 1000))
+        bucket_s = float(request.args["bucket"]) if "bucket" in request.args else None
+        if bucket_s is not None and not (math.isfinite(bucket_s) and bucket_s > 0):
+            return jsonify({"error": "bucket must be a positive number of seconds"}), 400
+        bucket_ms = max(1, int(bucket_s * 1000)) if bucket_s is not None else None
+    except (ValueError, OverflowError):
+        return jsonify({"error": "start and end must be epoch ms or ISO 8601; minutes and bucket numbers"}), 400
+    if start_ms >= end_ms:
+        return jsonify({"error": "start must be before end"}), 400
+    compress = request.args.get("gzip", "0").lower() in ("1", "true", "yes")
+
+    # Rows are read, formatted and sent a chunk at a time: memory stays flat for any range,
+    # and the store is read on its own connection, so the monitor keeps writing meanwhile
+    rows = export_rows(reactor.iter_records(start_ms, end_ms), bucket_ms)
+    filename = f"bioreactor-{reactor.name}-{start_ms}-{end_ms}.{fmt}" + (".gz" if compress else "")
+    mimetype = "application/gzip" if compress else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return Response(export_chunks(rows, fmt, compress), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 
 @app.route("/api/fan", methods=["POST"])
 def api_fan():
+    reactor = get_reactor()
     body = request.get_json(silent=True) or {}
     action = (body.get("action") or "").lower()
-    if action == "start":
-        monitor.fan_controller.start_fan()
-    elif action == "stop":
-        monitor.fan_controller.stop_fan()
-    else:
+    if action not in ("start", "stop"):
         return jsonify({"error": "Invalid action. Use 'start' or 'stop'."}), 400
-    return jsonify({"fan_running": monitor.fan_controller.fan_running})
+    return jsonify({"fan_running": reactor.set_fan(action == "start")})
+
+
+@app.route("/api/adc", methods=["GET"])
+def api_adc():
+    reactor = get_reactor()
+    # Oversampling settings and per-channel rate / noise of the MCP3008
+    return jsonify(reactor.adc_stats())
 
 
 @app.route("/api/config", methods=["GET", "POST"])
 def api_config():
+    reactor = get_reactor()
     if request.method == "GET":
         return jsonify({
-            "fan_temp_threshold": monitor.fan_controller.temp_threshold
+            "fan_temp_threshold": reactor.get_fan_threshold()
         })
     else:
         body = request.get_json(silent=True) or {}
         try:
             if "fan_temp_threshold" in body:
-                monitor.fan_controller.temp_threshold = float(body["fan_temp_threshold"])
+                reactor.set_fan_threshold(float(body["fan_temp_threshold"]))
             return jsonify({
-                "fan_temp_threshold": monitor.fan_controller.temp_threshold
+                "fan_temp_threshold": reactor.get_fan_threshold()
             })
+        except ControlError:
+            raise
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/metrics", methods=["GET", "POST"])
+def api_metrics():
+    """JSON summary; POST {"enabled": bool} switches instrumentation, {"profiling": "start"|"stop"} the profiler"""
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if "enabled" in body:
+            metrics.enabled = bool(body["enabled"])
+        action = (body.get("profiling") or "").lower()
+        if action == "start":
+            profiler.start()
+        elif action == "stop":
+            profiler.stop()
+        elif action:
+            return jsonify({"error": "Invalid profiling action. Use 'start' or 'stop'."}), 400
+    return jsonify(metrics.summary())
+
+
+@app.route("/api/metrics/profile", methods=["GET"])
+def api_metrics_profile():
+    """cProfile report of the sensor threads, monitor loops and requests since profiling started"""
+    try:
+        limit = int(request.args.get("limit", 30))
+    except ValueError:
+        limit = 30
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"error": "Invalid sort. Use 'cumulative', 'tottime' or 'calls'."}), 400
+    return Response(profiler.report(limit=limit, sort=sort), mimetype="text/plain")
+
+
 @app.teardown_appcontext
 def shutdown_session(exception=None):
     if shutdown_event.is_set():
         try:
-            monitor.stop_monitoring()
+            registry.stop_monitoring()
         except Exception:
             pass
 
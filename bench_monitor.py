@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the monitor and the web API on simulated hardware.
+
+Live phase: the Flask app (ACQUISITION=simulated, see simulator.py) replays a
+trace with frequent heat events at --speed times real time, served by a
+threaded server that --clients dashboard-like pollers (status with ETags,
+bucketed and incremental history) and --stream-clients SSE listeners hit for
+--seconds. Reports request latency percentiles per endpoint, loop jitter
+(spacing of the samples against the monitor interval, and the deadline
+lateness of every loop), fan reaction time (from the moment the trace crosses
+the threshold to the GPIO pin going high), DS18B20 CRC failures and RSS.
+
+Soak phase: one reactor on a stopped clock, stepped one sample per simulated
+second as fast as it runs (with the on-disk store), for --soak-days; reports
+samples/s and memory growth per simulated day once the in-memory history is
+full. Results are appended as JSON lines so runs can be compared:
+
+    python bench_monitor.py --out bench_monitor.jsonl
+    python bench_monitor.py --speed 120 --clients 32 --seconds 60 --soak-days 3
+"""
+
+import argparse
+import gc
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+DAY = 24 * 60 * 60
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def rss_mb():
+    """Current resident set size (Linux), else the peak"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values, qs=(0.5, 0.9, 0.99)):
+    values = sorted(values)
+    if not values:
+        return {}
+    out = {f"p{int(q * 100)}": values[min(len(values) - 1, int(q * len(values)))] for q in qs}
+    out["max"] = values[-1]
+    return out
+
+
+def _ms(d):
+    return {k: round(v * 1000, 3) for k, v in d.items()}
+
+
+class Client(threading.Thread):
+    """Polls like a dashboard: status with If-None-Match, now and then the history (bucketed or incremental)"""
+
+    MIX = [("status", 8), ("history_bucket", 1), ("history_since", 2), ("reactors", 1)]
+
+    def __init__(self, port, deadline, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.latencies = {name: [] for name, _ in self.MIX}
+        self.not_modified = 0
+        self.errors = 0
+        self.etag = None
+        self.cursor = None
+
+    def path(self, kind):
+        if kind == "status":
+            return "/api/status"
+        if kind == "history_bucket":
+            return "/api/history?minutes=60&bucket=60"
+        if kind == "history_since":
+            return f"/api/history?minutes=10&since={self.cursor}" if self.cursor else "/api/history?minutes=10"
+        return "/api/reactors"
+
+    def run(self):
+        kinds = [name for name, weight in self.MIX for _ in range(weight)]
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        while time.monotonic() < self.deadline:
+            kind = self.rng.choice(kinds)
+            headers = {"If-None-Match": self.etag} if kind == "status" and self.etag else {}
+            started = time.perf_counter()
+            try:
+                conn.request("GET", self.path(kind), headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+                continue
+            self.latencies[kind].append(time.perf_counter() - started)
+            if resp.status == 304:
+                self.not_modified += 1
+            elif resp.status != 200:
+                self.errors += 1
+            elif kind == "status":
+                self.etag = resp.getheader("ETag")
+            elif kind == "history_since":
+                self.cursor = json.loads(body).get("cursor", self.cursor)
+            time.sleep(self.rng.uniform(0, 0.02))  # think time
+        conn.close()
+
+
+class StreamClient(threading.Thread):
+    """Counts the samples pushed on /api/stream"""
+
+    def __init__(self, port, deadline):
+        super().__init__(daemon=True)
+        self.port = port
+        self.deadline = deadline
+        self.events = 0
+        self.errors = 0
+
+    def run(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+        try:
+            conn.request("GET", "/api/stream")
+            resp = conn.getresponse()
+            while time.monotonic() < self.deadline:
+                try:
+                    line = resp.fp.readline()
+                except OSError:
+                    continue  # socket timeout between samples
+                if not line:
+                    break
+                if line.startswith(b"data:"):
+                    self.events += 1
+        except (OSError, http.client.HTTPException):
+            self.errors += 1
+        finally:
+            conn.close()
+
+
+def fan_reactions(hardware, threshold, end, window=30.0):
+    """(reaction times in simulated s, threshold crossings without a fan start) of every reactor"""
+    reactions, missed = [], 0
+    for i in range(hardware.reactors):
+        # probe i reads 0.5 °C * i above the trace
+        crossings = hardware.trace.crossings(threshold - hardware.w1.probe_offset(hardware.w1.probe_ids[i]),
+                                             0.0, end - window)
+        edges = [t - hardware.clock.start for t in hardware.gpio.rising_edges(hardware.fan_pin(i))]
+        for c in crossings:
+            # the 1/16 °C resolution of the DS18B20 can put the start slightly before the exact crossing
+            after = [e - c for e in edges if c - 1.0 <= e <= c + window]
+            if after:
+                reactions.append(max(0.0, after[0]))
+            else:
+                missed += 1
+    return reactions, missed
+
+
+def bench_live(speed=30.0, seconds=20.0, clients=16, stream_clients=4, reactors=1, crc_failures=0.02,
+               seed=0, verbose=True):
+    """Run the app on simulated hardware under load; returns a result dict"""
+    from simulator import generate_trace
+
+    # a heat event every 5 simulated minutes so that the fan has something to react to
+    trace = generate_trace(days=1, step=1.0, seed=seed, heat_every=300, heat_duration=120, heat_delta=6.0)
+    trace_path = os.path.join(tempfile.mkdtemp(prefix="bench-monitor-"), "trace.csv")
+    trace.to_csv(trace_path)
+    os.environ.update({
+        "ACQUISITION": "simulated", "SIM_TRACE": trace_path, "SIM_SPEED": str(speed),
+        "SIM_REACTORS": str(reactors), "SIM_SEED": str(seed), "SIM_CRC_FAILURES": str(crc_failures),
+        "SIM_HISTORY_DB": "",
+    })
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+    import app as webapp
+    from bioreactor_backend import DS18B20_RETRIES, LOOP_LATENESS_SECONDS
+
+    registry = webapp.registry
+    hardware = registry.hardware
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-http", daemon=True).start()
+    rss_start = rss_mb()
+
+    time.sleep(max(0.5, 10.0 / speed))  # a few samples before the clients arrive
+    deadline = time.monotonic() + seconds
+    pollers = [Client(server.server_port, deadline, seed + i) for i in range(clients)]
+    streams = [StreamClient(server.server_port, deadline) for _ in range(stream_clients)]
+    started = time.perf_counter()
+    for t in pollers + streams:
+        t.start()
+    for t in pollers + streams:
+        t.join()
+    elapsed = time.perf_counter() - started
+    sim_end = hardware.clock.elapsed()
+
+    latencies = {}
+    for kind, _ in Client.MIX:
+        values = [v for c in pollers for v in c.latencies[kind]]
+        latencies[kind] = dict(_ms(percentiles(values)), count=len(values))
+    requests = sum(v["count"] for v in latencies.values())
+
+    # monitor jitter: spacing of consecutive samples (simulated ms) against the interval, in real ms
+    monitor = registry.default
+    ts = list(monitor.history.columns()["ts"])
+    interval_ms = 1000.0
+    gaps = [abs(b - a - interval_ms) / speed for a, b in zip(ts, ts[1:])]
+    reactions, missed = fan_reactions(hardware, monitor.get_fan_threshold(), sim_end)
+    result = {
+        "speed": speed,
+        "seconds": round(elapsed, 2),
+        "clients": clients,
+        "stream_clients": stream_clients,
+        "reactors": reactors,
+        "requests": requests,
+        "requests_per_sec": round(requests / elapsed, 1),
+        "not_modified": sum(c.not_modified for c in pollers),
+        "errors": sum(c.errors for c in pollers) + sum(s.errors for s in streams),
+        "latency_ms": latencies,
+        "stream_events_per_client": round(sum(s.events for s in streams) / max(1, len(streams)), 1),
+        "samples": len(ts),
+        "monitor_jitter_ms": {k: round(v, 3) for k, v in percentiles(gaps).items()},
+        "loop_timing": {name: m.timing() for name, m in registry.reactors.items()},
+        "loop_lateness": LOOP_LATENESS_SECONDS.summary(),
+        "fan_reaction_sim_s": {k: round(v, 3) for k, v in percentiles(reactions).items()},
+        "fan_reaction_ms": {k: round(v / speed * 1000, 2) for k, v in percentiles(reactions).items()},
+        "fan_starts": len(reactions),
+        "fan_missed": missed,
+        "w1_reads": hardware.w1.reads,
+        "w1_crc_failures": hardware.w1.crc_failures,
+        "ds18b20_retries": sum(DS18B20_RETRIES.summary().values()),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_end_mb": round(rss_mb(), 1),
+    }
+    server.shutdown()
+    registry.stop_monitoring()
+    os.unlink(trace_path)
+    if verbose:
+        print(f"live    {speed:g}x, {clients} clients + {stream_clients} streams, {elapsed:.1f}s: "
+              f"{result['requests_per_sec']} req/s, {result['errors']} errors, "
+              f"{result['not_modified']} not modified")
+        for kind, v in latencies.items():
+            if v["count"]:
+                print(f"        {kind:<15} p50 {v['p50']:>7} ms  p90 {v['p90']:>7} ms  "
+                      f"p99 {v['p99']:>7} ms  max {v['max']:>8} ms  ({v['count']})")
+        jitter = result["monitor_jitter_ms"]
+        if jitter:
+            print(f"        monitor jitter  p50 {jitter['p50']} ms  p99 {jitter['p99']} ms  max {jitter['max']} ms "
+                  f"over {len(ts)} samples")
+        for name, timing in result["loop_timing"].items():
+            print(f"        loops {name}: " + ", ".join(
+                f"{loop} {t['ticks']} ticks / {t['overruns']} overruns / max late {t['max_lateness'] * 1000:.1f} ms"
+                for loop, t in timing.items()))
+        fan = result["fan_reaction_ms"]
+        if fan:
+            print(f"        fan reaction    p50 {fan['p50']} ms  max {fan['max']} ms real "
+                  f"(p50 {result['fan_reaction_sim_s']['p50']} s simulated), "
+                  f"{result['fan_starts']} starts, {missed} missed")
+        print(f"        w1 {result['w1_reads']} reads, {result['w1_crc_failures']} CRC failures; "
+              f"RSS {result['rss_start_mb']} -> {result['rss_end_mb']} MB")
+    return result
+
+
+def bench_soak(days=1.5, crc_failures=0.02, seed=0, verbose=True):
+    """Step one reactor through `days` simulated days at 1 Hz; returns a result dict"""
+    from simulator import SimulatedHardware, generate_trace
+
+    tmp = tempfile.mkdtemp(prefix="bench-soak-")
+    db_path = os.path.join(tmp, "history.sqlite")
+    hardware = SimulatedHardware(generate_trace(days=1, step=10.0, seed=seed), speed=0, conversion_delay=0,
+                                 crc_failure_rate=crc_failures, seed=seed, history_db=db_path)
+    monitor = hardware.monitor()
+    capacity_days = monitor.history.capacity / DAY
+    steps = int(days * DAY)
+
+    gc.collect()
+    tracemalloc.start()
+    points = []  # (simulated day, RSS MB, traced Python MB)
+    started = time.perf_counter()
+    for step in range(1, steps + 1):
+        hardware.clock.advance(1.0)
+        monitor.read_sensors()
+        if step % 3600 == 0 or step == steps:
+            points.append((step / DAY, rss_mb(), tracemalloc.get_traced_memory()[0] / 1e6))
+            if verbose and step % (6 * 3600) == 0:
+                print(f"soak    day {step / DAY:5.2f}: RSS {points[-1][1]:.1f} MB, traced {points[-1][2]:.1f} MB, "
+                      f"{step / (time.perf_counter() - started):.0f} samples/s", flush=True)
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    monitor.store.close()
+
+    def growth(column):
+        # least-squares slope (MB / simulated day) once the in-memory history is full
+        pts = [(p[0], p[column]) for p in points if p[0] >= capacity_days]
+        if len(pts) < 2:
+            return None
+        mx = sum(x for x, _ in pts) / len(pts)
+        my = sum(y for _, y in pts) / len(pts)
+        var = sum((x - mx) ** 2 for x, _ in pts)
+        return round(sum((x - mx) * (y - my) for x, y in pts) / var, 3) if var else None
+
+    result = {
+        "soak_days": days,
+        "samples": steps,
+        "seconds": round(elapsed, 2),
+        "samples_per_sec": round(steps / elapsed, 1),
+        "history_full_after_days": round(capacity_days, 2),
+        "rss_mb": [round(p[1], 1) for p in points if p[0] == int(p[0])] or [round(points[-1][1], 1)],
+        "rss_growth_mb_per_day": growth(1),
+        "traced_growth_mb_per_day": growth(2),
+        "db_mb": round(os.path.getsize(db_path) / 1e6, 2),
+        "w1_crc_failures": hardware.w1.crc_failures,
+    }
+    hardware.close()
+    for name in os.listdir(tmp):
+        os.unlink(os.path.join(tmp, name))
+    os.rmdir(tmp)
+    if verbose:
+        print(f"soak    {days:g} days in {elapsed:.1f}s ({result['samples_per_sec']} samples/s): "
+              f"RSS growth {result['rss_growth_mb_per_day']} MB/day, "
+              f"Python heap growth {result['traced_growth_mb_per_day']} MB/day after day {capacity_days:g}, "
+              f"history db {result['db_mb']} MB")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--speed", type=float, default=30.0, help="simulated seconds per real second")
+    parser.add_argument("--seconds", type=float, default=20.0, help="length of the live phase (real s)")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--stream-clients", type=int, default=4)
+    parser.add_argument("--reactors", type=int, default=1)
+    parser.add_argument("--crc-failures", type=float, default=0.02, help="fraction of DS18B20 reads failing CRC")
+    parser.add_argument("--soak-days", type=float, default=1.5, help="simulated days of the soak phase (0: skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--out", help="append results to this JSONL file")
+    args = parser.parse_args(argv)
+
+    # console only, and quiet: the benchmark measures the code, not the log files
+    for name, value in (("LOG_FILE", ""), ("TELEMETRY_FILE", ""), ("LOG_LEVEL", "WARNING")):
+        os.environ.setdefault(name, value)
+    result = {
+        "label": args.label,
+        "commit": _git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    if args.soak_days > 0:
+        # first, while the process is still small and no server threads are running
+        result["soak"] = bench_soak(args.soak_days, args.crc_failures, args.seed)
+    if args.seconds > 0:
+        result["live"] = bench_live(args.speed, args.seconds, args.clients, args.stream_clients,
+                                    args.reactors, args.crc_failures, args.seed)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,16 +4,30 @@ Bioreactor Monitoring System Backend
 Handles temperature and pH sensor readings, fan control, and data logging
 """
 
+import csv
 import glob
+import io
+import itertools
 import time
 import json
+import atexit
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import logging.handlers
+import math
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
 import threading
+import queue
 import random
-from collections import deque
 import os
+import zlib
+from alerts import AlertEngine
+from history_store import HistoryStore
+from mcp3008 import MCP3008, FakeSpiDev
+from metrics import REGISTRY as metrics, PROFILER as profiler
 try:
     import spidev
     SPI_AVAILABLE = True
@@ -35,17 +49,123 @@ try:
 except Exception:
     GPIOZERO_AVAILABLE = False
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bioreactor.log'),
-        logging.StreamHandler()
-    ]
-)
+# Setup logging: callers only put records on a queue; a listener thread does the
+# file (rotated, LOG_MAX_BYTES x LOG_BACKUPS; LOG_FILE='' for console only) and console I/O
+def setup_logging() -> logging.handlers.QueueListener:
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [logging.StreamHandler()]
+    log_file = os.environ.get('LOG_FILE', 'bioreactor.log')
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.environ.get('LOG_MAX_BYTES', str(5 * 1024 * 1024))),
+            backupCount=int(os.environ.get('LOG_BACKUPS', '3'))))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
+# Hot-path metrics, served on /metrics (see metrics.py)
+SENSOR_READ_SECONDS = metrics.histogram('bioreactor_sensor_read_seconds', 'Duration of one sensor read')
+SENSOR_NONE_READS = metrics.counter('bioreactor_sensor_none_reads_total', 'Sensor reads that returned no value')
+DS18B20_RETRIES = metrics.counter('bioreactor_ds18b20_retries_total', 'DS18B20 reads retried after a failed attempt')
+FAN_CONTROL_SECONDS = metrics.histogram('bioreactor_fan_control_seconds', 'Duration of one fan control decision')
+MONITOR_CYCLE_SECONDS = metrics.histogram('bioreactor_monitor_cycle_seconds', 'Work done per monitor loop cycle')
+LOOP_LATENESS_SECONDS = metrics.histogram(
+    'bioreactor_loop_lateness_seconds', 'How late a periodic loop started its tick, against the absolute deadline',
+    buckets=(0.0, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+LOOP_OVERRUNS = metrics.counter('bioreactor_loop_overruns_total', 'Ticks whose work ran past the next deadline')
+LOOP_MISSED_DEADLINES = metrics.counter('bioreactor_loop_missed_deadlines_total', 'Deadlines skipped after an overrun')
+FAN_FAILSAFE_STARTS = metrics.counter('bioreactor_fan_failsafe_total', 'Fan started because temperature readings stopped')
+
+
+class TelemetryWriter:
+    """Per-sample telemetry as compact NDJSON, written in batches by a background thread.
+
+    record() never blocks: records go on a bounded queue (dropped and counted when
+    it is full) and the writer appends them every `flush_every` records or
+    `flush_interval` seconds, rotating the file at `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 3,
+                 flush_every: int = 60, flush_interval: float = 10.0, queue_size: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, data: Dict):
+        try:
+            self._queue.put_nowait(json.dumps(data, separators=(',', ':')))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                line = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                line = ''
+            if line is None:  # close()
+                self._write(batch)
+                return
+            if line:
+                batch.append(line)
+            if len(batch) >= self.flush_every or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch: List[str]):
+        if not batch:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a') as f:
+                f.write('\n'.join(batch) + '\n')
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Telemetry write failed ({len(batch)} records dropped): {e}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+
+# TELEMETRY_FILE='' turns per-sample telemetry off
+_telemetry_path = os.environ.get('TELEMETRY_FILE', 'bioreactor_telemetry.ndjson')
+telemetry = TelemetryWriter(_telemetry_path) if _telemetry_path else None
+
 
 class MockGPIO:
     """Mock GPIO for development on non-Raspberry Pi systems"""
@@ -60,47 +180,69 @@ class MockGPIO:
     def setup(pin, mode): pass
     @staticmethod
     def output(pin, state): 
-        logger.info(f"Mock GPIO: Pin {pin} set to {'HIGH' if state else 'LOW'}")
+        logger.debug(f"Mock GPIO: Pin {pin} set to {'HIGH' if state else 'LOW'}")
     @staticmethod
     def cleanup(): pass
 
 
 class TemperatureSensor:
     """Handles DS18B20 temperature sensor readings"""
+
+    W1_DEVICES = '/sys/bus/w1/devices'
+    retry_delay = 0.05  # seconds between attempts after a failed read
     
-    def __init__(self):
+    def __init__(self, device_id: Optional[str] = None, base_dir: Optional[str] = None, opener=None):
+        # device_id: a specific probe (e.g. "28-0123456789ab"); default is the first one found.
+        # base_dir / opener: another w1 sysfs tree and how to read it (simulator.FakeW1Sysfs)
+        self.device_id = device_id
         self.device_path = None
+        self.base_dir = base_dir or self.W1_DEVICES
+        self._open = opener or open
         self._find_device()
     
     def _find_device(self):
         """Find the DS18B20 device path"""
         try:
-            devices = glob.glob('/sys/bus/w1/devices/28-*/w1_slave')
+            devices = sorted(glob.glob(os.path.join(self.base_dir, self.device_id or '28-*', 'w1_slave')))
             if devices:
                 self.device_path = devices[0]
+                self.device_id = os.path.basename(os.path.dirname(self.device_path))
                 logger.info(f"Temperature sensor found at: {self.device_path}")
             else:
-                logger.warning("No DS18B20 temperature sensor found")
+                logger.warning(f"No DS18B20 temperature sensor found{f' with id {self.device_id}' if self.device_id else ''}")
         except Exception as e:
             logger.error(f"Error finding temperature sensor: {e}")
     
     def read_celsius(self) -> Optional[float]:
         """Read temperature in Celsius with simple parsing like fan.py (t=... in w1_slave)."""
+        device = self.device_id or 'simulated'
+        with SENSOR_READ_SECONDS.time(sensor='temperature', device=device):
+            value = self._read_celsius()
+        if value is None:
+            SENSOR_NONE_READS.inc(sensor='temperature', device=device)
+        return value
+
+    def _read_celsius(self) -> Optional[float]:
         # Development fallback
         if not self.device_path:
             return 25.0 + random.uniform(-2, 5)
 
         # Try a few times to handle transient CRC states
-        for _ in range(3):
+        for attempt in range(3):
+            if attempt:
+                DS18B20_RETRIES.inc(device=self.device_id)
             try:
-                with open(self.device_path, 'r') as f:
+                with self._open(self.device_path, 'r') as f:
                     data = f.read()
-                if 't=' in data:
+                # first line ends in YES when the scratchpad CRC matched; otherwise t= is garbage
+                if data.split('\n', 1)[0].strip().endswith('NO'):
+                    logger.debug(f"DS18B20 {self.device_id} CRC mismatch")
+                elif 't=' in data:
                     t_mdeg = int(data.split('t=')[1].strip().split()[0])
                     return t_mdeg / 1000.0
             except Exception as e:
                 logger.debug(f"Temp read attempt failed: {e}")
-            time.sleep(0.05)
+            time.sleep(self.retry_delay)
         logger.error("Failed to parse DS18B20 temperature (no 't=' found)")
         return None
     
@@ -115,7 +257,10 @@ class TemperatureSensor:
 class PHSensor:
     """Handles pH sensor readings (simulated for now)"""
     
-    def __init__(self):
+    def __init__(self, adc_channel: Optional[int] = None, adc: Optional[MCP3008] = None,
+                 analog_channels: Optional[Dict[str, int]] = None, calibration: Optional[Dict] = None):
+        # Arguments (used by the reactor registry) take precedence over the environment;
+        # `adc` shares an already opened MCP3008 between several reactors
         self.calibration_offset = 0.0
         # Override support (e.g., on Pi without pH hardware)
         # Set PH_OVERRIDE (e.g., "7.2") to force a constant pH
@@ -129,24 +274,51 @@ class PHSensor:
         
         # ADC (MCP3008) setup if available and SPI enabled on the Pi
         self.use_adc = False
-        self.adc_channel = int(os.environ.get('PH_ADC_CHANNEL', '0'))
+        self.adc_channel = adc_channel if adc_channel is not None else int(os.environ.get('PH_ADC_CHANNEL', '0'))
         self.vref = float(os.environ.get('PH_VREF', '3.3'))  # MCP3008 VREF (wired to 3.3V per your wiring)
         # Optional two-point calibration via environment (volts)
         # Example: PH_CAL_LOW_PH=7.00 PH_CAL_LOW_V=1.70 PH_CAL_HIGH_PH=4.00 PH_CAL_HIGH_V=2.10
-        self.cal_low_ph = os.environ.get('PH_CAL_LOW_PH')
-        self.cal_low_v = os.environ.get('PH_CAL_LOW_V')
-        self.cal_high_ph = os.environ.get('PH_CAL_HIGH_PH')
-        self.cal_high_v = os.environ.get('PH_CAL_HIGH_V')
+        # or per reactor: calibration={"low_ph": 7.0, "low_v": 1.70, "high_ph": 4.0, "high_v": 2.10}
+        cal = calibration or {}
+        self.cal_low_ph = cal.get('low_ph', os.environ.get('PH_CAL_LOW_PH'))
+        self.cal_low_v = cal.get('low_v', os.environ.get('PH_CAL_LOW_V'))
+        self.cal_high_ph = cal.get('high_ph', os.environ.get('PH_CAL_HIGH_PH'))
+        self.cal_high_v = cal.get('high_v', os.environ.get('PH_CAL_HIGH_V'))
         self._calc_linear_params()
 
-        if SPI_AVAILABLE:
+        # Extra analog probes on the same MCP3008, e.g. ADC_CHANNELS="do:1,turbidity:2,ph2:3"
+        self.analog_channels = dict(analog_channels) if analog_channels is not None else {}
+        for item in (os.environ.get('ADC_CHANNELS', '') if analog_channels is None else '').split(','):
+            if ':' in item:
+                name, ch = item.split(':', 1)
+                try:
+                    self.analog_channels[name.strip()] = int(ch)
+                except ValueError:
+                    logger.warning(f"Ignoring invalid ADC_CHANNELS entry: {item}")
+
+        self.adc = adc
+        fake_path = os.environ.get('SPI_FAKE')  # replay recorded counts instead of real SPI
+        if adc is not None:
+            self.use_adc = True
+        elif SPI_AVAILABLE or fake_path:
             try:
-                self.spi = spidev.SpiDev()
-                bus = int(os.environ.get('SPI_BUS', '0'))
-                dev = int(os.environ.get('SPI_DEVICE', '0'))  # CE0
-                self.spi.open(bus, dev)
-                self.spi.max_speed_hz = int(os.environ.get('SPI_MAX_SPEED', '1350000'))
-                self.spi.mode = 0
+                if fake_path:
+                    self.spi = FakeSpiDev.from_file(fake_path)
+                    bus, dev = 'fake', fake_path
+                else:
+                    self.spi = spidev.SpiDev()
+                    bus = int(os.environ.get('SPI_BUS', '0'))
+                    dev = int(os.environ.get('SPI_DEVICE', '0'))  # CE0
+                    self.spi.open(bus, dev)
+                    self.spi.max_speed_hz = int(os.environ.get('SPI_MAX_SPEED', '1350000'))
+                    self.spi.mode = 0
+                # Oversampling: ADC_SAMPLES conversions per reading, reduced by ADC_FILTER
+                # (median / mean / trimmed, ADC_TRIM fraction cut at each end), then ADC_EMA smoothing
+                self.adc = MCP3008(self.spi, vref=self.vref,
+                                   samples=int(os.environ.get('ADC_SAMPLES', '16')),
+                                   filter=os.environ.get('ADC_FILTER', 'median'),
+                                   trim=float(os.environ.get('ADC_TRIM', '0.2')),
+                                   ema_alpha=float(os.environ.get('ADC_EMA', '0.0')))
                 self.use_adc = True
                 logger.info(f"pH ADC (MCP3008) initialized on SPI bus {bus}, device {dev}, channel {self.adc_channel}")
             except Exception as e:
@@ -154,6 +326,13 @@ class PHSensor:
     
     def read_ph(self) -> Optional[float]:
         """Read pH value"""
+        with SENSOR_READ_SECONDS.time(sensor='ph', device=f'ch{self.adc_channel}'):
+            value = self._read_ph()
+        if value is None:
+            SENSOR_NONE_READS.inc(sensor='ph', device=f'ch{self.adc_channel}')
+        return value
+
+    def _read_ph(self) -> Optional[float]:
         try:
             if self.override_enabled:
                 return max(0, min(14, self.override_value + self.calibration_offset))
@@ -190,18 +369,28 @@ class PHSensor:
 
     # ===== MCP3008 helpers and calibration =====
     def _read_adc_voltage(self, channel: int) -> Optional[float]:
-        try:
-            if not (0 <= channel <= 7):
-                return None
-            # MCP3008 single-ended read command: start bit, single/diff bit, channel bits
-            # Send 3 bytes: 1 (start), (8+ch)<<4, 0; receive 3 bytes
-            resp = self.spi.xfer2([1, (8 + channel) << 4, 0])
-            value = ((resp[1] & 3) << 8) | resp[2]  # 10-bit result 0..1023
-            voltage = (value / 1023.0) * self.vref
-            return voltage
-        except Exception as e:
-            logger.error(f"ADC read error: {e}")
+        if not (0 <= channel <= 7):
             return None
+        return self.adc.read_voltage(channel)
+
+    def read_analog(self) -> Dict[str, Optional[float]]:
+        """Voltages of the extra ADC_CHANNELS probes, one filtered reading each"""
+        if self.adc is None or not self.analog_channels:
+            return {}
+        volts = self.adc.scan(self.analog_channels.values())
+        return {name: (round(volts[ch], 4) if volts[ch] is not None else None)
+                for name, ch in self.analog_channels.items()}
+
+    def adc_stats(self) -> Dict:
+        """Per-channel rate and noise statistics of the ADC (empty without one)"""
+        if self.adc is None:
+            return {}
+        return {
+            'samples': self.adc.samples,
+            'filter': self.adc.filter,
+            'ema_alpha': self.adc.ema_alpha,
+            'channels': self.adc.stats(),
+        }
 
     def _calc_linear_params(self):
         self._lin_a = None
@@ -231,21 +420,35 @@ class PHSensor:
 class FanController:
     """Controls cooling fan based on temperature"""
     
-    def __init__(self, fan_pin: int = None, temp_threshold: float = None):
-        # Allow environment overrides to match wiring easily
+    def __init__(self, fan_pin: int = None, temp_threshold: float = None, gpio=None):
+        # Allow environment overrides to match wiring easily (explicit arguments, e.g. from
+        # the reactor registry, win so that several fans do not end up on one pin)
         env_pin = os.environ.get('FAN_PIN')
         env_thr = os.environ.get('FAN_THRESHOLD')
-        self.fan_pin = int(env_pin) if env_pin is not None else (fan_pin if fan_pin is not None else 12)
+        self.fan_pin = fan_pin if fan_pin is not None else (int(env_pin) if env_pin is not None else 12)
         try:
-            self.temp_threshold = float(env_thr) if env_thr is not None else (temp_threshold if temp_threshold is not None else 28.0)
+            self.temp_threshold = temp_threshold if temp_threshold is not None else (float(env_thr) if env_thr is not None else 28.0)
         except Exception:
             self.temp_threshold = 28.0
         self.fan_running = False
+        # Fail-safe: run the fan when there has been no temperature for this long (seconds, 0 = off)
+        self.failsafe_after = float(os.environ.get('FAN_FAILSAFE', '30'))
+        self._last_reading = time.monotonic()
+        self._lock = threading.Lock()
         
-        # Backend selection: prefer gpiozero on Pi 5, fallback to RPi.GPIO or Mock
-        self._backend = 'gpiozero' if GPIOZERO_AVAILABLE else ('rpigpio' if GPIO_AVAILABLE else 'mock')
+        # Backend selection: prefer gpiozero on Pi 5, fallback to RPi.GPIO or Mock;
+        # `gpio` is any module with the RPi.GPIO interface (e.g. simulator.GPIORecorder)
+        if gpio is not None:
+            self._backend = 'custom'
+        else:
+            self._backend = 'gpiozero' if GPIOZERO_AVAILABLE else ('rpigpio' if GPIO_AVAILABLE else 'mock')
 
-        if self._backend == 'gpiozero':
+        if self._backend == 'custom':
+            self.gpio = gpio
+            self.gpio.setmode(self.gpio.BCM)
+            self.gpio.setup(self.fan_pin, self.gpio.OUT)
+            self.gpio.output(self.fan_pin, self.gpio.LOW)
+        elif self._backend == 'gpiozero':
             # Active high device; start OFF
             self.gz_fan = GZOutputDevice(self.fan_pin, active_high=True, initial_value=False)
         elif self._backend == 'rpigpio':
@@ -261,12 +464,32 @@ class FanController:
 
         logger.info(f"Fan controller initialized (backend={self._backend}) on pin {self.fan_pin}, threshold: {self.temp_threshold}°C")
     
-    def control_fan(self, temperature: float):
-        """Control fan based on temperature"""
-        if temperature > self.temp_threshold and not self.fan_running:
+    def control_fan(self, temperature: Optional[float]):
+        """Control fan based on temperature (None: failed read, see check_failsafe)"""
+        with FAN_CONTROL_SECONDS.time(pin=self.fan_pin), self._lock:
+            if temperature is None:
+                self._failsafe()
+                return
+            self._last_reading = time.monotonic()
+            if temperature > self.temp_threshold and not self.fan_running:
+                self.start_fan()
+            elif temperature <= self.temp_threshold - 1.0 and self.fan_running:  # Hysteresis
+                self.stop_fan()
+
+    def check_failsafe(self):
+        """Start the fan if no temperature has arrived for `failsafe_after` seconds.
+
+        Called on failed reads and, as a backstop for a stuck sensor thread, by the monitor loop.
+        """
+        with self._lock:
+            self._failsafe()
+
+    def _failsafe(self):
+        if self.failsafe_after > 0 and not self.fan_running \
+                and time.monotonic() - self._last_reading > self.failsafe_after:
+            logger.warning(f"No temperature for {self.failsafe_after:g}s, starting fan on pin {self.fan_pin} as a precaution")
+            FAN_FAILSAFE_STARTS.inc(pin=self.fan_pin)
             self.start_fan()
-        elif temperature <= self.temp_threshold - 1.0 and self.fan_running:  # Hysteresis
-            self.stop_fan()
     
     def start_fan(self):
         """Start the cooling fan"""
@@ -297,29 +520,675 @@ class FanController:
             pass
 
 
-class BioreactorMonitor:
+class HistoryBuffer:
+    """Fixed-capacity ring buffer of samples, stored column-wise in typed arrays.
+
+    Columns: ts (epoch ms), temperature_c, ph (NaN when missing) and fan_running.
+    About 25 bytes per sample instead of a dict; once full, the oldest sample is
+    overwritten. Timestamps must be appended in increasing order, so time-range
+    lookups are a binary search.
+    """
+
+    TYPECODES = {'ts': 'q', 'temperature_c': 'd', 'ph': 'd', 'fan_running': 'b'}
+
+    def __init__(self, capacity: int = 24 * 60 * 60):
+        self.capacity = max(1, int(capacity))
+        self.ts = array('q', bytes(8 * self.capacity))
+        self.temperature_c = array('d', bytes(8 * self.capacity))
+        self.ph = array('d', bytes(8 * self.capacity))
+        self.fan_running = array('b', bytes(self.capacity))
+        self._start = 0  # physical index of the oldest sample
+        self._len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, ts: int, temperature_c: Optional[float], ph: Optional[float], fan_running: bool):
+        with self._lock:
+            if self._len < self.capacity:
+                i = (self._start + self._len) % self.capacity
+                self._len += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self.capacity
+            self.ts[i] = ts
+            self.temperature_c[i] = math.nan if temperature_c is None else temperature_c
+            self.ph[i] = math.nan if ph is None else ph
+            self.fan_running[i] = 1 if fan_running else 0
+
+    def _ts_at(self, k: int) -> int:
+        return self.ts[(self._start + k) % self.capacity]
+
+    def _bisect(self, ts: int) -> int:
+        # logical index of the first sample with timestamp >= ts
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts_at(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _physical_slices(self, i: int, j: int) -> List[Tuple[int, int]]:
+        # logical [i, j) as at most two contiguous physical ranges
+        if i >= j:
+            return []
+        a = (self._start + i) % self.capacity
+        b = a + (j - i)
+        if b <= self.capacity:
+            return [(a, b)]
+        return [(a, self.capacity), (0, b - self.capacity)]
+
+    def columns(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict[str, array]:
+        """Samples with start_ms <= ts < end_ms as a dict of array slices (no per-sample objects)."""
+        with self._lock:
+            i = 0 if start_ms is None else self._bisect(start_ms)
+            j = self._len if end_ms is None else self._bisect(end_ms)
+            parts = self._physical_slices(i, j)
+            out = {}
+            for name, typecode in self.TYPECODES.items():
+                col = getattr(self, name)
+                out[name] = array(typecode)
+                for a, b in parts:
+                    out[name].extend(col[a:b])
+            return out
+
+    def rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Dict]:
+        """Same range as `columns`, in the /api/history row format."""
+        cols = self.columns(start_ms, end_ms)
+        return [
+            {
+                'ts': ts,
+                'timestamp': datetime.fromtimestamp(ts / 1000).isoformat(),
+                'temperature_c': None if math.isnan(t) else t,
+                'ph': None if math.isnan(p) else p,
+                'fan_running': bool(f),
+            }
+            for ts, t, p, f in zip(cols['ts'], cols['temperature_c'], cols['ph'], cols['fan_running'])
+        ]
+
+
+class DeadlineTicker:
+    """Fixed-rate ticks against absolute deadlines on the monotonic clock.
+
+    Tick n is due at start + n * interval, whatever the work in between took,
+    so the period does not drift. When the work runs past the next deadline
+    (an overrun) the loop runs again at once, and any further deadlines that
+    have already passed are skipped and counted as missed instead of being
+    run back to back. `stop` interrupts the wait.
+    """
+
+    def __init__(self, name: str, interval: float, stop: Optional[threading.Event] = None):
+        self.name = name
+        self.interval = interval
+        self.stop = stop or threading.Event()
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+
+    def wait(self) -> bool:
+        """Block until the next deadline; False once stopped"""
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.deadline += self.interval
+            if now > self.deadline:
+                self.overruns += 1
+                LOOP_OVERRUNS.inc(loop=self.name)
+                skipped = int((now - self.deadline) // self.interval)
+                if skipped:
+                    self.missed += skipped
+                    self.deadline += skipped * self.interval
+                    LOOP_MISSED_DEADLINES.inc(skipped, loop=self.name)
+            elif self.stop.wait(self.deadline - now):
+                return False
+        if self.stop.is_set():
+            return False
+        lateness = time.monotonic() - self.deadline
+        self.ticks += 1
+        self.max_lateness = max(self.max_lateness, lateness)
+        LOOP_LATENESS_SECONDS.observe(lateness, loop=self.name)
+        return True
+
+    def stats(self) -> Dict:
+        return {'interval': self.interval, 'ticks': self.ticks, 'overruns': self.overruns,
+                'missed': self.missed, 'max_lateness': round(self.max_lateness, 4)}
+
+
+class SensorTask:
+    """One sensor read on its own cadence in its own thread; keeps the latest reading"""
+
+    def __init__(self, name: str, read, interval: float, on_reading=None, clock=None):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.on_reading = on_reading
+        self.clock = clock or time.time
+        self.external = False
+        # (value, acquisition time in epoch ms of `clock`, time.monotonic() of it); replaced in one assignment
+        self.latest: Tuple[Optional[float], Optional[int], Optional[float]] = (None, None, None)
+        self.thread = None
+        self.ticker = None
+
+    def run_once(self):
+        try:
+            value = profiler.run(self.read)
+        except Exception as e:
+            logger.error(f"{self.name} read failed: {e}")
+            value = None
+        self.feed(value)
+
+    def feed(self, value):
+        """Store a reading (taken here or elsewhere, e.g. a shared bus) and run the handler"""
+        self.latest = (value, int(self.clock() * 1000), time.monotonic())
+        if self.on_reading is not None:
+            try:
+                self.on_reading(value)
+            except Exception as e:
+                logger.error(f"{self.name} handler failed: {e}")
+
+    def loop(self, stop: threading.Event, label: Optional[str] = None):
+        """Read on every tick until `stop` is set"""
+        self.ticker = DeadlineTicker(label or self.name, self.interval, stop)
+        while self.ticker.wait():
+            self.run_once()
+
+
+class AcquisitionScheduler:
+    """Reads each sensor once per cycle of its own cadence, slow sensors in parallel.
+
+    A slow DS18B20 conversion (~750 ms) no longer delays the pH reads or the
+    monitor loop, which just takes the latest reading of every sensor.
+    """
+
+    def __init__(self, name: str = '', clock=None):
+        self.name = name
+        self.clock = clock or time.time   # timestamps of the readings (the monitor's clock)
+        self.tasks: Dict[str, SensorTask] = {}
+        self.running = False
+        self._stop = threading.Event()
+
+    def add(self, name: str, read, interval: float, on_reading=None, external: bool = False):
+        # external tasks get no thread; their readings arrive through SensorTask.feed()
+        task = SensorTask(name, read, interval, on_reading, self.clock)
+        task.external = external
+        self.tasks[name] = task
+
+    def start(self):
+        self.running = True
+        self._stop.clear()
+        for task in self.tasks.values():
+            if task.external:
+                continue
+            label = f"{self.name}/{task.name}" if self.name else task.name
+            task.thread = threading.Thread(target=task.loop, args=(self._stop, label),
+                                           name=f"acquire-{label}", daemon=True)
+            task.thread.start()
+        logger.info("Acquisition started: " + ", ".join(f"{t.name} every {t.interval}s" for t in self.tasks.values()))
+
+    def stop(self):
+        self.running = False
+        self._stop.set()
+        for task in self.tasks.values():
+            if task.thread is not None:
+                task.thread.join(timeout=5.0)
+
+    def poll(self):
+        """Read every sensor once now, in the calling thread (when the scheduler is not running)"""
+        for task in self.tasks.values():
+            if not task.external:
+                task.run_once()
+
+    def timing(self) -> Dict[str, Dict]:
+        """Deadline statistics of every running task"""
+        return {name: t.ticker.stats() for name, t in self.tasks.items() if t.ticker is not None}
+
+    def latest(self, name: str) -> Tuple[Optional[float], Optional[int]]:
+        """(value, acquisition epoch ms) of a sensor; value None if it is stale (older than 3 cadences + 1 s)"""
+        task = self.tasks[name]
+        value, ts, taken = task.latest
+        # the age is measured in real time like the cadence (a simulated clock may run faster)
+        if taken is not None and time.monotonic() - taken > 3 * task.interval + 1.0:
+            value = None
+        return value, ts
+
+
+def _freeze(value):
+    # read-only view of a sample: dicts become mappingproxies, lists tuples (all levels)
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class Snapshot(NamedTuple):
+    """One published sample, never modified after publication.
+
+    `data` is a read-only view, `encoded` its JSON bytes (encoded once, served
+    to every client). `derived` caches responses computed from this sample
+    (see BioreactorMonitor.derived) and is dropped with it.
+    """
+    ts: Optional[int]
+    data: Mapping
+    encoded: bytes
+    derived: Dict
+
+    MAX_DERIVED = 32
+
+    @classmethod
+    def build(cls, data: Dict) -> 'Snapshot':
+        encoded = json.dumps(data).encode()
+        return cls(data.get('ts'), _freeze(data), encoded, {})
+
+    @classmethod
+    def from_encoded(cls, encoded: bytes) -> 'Snapshot':
+        """Snapshot of JSON bytes published elsewhere (the bytes are kept as they are)"""
+        snapshot = cls.build(json.loads(encoded))
+        return snapshot._replace(encoded=encoded)
+
+
+class SampleBroadcaster:
+    """Fan-out of new samples to streaming clients (one bounded queue per subscriber).
+
+    Each sample is JSON-encoded once and the same bytes are queued for every
+    subscriber. A subscriber whose queue is full is too slow: it is dropped and
+    gets None, so its stream can end and the client reconnects.
+    """
+
+    def __init__(self, queue_size: int = 10, max_subscribers: int = 64):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def subscribe(self) -> Optional[queue.Queue]:
+        """New subscriber queue, or None if there are already max_subscribers"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            q = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(q)
+            return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, payload: bytes):
+        """Queue one pre-encoded JSON sample for every subscriber"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                self.unsubscribe(q)
+                self.dropped += 1
+                logger.warning("Dropping slow stream subscriber")
+                # make room for the end-of-stream marker
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+
+def _missing(value) -> bool:
+    return value is None or value != value  # None or NaN
+
+
+def aggregate_buckets(cols: Dict, bucket_ms: int) -> List[Dict]:
+    """Min/mean/max per fixed time bucket (aligned to the epoch) of history columns.
+
+    `cols` holds ts, temperature_c, ph, fan_running and optionally n and *_min/*_max
+    (rollup tiers); means are then weighted by n. Missing readings are skipped.
+    """
+    def column(name):
+        return cols[name] if name in cols else itertools.repeat(None)
+    return list(iter_buckets(zip(*(column(name) for name in RECORD_FIELDS)), bucket_ms))
+
+
+# Fields of a history record, as stored (HistoryStore.iter_records); n and the
+# *_min/*_max fields are None for raw samples
+RECORD_FIELDS = ('ts', 'temperature_c', 'ph', 'fan_running', 'n',
+                 'temperature_min', 'temperature_max', 'ph_min', 'ph_max')
+
+
+def iter_buckets(records: Iterable[Tuple], bucket_ms: int) -> Iterator[Dict]:
+    """aggregate_buckets over a stream of records (RECORD_FIELDS tuples, oldest first).
+
+    A row is yielded as soon as its bucket is complete, so memory does not grow
+    with the length of the stream.
+    """
+    bucket = None
+    acc = None
+
+    def row():
+        out = {'ts': bucket, 'timestamp': datetime.fromtimestamp(bucket / 1000).isoformat(), 'n': acc['n']}
+        for name in ('temperature', 'ph'):
+            s = acc[name]
+            out[f'{name}_c' if name == 'temperature' else name] = s[1] / s[0] if s[0] else None
+            out[f'{name}_min'] = s[2]
+            out[f'{name}_max'] = s[3]
+        out['fan_running'] = acc['fan'] / acc['n'] >= 0.5 if acc['n'] else False
+        return out
+
+    for ts, temperature_c, ph, fan_running, n, t_min, t_max, ph_min, ph_max in records:
+        b = ts - ts % bucket_ms
+        if b != bucket:
+            if acc is not None:
+                yield row()
+            bucket = b
+            acc = {'n': 0, 'fan': 0.0, 'temperature': [0, 0.0, None, None], 'ph': [0, 0.0, None, None]}
+        w = n if n is not None else 1
+        acc['n'] += w
+        acc['fan'] += float(fan_running) * w
+        for name, value, lo, hi in (('temperature', temperature_c, t_min, t_max), ('ph', ph, ph_min, ph_max)):
+            if _missing(value):
+                continue
+            lo = value if lo is None else lo
+            hi = value if hi is None else hi
+            s = acc[name]
+            s[0] += w
+            s[1] += value * w
+            s[2] = lo if s[2] is None else min(s[2], lo)
+            s[3] = hi if s[3] is None else max(s[3], hi)
+    if acc is not None:
+        yield row()
+
+
+EXPORT_FIELDS = ('ts', 'timestamp', 'temperature_c', 'ph', 'fan_running', 'n',
+                 'temperature_min', 'temperature_max', 'ph_min', 'ph_max')
+
+
+def export_rows(records: Iterable[Tuple], bucket_ms: Optional[int] = None) -> Iterator[Dict]:
+    """Export rows (EXPORT_FIELDS) of a record stream, resampled to `bucket_ms` if given"""
+    if bucket_ms:
+        yield from iter_buckets(records, bucket_ms)
+        return
+    for ts, temperature_c, ph, fan_running, n, t_min, t_max, ph_min, ph_max in records:
+        temperature_c = None if _missing(temperature_c) else temperature_c
+        ph = None if _missing(ph) else ph
+        raw = n is None
+        yield {
+            'ts': ts,
+            'timestamp': datetime.fromtimestamp(ts / 1000).isoformat(),
+            'temperature_c': temperature_c,
+            'ph': ph,
+            'fan_running': bool(fan_running) if raw else fan_running >= 0.5,
+            'n': 1 if raw else n,
+            'temperature_min': temperature_c if raw else t_min,
+            'temperature_max': temperature_c if raw else t_max,
+            'ph_min': ph if raw else ph_min,
+            'ph_max': ph if raw else ph_max,
+        }
+
+
+def export_chunks(rows: Iterable[Dict], fmt: str = 'csv', compress: bool = False,
+                  chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """CSV (with a header line) or NDJSON bytes of `rows`, in chunks of about `chunk_size`, optionally gzipped"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, EXPORT_FIELDS, lineterminator='\n') if fmt == 'csv' else None
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip container
+
+    def take() -> bytes:
+        data = buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+        return gz.compress(data) if gz is not None else data
+
+    if writer is not None:
+        writer.writeheader()
+    for row in rows:
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(row))
+            buf.write('\n')
+        if buf.tell() >= chunk_size:
+            chunk = take()
+            if chunk:
+                yield chunk
+    chunk = take()
+    if gz is not None:
+        chunk += gz.flush()
+    if chunk:
+        yield chunk
+
+
+def lttb_indices(xs, ys, threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the shape of (xs, ys)."""
+    n = len(xs)
+    if threshold >= n or n < 3:
+        return list(range(n))
+    threshold = max(threshold, 3)
+    out = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next bucket is the third triangle corner
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[nxt_start:nxt_end]) / (nxt_end - nxt_start)
+        avg_y = sum(ys[nxt_start:nxt_end]) / (nxt_end - nxt_start)
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+def lttb_rows(cols: Dict, points: int) -> List[Dict]:
+    """LTTB applied to temperature and pH separately; rows are the union of both selections."""
+    keep = set()
+    for column in ('temperature_c', 'ph'):
+        valid = [k for k, v in enumerate(cols[column]) if not _missing(v)]
+        xs = [cols['ts'][k] for k in valid]
+        ys = [cols[column][k] for k in valid]
+        keep.update(valid[i] for i in lttb_indices(xs, ys, points))
+    return [
+        {
+            'ts': cols['ts'][k],
+            'timestamp': datetime.fromtimestamp(cols['ts'][k] / 1000).isoformat(),
+            'temperature_c': None if _missing(cols['temperature_c'][k]) else cols['temperature_c'][k],
+            'ph': None if _missing(cols['ph'][k]) else cols['ph'][k],
+            'fan_running': float(cols['fan_running'][k]) >= 0.5,
+        }
+        for k in sorted(keep)
+    ]
+
+
+class ReactorView:
+    """Read side of a reactor: latest sample, history queries and per-sample caches.
+
+    Needs `snapshot` (Snapshot), `history` (HistoryBuffer) and `store`
+    (HistoryStore or None). Shared by BioreactorMonitor, which owns the
+    hardware, and shared_state.RemoteReactor, which reads what the acquisition
+    service publishes.
+    """
+
+    # wall clock of the samples (epoch seconds); the simulator replaces it to run faster than real time
+    clock = staticmethod(time.time)
+
+    @property
+    def current_data(self) -> Mapping:
+        return self.snapshot.data
+
+    def get_current_data(self) -> Mapping:
+        """Get current sensor data (read-only, no copy)"""
+        return self.snapshot.data
+
+    def get_current_json(self) -> Tuple[Optional[int], bytes]:
+        """Current sample as (ts in epoch ms or None before the first reading, JSON bytes)"""
+        snapshot = self.snapshot
+        return snapshot.ts, snapshot.encoded
+
+    def derived(self, key, build):
+        """`build()` computed at most once per sample for `key` (e.g. a response body for one query)"""
+        cache = self.snapshot.derived
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        value = build()
+        # A value built while a newer sample was published lands in the old snapshot's cache
+        # and is dropped with it; the next request builds it again for the new one
+        if len(cache) < Snapshot.MAX_DERIVED:
+            cache[key] = value
+        return value
+
+    def clamp_minutes(self, minutes) -> int:
+        """History window in minutes: 1..1440, or up to a year with the on-disk store"""
+        max_minutes = 366 * 24 * 60 if self.store is not None else 24 * 60
+        try:
+            return max(1, min(int(minutes), max_minutes))
+        except Exception:
+            return 30
+
+    def _history_columns(self, start_ms: int, end_ms: int) -> Dict:
+        # Raw samples from memory for the last 24h, rollups from the store beyond that
+        if end_ms - start_ms <= 24 * 60 * 60 * 1000 or self.store is None:
+            return self.history.columns(start_ms, end_ms)
+        rollups = self.store.rollups(start_ms, end_ms)
+        cols = {
+            'ts': [r['ts'] for r in rollups],
+            'n': [r['n'] for r in rollups],
+            'temperature_c': [r['temperature_mean'] for r in rollups],
+            'ph': [r['ph_mean'] for r in rollups],
+            'fan_running': [r['fan_on'] for r in rollups],
+        }
+        for name in ('temperature_min', 'temperature_max', 'ph_min', 'ph_max'):
+            cols[name] = [r[name] for r in rollups]
+        return cols
+
+    def iter_records(self, start_ms: int, end_ms: int) -> Iterator[Tuple]:
+        """History records (RECORD_FIELDS) in [start_ms, end_ms), oldest first, without loading the range.
+
+        Every tier of the on-disk store, then whatever the in-memory history holds
+        beyond it (samples not flushed yet, e.g. by the acquisition service).
+        """
+        last = start_ms - 1
+        if self.store is not None:
+            for record in self.store.iter_records(start_ms, end_ms):
+                last = record[0]
+                yield record
+        cols = self.history.columns(last + 1, end_ms)
+        for ts, temperature_c, ph, fan_running in zip(cols['ts'], cols['temperature_c'], cols['ph'],
+                                                      cols['fan_running']):
+            yield ts, temperature_c, ph, fan_running, None, None, None, None, None
+
+    def get_history(self, minutes: int = 30, bucket_s: Optional[float] = None,
+                    points: Optional[int] = None, method: str = 'minmax', since_ms: Optional[int] = None):
+        """Return history entries within the last `minutes` minutes as a list of dicts.
+
+        Without `bucket_s`/`points` these are the raw samples (up to 24h; longer
+        windows need the on-disk store and return its 1 min / 15 min rollups with
+        *_min/*_max fields). With `bucket_s` (seconds) or `points` (target count)
+        the window is reduced server-side: method 'minmax' gives mean/min/max per
+        time bucket, 'lttb' keeps about `points` shape-preserving samples.
+        `since_ms` (a cursor, e.g. the last ts a client has) limits the result to
+        newer samples.
+        """
+        minutes = self.clamp_minutes(minutes)
+        now_ms = int(self.clock() * 1000)
+        cutoff_ms = now_ms - minutes * 60 * 1000
+        if since_ms is not None:
+            cutoff_ms = max(cutoff_ms, since_ms + 1)
+        window_ms = now_ms - cutoff_ms
+        reduce = bucket_s or points or method == 'lttb'
+        if not reduce and (window_ms <= 24 * 60 * 60 * 1000 or self.store is None):
+            return self.history.rows(start_ms=cutoff_ms)
+        cols = self._history_columns(cutoff_ms, now_ms + 1)
+        if method == 'lttb':
+            if not points:
+                points = max(3, int(window_ms / (bucket_s * 1000))) if bucket_s else 500
+            return lttb_rows(cols, points)
+        if bucket_s:
+            return aggregate_buckets(cols, max(1, int(bucket_s * 1000)))
+        if points:
+            return aggregate_buckets(cols, max(1, -(-window_ms // int(points))))
+        # rollup rows as stored (1 min up to 30 days, 15 min beyond)
+        return aggregate_buckets(cols, 60 * 1000 if window_ms <= 30 * 24 * 60 * 60 * 1000 else 15 * 60 * 1000)
+
+
+
+class BioreactorMonitor(ReactorView):
     """Main bioreactor monitoring system"""
     
-    def __init__(self):
-        self.temp_sensor = TemperatureSensor()
-        self.ph_sensor = PHSensor()
-        self.fan_controller = FanController()
+    def __init__(self, name: str = 'default', temp_sensor: Optional[TemperatureSensor] = None,
+                 ph_sensor: Optional[PHSensor] = None, fan_controller: Optional[FanController] = None,
+                 history_db: Optional[str] = None, shared_temperature: bool = False,
+                 alerts: Optional[AlertEngine] = None):
+        # Without arguments: one reactor configured from the environment.
+        # shared_temperature: temperatures are fed by a ReactorRegistry reading the whole 1-Wire bus
+        self.name = name
+        self.temp_sensor = temp_sensor or TemperatureSensor()
+        self.ph_sensor = ph_sensor or PHSensor()
+        self.fan_controller = fan_controller or FanController()
+        # Rolling statistics and alert rules, updated with every sample (see alerts.py)
+        self.alerts = alerts or AlertEngine.from_env()
+
+        # Each sensor on its own cadence (seconds); the fan reacts to every new temperature
+        self.acquisition = AcquisitionScheduler(name, clock=lambda: self.clock())
+        self.acquisition.add('temperature', self.temp_sensor.read_celsius,
+                             float(os.environ.get('TEMP_INTERVAL', '2.0')), on_reading=self._on_temperature,
+                             external=shared_temperature)
+        self.acquisition.add('ph', self.ph_sensor.read_ph, float(os.environ.get('PH_INTERVAL', '0.1')))
+        if self.ph_sensor.analog_channels and self.ph_sensor.adc is not None:
+            self.acquisition.add('analog', self.ph_sensor.read_analog, float(os.environ.get('ADC_INTERVAL', '1.0')))
         
-        self.current_data = {
+        # Latest sample; replaced (never modified) by the monitor thread, read without locks
+        self.snapshot = Snapshot.build({
             'temperature_c': None,
             'temperature_f': None,
             'ph': None,
             'fan_running': False,
             'timestamp': None,
             'status': 'unknown'
-        }
-        # In-memory history: list of dicts with timestamp (iso), ts (epoch ms), temperature_c, ph, fan_running
-        self.history = deque()  # unbounded; we'll trim by time window on append
+        })
+        # In-memory history: columnar ring buffer, 24h at 1 Hz by default (HISTORY_CAPACITY samples)
+        self.history = HistoryBuffer(int(os.environ.get('HISTORY_CAPACITY', str(24 * 60 * 60))))
+        # Persistent history (HISTORY_DB='' disables it); the last 24h are reloaded into memory
+        self.store = None
+        db_path = history_db if history_db is not None else os.environ.get('HISTORY_DB', 'bioreactor_history.sqlite')
+        if db_path:
+            try:
+                self.store = HistoryStore(db_path)
+                since_ms = int(self.clock() * 1000) - 24 * 60 * 60 * 1000
+                for sample in self.store.recent_samples(since_ms):
+                    self.history.append(*sample)
+                logger.info(f"Reloaded {len(self.history)} history samples from {db_path}")
+            except Exception as e:
+                logger.warning(f"History store unavailable, keeping history in memory only: {e}")
+                self.store = None
         
+        # Live push to streaming clients (/api/stream)
+        self.broadcaster = SampleBroadcaster()
+        # Called with every new Snapshot (e.g. the shared-state publisher of acquisition_service.py)
+        self.sample_listeners: List = []
+
         self.running = False
         self.monitor_thread = None
+        self.ticker = None
+        self._stop = threading.Event()
         
-        logger.info("Bioreactor monitor initialized")
+        logger.info(f"Bioreactor monitor initialized ({self.name})")
     
     def get_algae_status(self, temp: float, ph: float) -> Dict[str, str]:
         """Determine algae health status based on sensor readings"""
@@ -339,88 +1208,290 @@ class BioreactorMonitor:
         else:
             return {'status': 'poor', 'emoji': '😰', 'message': 'Algae are stressed!'}
     
+    def _on_temperature(self, temp_c: Optional[float]):
+        # Fast control path: runs in the temperature thread as soon as a reading arrives,
+        # independent of the monitor loop, history and HTTP work (None feeds the fail-safe)
+        self.fan_controller.control_fan(temp_c)
+
     def read_sensors(self):
-        """Read all sensor data"""
-        temp_c = self.temp_sensor.read_celsius()
-        temp_f = self.temp_sensor.read_fahrenheit()
-        ph = self.ph_sensor.read_ph()
-        
-        # Control fan based on temperature
-        if temp_c is not None:
-            self.fan_controller.control_fan(temp_c)
-        
-        # Get algae status
-        algae_status = self.get_algae_status(temp_c, ph)
+        """Build a sample from the latest reading of every sensor.
+
+        While monitoring, the acquisition threads keep the readings fresh; otherwise
+        every sensor is read once here (the DS18B20 only once, °F is derived).
+        """
+        if not self.acquisition.running:
+            self.acquisition.poll()
+        temp_c, temp_ts = self.acquisition.latest('temperature')
+        ph, ph_ts = self.acquisition.latest('ph')
+        temp_f = temp_c * 9 / 5 + 32 if temp_c is not None else None
         
-        self.current_data = {
+        now = datetime.fromtimestamp(self.clock())
+        data = {
             'temperature_c': round(temp_c, 2) if temp_c else None,
             'temperature_f': round(temp_f, 2) if temp_f else None,
             'ph': round(ph, 2) if ph else None,
             'fan_running': self.fan_controller.fan_running,
-            'timestamp': datetime.now().isoformat(),
-            'algae_status': algae_status
+            'timestamp': now.isoformat(),
+            'ts': int(now.timestamp() * 1000),
+            'temperature_ts': temp_ts,  # acquisition times (epoch ms)
+            'ph_ts': ph_ts,
+            'reactor': self.name,
         }
-        # Append to in-memory history and trim to a reasonable window (e.g., 24h)
+        if 'analog' in self.acquisition.tasks:
+            analog, _ = self.acquisition.latest('analog')
+            data['analog'] = analog or {}
+        # Incremental: O(1) per sample and window, never a pass over the history
+        smoothed = {}
         try:
-            now_dt = datetime.now()
-            entry = {
-                'ts': int(now_dt.timestamp() * 1000),
-                'timestamp': self.current_data['timestamp'],
-                'temperature_c': self.current_data['temperature_c'],
-                'ph': self.current_data['ph'],
-                'fan_running': self.current_data['fan_running'],
-            }
-            self.history.append(entry)
-            # Trim anything older than 24 hours to bound memory usage
-            cutoff = now_dt - timedelta(hours=24)
-            cutoff_ms = int(cutoff.timestamp() * 1000)
-            while self.history and self.history[0]['ts'] < cutoff_ms:
-                self.history.popleft()
+            data.update(self.alerts.update(data, {'fan_threshold': self.fan_controller.temp_threshold}))
+            smoothed = self.alerts.smoothed(data['ts'] / 1000.0)
         except Exception as e:
-            logger.debug(f"History append/trim error: {e}")
+            logger.error(f"Alert engine error: {e}")
+        # Algae status from the means over the shortest rolling window (5 min by default, as the
+        # ph_low/ph_high rules), so a single noisy reading does not flip it; raw readings until it fills
+        if temp_c is not None and smoothed.get('temperature_c') is not None:
+            temp_c = smoothed['temperature_c']
+        if ph is not None and smoothed.get('ph') is not None:
+            ph = smoothed['ph']
+        data['algae_status'] = self.get_algae_status(temp_c, ph)
+        # Append to in-memory history (the ring buffer drops the oldest sample when full)
+        # and queue it for the on-disk store, which writes in batches
+        try:
+            sample = (data['ts'], data['temperature_c'], data['ph'], data['fan_running'])
+            self.history.append(*sample)
+            if self.store is not None:
+                self.store.add(*sample)
+        except Exception as e:
+            logger.debug(f"History append error: {e}")
 
-        return self.current_data
+        # Frozen and encoded once per sample, then published in one assignment (after the
+        # history append, so responses cached for this snapshot include it);
+        # /api/status and the stream reuse the same bytes for every client
+        snapshot = Snapshot.build(data)
+        self.snapshot = snapshot
+        for listener in self.sample_listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Sample listener failed: {e}")
+        self.broadcaster.publish(snapshot.encoded)
+        return snapshot.data
     
     def start_monitoring(self, interval: float = 2.0):
         """Start continuous monitoring"""
         self.running = True
+        self._stop.clear()
+        self.acquisition.start()
+        self.ticker = DeadlineTicker(f"{self.name}/monitor", interval, self._stop)
         
         def monitor_loop():
-            while self.running:
+            while self.ticker.wait():
+                started = time.monotonic()
                 try:
-                    data = self.read_sensors()
-                    logger.info(f"T: {data['temperature_c']}°C, pH: {data['ph']}, "
-                              f"Fan: {data['fan_running']}, Status: {data['algae_status']['message']}")
-                    time.sleep(interval)
+                    data = profiler.run(self.read_sensors)
+                    # Backstop for the fan fail-safe in case the temperature thread is stuck
+                    self.fan_controller.check_failsafe()
+                    if telemetry is not None:
+                        telemetry.record({'ts': data['ts'], 'reactor': self.name, 't': data['temperature_c'],
+                                          'ph': data['ph'], 'fan': int(data['fan_running']),
+                                          'status': data['algae_status']['status']})
                 except Exception as e:
                     logger.error(f"Error in monitoring loop: {e}")
-                    time.sleep(interval)
+                MONITOR_CYCLE_SECONDS.observe(time.monotonic() - started, reactor=self.name)
         
-        self.monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
+        self.monitor_thread = threading.Thread(target=monitor_loop, name=f"monitor-{self.name}", daemon=True)
         self.monitor_thread.start()
         logger.info("Monitoring started")
     
     def stop_monitoring(self):
         """Stop monitoring"""
         self.running = False
+        self._stop.set()
         if self.monitor_thread:
             self.monitor_thread.join()
+        self.acquisition.stop()
         self.fan_controller.cleanup()
+        if self.store is not None:
+            self.store.close()
         logger.info("Monitoring stopped")
-    
-    def get_current_data(self) -> Dict:
-        """Get current sensor data"""
-        return self.current_data.copy()
 
-    def get_history(self, minutes: int = 30):
-        """Return history entries within the last `minutes` minutes as a list of dicts"""
-        try:
-            minutes = max(1, min(int(minutes), 24 * 60))  # clamp 1..1440
-        except Exception:
-            minutes = 30
-        now_ms = int(datetime.now().timestamp() * 1000)
-        cutoff_ms = now_ms - minutes * 60 * 1000
-        return [e for e in list(self.history) if e['ts'] >= cutoff_ms]
+    def timing(self) -> Dict[str, Dict]:
+        """Deadline statistics of the monitor loop and the acquisition threads"""
+        timing = self.acquisition.timing()
+        if self.ticker is not None:
+            timing['monitor'] = self.ticker.stats()
+        return timing
+
+    # ===== control (RemoteReactor forwards the same calls to the acquisition service) =====
+    def set_fan(self, running: bool) -> bool:
+        """Manual fan start / stop; returns whether the fan runs"""
+        if running:
+            self.fan_controller.start_fan()
+        else:
+            self.fan_controller.stop_fan()
+        return self.fan_controller.fan_running
+
+    def get_fan_threshold(self) -> float:
+        return self.fan_controller.temp_threshold
+
+    def set_fan_threshold(self, value: float) -> float:
+        self.fan_controller.temp_threshold = float(value)
+        return self.fan_controller.temp_threshold
+
+    def adc_stats(self) -> Dict:
+        """Oversampling settings and per-channel rate / noise of the MCP3008"""
+        return self.ph_sensor.adc_stats()
+
+
+class W1Bus:
+    """Shared 1-Wire bus: one temperature conversion for all DS18B20 probes per cycle.
+
+    With the kernel's bulk read (w1_therm therm_bulk_read) all probes convert at
+    once and are then read without another conversion, ~750 ms per cycle in
+    total instead of per probe. Otherwise the probes are read one after another.
+    """
+
+    BULK_READ = '/sys/bus/w1/devices/w1_bus_master1/therm_bulk_read'
+
+    def __init__(self, sensors: List[TemperatureSensor]):
+        self.sensors = sensors
+        self.bulk = os.path.exists(self.BULK_READ) and all(s.device_path for s in sensors)
+        logger.info(f"1-Wire bus: {len(sensors)} probes, bulk read {'on' if self.bulk else 'off'}")
+
+    def read_all(self) -> List[Optional[float]]:
+        """Temperatures (°C) in the order of `sensors`"""
+        with SENSOR_READ_SECONDS.time(sensor='w1_bus', device='all'):
+            return self._read_all()
+
+    def _read_all(self) -> List[Optional[float]]:
+        if self.bulk:
+            try:
+                with open(self.BULK_READ, 'w') as f:
+                    f.write('trigger\n')
+                values = []
+                for s in self.sensors:
+                    try:
+                        with open(os.path.join(os.path.dirname(s.device_path), 'temperature'), 'r') as f:
+                            values.append(int(f.read().strip()) / 1000.0)
+                    except Exception as e:
+                        logger.debug(f"Bulk read of {s.device_id} failed, reading it alone: {e}")
+                        values.append(s.read_celsius())
+                return values
+            except Exception as e:
+                logger.warning(f"1-Wire bulk read failed: {e}")
+        return [s.read_celsius() for s in self.sensors]
+
+
+class ReactorRegistry:
+    """Named reactors, each with its own probe, pH channel, fan, history and status.
+
+    Configured with a JSON file (REACTORS_FILE), either a list of reactors or
+    {"reactors": [...]}:
+
+        [{"name": "flask-a", "probe": "28-0123456789ab", "ph_channel": 0, "fan_pin": 12,
+          "fan_threshold": 28.0, "analog": {"do": 2}, "ph_calibration": {...}},
+         {"name": "flask-b", "probe": "28-0fedcba98765", "ph_channel": 1, "fan_pin": 13}]
+
+    All probes share one 1-Wire bus read (W1Bus) and all pH channels one MCP3008.
+    Without a file there is a single reactor configured from the environment.
+    """
+
+    def __init__(self, configs: Optional[List[Dict]] = None, monitors: Optional[List[BioreactorMonitor]] = None):
+        # monitors: already built reactors (e.g. on simulated hardware) instead of configs
+        self.reactors: Dict[str, BioreactorMonitor] = {m.name: m for m in monitors or []}
+        self.configs = configs or []
+        self.bus = None
+        self.bus_task = None
+        self.running = False
+        self._stop = threading.Event()
+        if monitors:
+            return
+        if not configs:
+            monitor = BioreactorMonitor()
+            self.reactors[monitor.name] = monitor
+            return
+
+        shared_adc = None
+        for cfg in configs:
+            name = str(cfg['name'])
+            if name in self.reactors:
+                raise ValueError(f"Duplicate reactor name: {name}")
+            ph_sensor = PHSensor(adc_channel=cfg.get('ph_channel'), adc=shared_adc,
+                                 analog_channels=cfg.get('analog', {}), calibration=cfg.get('ph_calibration'))
+            shared_adc = shared_adc or ph_sensor.adc
+            self.reactors[name] = BioreactorMonitor(
+                name=name,
+                temp_sensor=TemperatureSensor(cfg.get('probe')),
+                ph_sensor=ph_sensor,
+                fan_controller=FanController(cfg.get('fan_pin'), cfg.get('fan_threshold')),
+                history_db=self._history_db(name),
+                shared_temperature=True,
+                alerts=AlertEngine.from_env(cfg.get('alerts')),
+            )
+        self.bus = W1Bus([m.temp_sensor for m in self.reactors.values()])
+        self.bus_task = SensorTask('w1-bus', self.bus.read_all, float(os.environ.get('TEMP_INTERVAL', '2.0')),
+                                   on_reading=self._dispatch)
+
+    @classmethod
+    def from_env(cls) -> 'ReactorRegistry':
+        path = os.environ.get('REACTORS_FILE')
+        if not path:
+            return cls()
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config['reactors'] if isinstance(config, dict) else config)
+
+    @staticmethod
+    def _history_db(name: str) -> str:
+        # one history file per reactor, next to the default one
+        path = os.environ.get('HISTORY_DB', 'bioreactor_history.sqlite')
+        if not path:
+            return ''
+        stem, ext = os.path.splitext(path)
+        return f"{stem}-{name}{ext}"
+
+    def _dispatch(self, values: Optional[List[Optional[float]]]):
+        for monitor, value in zip(self.reactors.values(), values or []):
+            monitor.acquisition.tasks['temperature'].feed(value)
+
+    @property
+    def default(self) -> BioreactorMonitor:
+        return next(iter(self.reactors.values()))
+
+    def get(self, name: Optional[str] = None) -> BioreactorMonitor:
+        """Reactor by name (the first one if name is None); KeyError if unknown"""
+        return self.default if name is None else self.reactors[name]
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                'name': name,
+                'probe': m.temp_sensor.device_id,
+                'ph_channel': m.ph_sensor.adc_channel,
+                'fan_pin': m.fan_controller.fan_pin,
+                'fan_temp_threshold': m.fan_controller.temp_threshold,
+                'timing': m.timing(),
+            }
+            for name, m in self.reactors.items()
+        ]
+
+    def start_monitoring(self, interval: float = 2.0):
+        self.running = True
+        if self.bus_task is not None:
+            self._stop.clear()
+            self.bus_task.thread = threading.Thread(target=self.bus_task.loop, args=(self._stop,),
+                                                    name="acquire-w1-bus", daemon=True)
+            self.bus_task.thread.start()
+        for monitor in self.reactors.values():
+            monitor.start_monitoring(interval)
+
+    def stop_monitoring(self):
+        self.running = False
+        self._stop.set()
+        if self.bus_task is not None and self.bus_task.thread is not None:
+            self.bus_task.thread.join(timeout=5.0)
+        for monitor in self.reactors.values():
+            monitor.stop_monitoring()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Persistent sensor history for the bioreactor monitor.
+
+SQLite in WAL mode with three retention tiers:
+  samples     raw readings (1 s), kept for 24 hours
+  rollup_1m   1 minute min/mean/max, kept for 30 days
+  rollup_15m  15 minute min/mean/max, kept forever
+
+Readings are buffered in memory and written in one transaction per batch
+(every FLUSH_EVERY samples or FLUSH_INTERVAL seconds), so the SD card sees a
+write about once a minute instead of once a second. Rollups and retention are
+updated on flush.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60 * 1000
+QUARTER_MS = 15 * MINUTE_MS
+RAW_RETENTION_MS = 24 * 60 * MINUTE_MS
+MINUTE_RETENTION_MS = 30 * 24 * 60 * MINUTE_MS
+_FOREVER = 2 ** 62
+
+_ROLLUP_COLUMNS = """
+    ts INTEGER PRIMARY KEY,
+    n INTEGER NOT NULL,
+    temperature_min REAL, temperature_mean REAL, temperature_max REAL,
+    ph_min REAL, ph_mean REAL, ph_max REAL,
+    fan_on REAL
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (
+    ts INTEGER PRIMARY KEY,
+    temperature_c REAL,
+    ph REAL,
+    fan_running INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_1m ({_ROLLUP_COLUMNS});
+CREATE TABLE IF NOT EXISTS rollup_15m ({_ROLLUP_COLUMNS});
+"""
+
+# 1 minute buckets from raw samples (AVG/MIN/MAX skip NULL readings)
+_ROLLUP_1M = """
+INSERT OR REPLACE INTO rollup_1m
+SELECT (ts / 60000) * 60000, COUNT(*),
+       MIN(temperature_c), AVG(temperature_c), MAX(temperature_c),
+       MIN(ph), AVG(ph), MAX(ph),
+       AVG(fan_running)
+FROM samples WHERE ts >= ? AND ts < ?
+GROUP BY ts / 60000
+"""
+
+# 15 minute buckets from the 1 minute ones, means weighted by sample count
+_ROLLUP_15M = """
+INSERT OR REPLACE INTO rollup_15m
+SELECT (ts / 900000) * 900000, SUM(n),
+       MIN(temperature_min), SUM(temperature_mean * n) / SUM(CASE WHEN temperature_mean IS NULL THEN 0 ELSE n END), MAX(temperature_max),
+       MIN(ph_min), SUM(ph_mean * n) / SUM(CASE WHEN ph_mean IS NULL THEN 0 ELSE n END), MAX(ph_max),
+       SUM(fan_on * n) / SUM(n)
+FROM rollup_1m WHERE ts >= ? AND ts < ?
+GROUP BY ts / 900000
+"""
+
+
+def _ceil(ts: int, step: int) -> int:
+    return -(-ts // step) * step
+
+
+class HistoryStore:
+    """Batched, tiered on-disk history (see module docstring)"""
+
+    FLUSH_EVERY = 60        # samples
+    FLUSH_INTERVAL = 60.0   # seconds
+
+    def __init__(self, path: str, flush_every: int = FLUSH_EVERY, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[int, Optional[float], Optional[float], int]] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        logger.info(f"History store opened at {path}")
+
+    def add(self, ts: int, temperature_c: Optional[float], ph: Optional[float], fan_running: bool):
+        """Queue one reading; written on the next flush."""
+        with self._lock:
+            self._pending.append((ts, temperature_c, ph, 1 if fan_running else 0))
+            due = (len(self._pending) >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write queued readings, update rollups and apply retention, in one transaction."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not rows:
+                return
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO samples (ts, temperature_c, ph, fan_running) VALUES (?, ?, ?, ?)", rows)
+                    self._update_rollups(rows[-1][0])
+            except Exception as e:
+                logger.error(f"History store write failed ({len(rows)} samples dropped): {e}")
+
+    def _meta(self, key: str, default: int) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def _set_meta(self, key: str, value: int):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _update_rollups(self, latest_ts: int):
+        # Only completed buckets are rolled up; the watermarks remember how far we got
+        minute_end = (latest_ts // MINUTE_MS) * MINUTE_MS
+        minute_start = self._meta('rolled_1m', 0)
+        if minute_end > minute_start:
+            self.conn.execute(_ROLLUP_1M, (minute_start, minute_end))
+            self._set_meta('rolled_1m', minute_end)
+
+        quarter_end = (minute_end // QUARTER_MS) * QUARTER_MS
+        quarter_start = self._meta('rolled_15m', 0)
+        if quarter_end > quarter_start:
+            self.conn.execute(_ROLLUP_15M, (quarter_start, quarter_end))
+            self._set_meta('rolled_15m', quarter_end)
+            # Retention runs at most once per 15 minutes
+            self.conn.execute("DELETE FROM samples WHERE ts < ?", (min(minute_end, latest_ts - RAW_RETENTION_MS),))
+            self.conn.execute("DELETE FROM rollup_1m WHERE ts < ?", (min(quarter_end, latest_ts - MINUTE_RETENTION_MS),))
+
+    # ===== queries =====
+    def recent_samples(self, start_ms: int) -> List[Tuple[int, Optional[float], Optional[float], bool]]:
+        """Raw (ts, temperature_c, ph, fan_running) tuples since start_ms, oldest first."""
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts, temperature_c, ph, fan_running FROM samples WHERE ts >= ? ORDER BY ts",
+                (start_ms,)).fetchall()
+        return [(ts, t, ph, bool(fan)) for ts, t, ph, fan in rows]
+
+    def rollups(self, start_ms: int, end_ms: Optional[int] = None) -> List[Dict]:
+        """Rollup rows covering [start_ms, end_ms), from the finest tier that still holds start_ms."""
+        self.flush()
+        now_ms = int(time.time() * 1000)
+        end_ms = end_ms if end_ms is not None else now_ms
+        table = 'rollup_1m' if now_ms - start_ms <= MINUTE_RETENTION_MS else 'rollup_15m'
+        with self._lock:
+            cur = self.conn.execute(f"SELECT * FROM {table} WHERE ts >= ? AND ts < ? ORDER BY ts",
+                                    (start_ms, end_ms))
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def iter_records(self, start_ms: int, end_ms: int) -> Iterator[Tuple]:
+        """Everything stored for [start_ms, end_ms), oldest first, one row at a time.
+
+        Stitches the tiers together: 15 minute rollups where the 1 minute ones
+        have expired, 1 minute rollups where the raw samples have, raw samples
+        after that. Records are (ts, temperature_c, ph, fan_running, n,
+        temperature_min, temperature_max, ph_min, ph_max), the last five None for
+        raw samples. Reads go through a connection of their own, so a long export
+        never holds the lock that add() and flush() need; readings not flushed yet
+        are not included (ReactorView.iter_records adds them from memory).
+        """
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10.0,
+                               isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("BEGIN")  # one snapshot across the tiers, even while the monitor flushes
+            raw_from = conn.execute("SELECT MIN(ts) FROM samples").fetchone()[0]
+            minute_from = conn.execute("SELECT MIN(ts) FROM rollup_1m").fetchone()[0]
+            # bucket-aligned edges, so that no interval is covered by two tiers
+            raw_edge = _ceil(raw_from, MINUTE_MS) if raw_from is not None else _FOREVER
+            quarter_edge = min(_ceil(minute_from, QUARTER_MS), raw_edge) if minute_from is not None else raw_edge
+            rollup = ("SELECT ts, temperature_mean, ph_mean, fan_on, n, temperature_min, temperature_max, ph_min, ph_max"
+                      " FROM {} WHERE ts >= ? AND ts < ? ORDER BY ts")
+            for sql, lo, hi in (
+                (rollup.format('rollup_15m'), start_ms, min(end_ms, quarter_edge)),
+                (rollup.format('rollup_1m'), max(start_ms, quarter_edge), min(end_ms, raw_edge)),
+                ("SELECT ts, temperature_c, ph, fan_running, NULL, NULL, NULL, NULL, NULL"
+                 " FROM samples WHERE ts >= ? AND ts < ? ORDER BY ts", max(start_ms, raw_edge), end_ms),
+            ):
+                if lo < hi:
+                    yield from conn.execute(sql, (lo, hi))
+        finally:
+            conn.close()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
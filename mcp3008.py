@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Oversampling MCP3008 driver.
+
+Every reading is a burst of `samples` conversions on one channel, reduced by a
+filter (median, mean or trimmed mean) and optionally smoothed across readings
+with an EMA. Any of the eight channels can be read or scanned per cycle, and
+each channel keeps rate / noise statistics.
+
+The MCP3008 starts a conversion on the falling edge of CS, so each conversion
+is its own 3-byte transfer; a burst issues them back to back under one lock.
+
+`FakeSpiDev` replays recorded raw counts through the same protocol, so the
+driver and the pH code can run without hardware (SPI_FAKE=<file>).
+"""
+
+import logging
+import statistics
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FILTERS = ('median', 'mean', 'trimmed')
+
+
+class ChannelStats:
+    """Running statistics of one ADC channel"""
+
+    def __init__(self):
+        self.readings = 0
+        self.conversions = 0
+        self.failures = 0
+        self.first_read = None
+        self.last_counts = None      # filtered counts of the last reading
+        self.last_voltage = None
+        self.noise_counts = None     # std dev of the counts within the last burst
+        self.noise_ema = None        # smoothed burst std dev
+
+    def as_dict(self) -> Dict:
+        elapsed = time.monotonic() - self.first_read if self.first_read is not None else 0.0
+        return {
+            'readings': self.readings,
+            'conversions': self.conversions,
+            'failures': self.failures,
+            'readings_per_s': round(self.readings / elapsed, 2) if elapsed > 0 else None,
+            'conversions_per_s': round(self.conversions / elapsed, 1) if elapsed > 0 else None,
+            'last_counts': self.last_counts,
+            'last_voltage': self.last_voltage,
+            'noise_counts': self.noise_counts,
+            'noise_counts_avg': self.noise_ema,
+        }
+
+
+class MCP3008:
+    """Burst-sampling, filtered reads from an MCP3008 on an open spidev.SpiDev (or FakeSpiDev)"""
+
+    def __init__(self, spi, vref: float = 3.3, samples: int = 16, filter: str = 'median',
+                 trim: float = 0.2, ema_alpha: float = 0.0):
+        if filter not in FILTERS:
+            raise ValueError(f"filter must be one of {FILTERS}")
+        self.spi = spi
+        self.vref = vref
+        self.samples = max(1, int(samples))
+        self.filter = filter
+        self.trim = min(max(trim, 0.0), 0.45)
+        self.ema_alpha = ema_alpha
+        self._ema: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.channel_stats = {ch: ChannelStats() for ch in range(8)}
+
+    def read_counts_raw(self, channel: int, n: int) -> List[int]:
+        """`n` single-ended conversions (0..1023) of one channel"""
+        if not (0 <= channel <= 7):
+            raise ValueError(f"MCP3008 channel must be 0..7, got {channel}")
+        # start bit, single-ended + channel bits, one byte to clock out the result
+        cmd = [1, (8 + channel) << 4, 0]
+        xfer = self.spi.xfer2
+        with self._lock:
+            responses = [xfer(list(cmd)) for _ in range(n)]
+        return [((r[1] & 3) << 8) | r[2] for r in responses]
+
+    def _reduce(self, counts: List[int]) -> float:
+        if self.filter == 'median':
+            return float(statistics.median(counts))
+        if self.filter == 'trimmed':
+            k = int(len(counts) * self.trim)
+            counts = sorted(counts)[k:len(counts) - k] or counts
+        return sum(counts) / len(counts)
+
+    def read_counts(self, channel: int) -> Optional[float]:
+        """One filtered reading in counts (float), or None on an SPI error"""
+        stats = self.channel_stats[channel]
+        if stats.first_read is None:
+            stats.first_read = time.monotonic()
+        try:
+            counts = self.read_counts_raw(channel, self.samples)
+        except Exception as e:
+            stats.failures += 1
+            logger.error(f"ADC read error on channel {channel}: {e}")
+            return None
+        value = self._reduce(counts)
+        if self.ema_alpha > 0:
+            prev = self._ema.get(channel)
+            value = value if prev is None else prev + self.ema_alpha * (value - prev)
+            self._ema[channel] = value
+
+        stats.readings += 1
+        stats.conversions += len(counts)
+        stats.last_counts = value
+        stats.last_voltage = self.counts_to_voltage(value)
+        if len(counts) > 1:
+            noise = statistics.pstdev(counts)
+            stats.noise_counts = round(noise, 3)
+            stats.noise_ema = round(noise if stats.noise_ema is None else stats.noise_ema + 0.1 * (noise - stats.noise_ema), 3)
+        return value
+
+    def counts_to_voltage(self, counts: float) -> float:
+        return (counts / 1023.0) * self.vref
+
+    def read_voltage(self, channel: int) -> Optional[float]:
+        counts = self.read_counts(channel)
+        return None if counts is None else self.counts_to_voltage(counts)
+
+    def scan(self, channels: Iterable[int]) -> Dict[int, Optional[float]]:
+        """Filtered voltage of several channels in one cycle"""
+        return {ch: self.read_voltage(ch) for ch in channels}
+
+    def stats(self) -> Dict[int, Dict]:
+        """Per-channel statistics for the channels that have been read"""
+        return {ch: s.as_dict() for ch, s in self.channel_stats.items() if s.first_read is not None}
+
+
+class FakeSpiDev:
+    """Stand-in for spidev.SpiDev that answers MCP3008 conversions from recorded raw counts.
+
+    `recordings` maps channel -> list of counts (0..1023), replayed in order and
+    looped. `from_file` reads "channel count" lines (e.g. captured on the Pi).
+    Channels without a recording read 0.
+    """
+
+    def __init__(self, recordings: Optional[Dict[int, List[int]]] = None):
+        self.recordings = {ch: list(v) for ch, v in (recordings or {}).items()}
+        self._pos = {ch: 0 for ch in self.recordings}
+        self.transfers = 0
+        self.max_speed_hz = 0
+        self.mode = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> 'FakeSpiDev':
+        recordings: Dict[int, List[int]] = {}
+        with open(path) as f:
+            for line in f:
+                parts = line.replace(',', ' ').split()
+                if len(parts) >= 2 and not line.lstrip().startswith('#'):
+                    recordings.setdefault(int(parts[0]), []).append(int(parts[1]))
+        return cls(recordings)
+
+    def open(self, bus: int, device: int):
+        pass
+
+    def close(self):
+        pass
+
+    def xfer2(self, data: List[int]) -> List[int]:
+        self.transfers += 1
+        if len(data) != 3 or data[0] != 1:
+            raise ValueError(f"unexpected MCP3008 command {data}")
+        channel = (data[1] >> 4) & 7
+        values = self.recordings.get(channel)
+        if not values:
+            count = 0
+        else:
+            count = values[self._pos[channel] % len(values)]
+            self._pos[channel] += 1
+        count = max(0, min(1023, int(count)))
+        return [0, (count >> 8) & 3, count & 0xFF]
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the bioreactor monitor.
+
+Counters, gauges and fixed-bucket latency histograms, labelled by a few
+strings (sensor, endpoint, ...), cheap enough for the 1 Hz loop and the
+10 Hz pH reads: an observation is one bisect and two additions under a lock.
+`render_prometheus()` gives the text exposition format for /metrics and
+`summary()` a JSON-friendly digest with approximate percentiles.
+
+Instrumentation can be switched off at runtime (`REGISTRY.enabled = False`,
+or METRICS=0 at startup), and `PROFILER` collects cProfile statistics of the
+sensor threads, the monitor loop and the request handlers while it is started.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# seconds; sensor reads range from microseconds (mock) to ~1 s (DS18B20 with retries)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + body + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, registry, name, help):
+        super().__init__(registry, name, help)
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def summary(self):
+        with self._lock:
+            return {_format_labels(key) or 'total': value for key, value in self.values.items()}
+
+
+class Gauge(_Metric):
+    """Last set value, or the result of a callback evaluated at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, fn: Optional[Callable[[], float]] = None):
+        super().__init__(registry, name, help)
+        self.values: Dict[LabelKey, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.fn is not None:
+            try:
+                return [(self.name, (), float(self.fn()))]
+            except Exception:
+                return []
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def summary(self):
+        return {_format_labels(key) or 'value': value for _, key, value in self.samples()}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts (non-cumulative, last one is +Inf), sum, count, max]
+        self.series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+            if value > s[3]:
+                s[3] = value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = [(key, list(s[0]), s[1], s[2]) for key, s in self.series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                out.append((f'{self.name}_bucket', key, cumulative, ('le', le)))
+            out.append((f'{self.name}_sum', key, total))
+            out.append((f'{self.name}_count', key, count))
+        return out
+
+    def _percentile(self, counts: List[int], count: int, q: float) -> float:
+        # upper bound of the bucket holding the q-th observation
+        rank = q * count
+        cumulative = 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            cumulative += c
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        out = {}
+        with self._lock:
+            series = [(key, list(s[0]), s[1], s[2], s[3]) for key, s in self.series.items()]
+        for key, counts, total, count, maximum in series:
+            if not count:
+                continue
+            out[_format_labels(key) or 'all'] = {
+                'count': count,
+                'mean': total / count,
+                'max': maximum,
+                'p50_le': min(self._percentile(counts, count, 0.5), maximum),
+                'p90_le': min(self._percentile(counts, count, 0.9), maximum),
+                'p99_le': min(self._percentile(counts, count, 0.99), maximum),
+            }
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = True
+        self.metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = '', fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name: str, help: str = '', buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else None
+                lines.append(f'{name}{_format_labels(key, extra)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'profiling': PROFILER.active,
+            'metrics': {name: {'type': m.kind, 'values': m.summary()} for name, m in list(self.metrics.items())},
+        }
+
+
+class Profiler:
+    """cProfile of the instrumented loops, switchable at runtime.
+
+    A cProfile.Profile only sees the thread it runs in, so each thread that
+    calls `run()` while profiling is active gets its own; `report()` merges them.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.started = None
+        self._profiles: Dict[int, cProfile.Profile] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        with self._lock:
+            self._profiles = {}
+            self.started = time.time()
+            self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def profile(self) -> Optional[cProfile.Profile]:
+        """This thread's profile while profiling is active, else None"""
+        if not self.active:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            profile = self._profiles.get(ident)
+            if profile is None:
+                profile = self._profiles[ident] = cProfile.Profile()
+        return profile
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        """Start profiling this thread; returns the profile to pass to end(), or None.
+
+        Nested calls (e.g. a sensor read inside a profiled monitor cycle) are
+        already covered by the outer one and return None.
+        """
+        if getattr(self._local, 'busy', False):
+            return None
+        profile = self.profile()
+        if profile is not None:
+            self._local.busy = True
+            profile.enable()
+        return profile
+
+    def end(self, profile: Optional[cProfile.Profile]):
+        if profile is not None:
+            profile.disable()
+            self._local.busy = False
+
+    def run(self, fn, *args, **kwargs):
+        profile = self.begin()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end(profile)
+
+    def report(self, limit: int = 30, sort: str = 'cumulative') -> str:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        if not profiles:
+            return 'No profile data (start profiling and let the monitor run for a while)\n'
+        out = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=out)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.enabled = os.environ.get('METRICS', '1') != '0'
+PROFILER = Profiler()
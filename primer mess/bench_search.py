@@ -0,0 +1,210 @@
+# bench_search.py
+"""
+Benchmark for the overhang search on synthetic arms.
+
+Generates seeded arms (uniform random with a set GC content, or an order-1
+Markov chain trained on a real arm), runs run_search over several grid sizes
+and modes with a cold thermodynamics cache, and records candidates/sec,
+primer3 calls and lookups per candidate, peak memory and a checksum of the
+accepted set. Results are appended as JSON lines so runs can be compared
+across changes:
+
+    python bench_search.py --out bench.jsonl
+    python bench_search.py --out bench_new.jsonl --compare bench.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+import primer_tools
+from gibson_search import ARM_NAMES, read_arms, run_search
+
+
+#arm lengths of the committed lacZ/AF construct
+DEFAULT_ARM_LENGTHS = {"leftHDR": 500, "rightHDR": 500, "leftAF": 660, "rightAF": 190}
+#(latest_start_HDR, min_overhang, max_overhang) - max is exclusive, as in range_overhang
+DEFAULT_GRIDS = [(5, 18, 21), (10, 18, 22), (20, 18, 23)]
+
+
+def random_sequence(rng, length, gc=0.5):
+    """Uniform random DNA with expected GC fraction `gc`."""
+    p = [(1 - gc) / 2, gc / 2, gc / 2, (1 - gc) / 2]
+    return "".join(rng.choice(list("ACGT"), size=length, p=p))
+
+
+def markov_sequence(rng, length, template):
+    """Order-1 Markov chain with the dinucleotide frequencies of `template` (more realistic runs/repeats)."""
+    template = template.upper()
+    counts = np.ones((4, 4))                     # add-one smoothing
+    code = {b: i for i, b in enumerate("ACGT")}
+    for x, y in zip(template, template[1:]):
+        if x in code and y in code:
+            counts[code[x], code[y]] += 1
+    transitions = counts / counts.sum(axis=1, keepdims=True)
+    state = rng.integers(4)
+    out = []
+    for _ in range(length):
+        out.append("ACGT"[state])
+        state = rng.choice(4, p=transitions[state])
+    return "".join(out)
+
+
+def synthetic_arms(seed=0, lengths=None, gc=0.5, templates=None):
+    """
+    Four seeded arms. With `templates` (e.g. read_arms()) each arm follows the
+    dinucleotide statistics of its real counterpart, otherwise uniform with GC `gc`.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = dict(DEFAULT_ARM_LENGTHS, **(lengths or {}))
+    arms = {}
+    for name in ARM_NAMES:
+        if templates is not None:
+            arms[name] = markov_sequence(rng, lengths[name], templates[name])
+        else:
+            arms[name] = random_sequence(rng, lengths[name], gc)
+    return arms
+
+
+def accepted_checksum(table):
+    """SHA-256 over the accepted coordinates (search order) and dg_error to 1e-6."""
+    h = hashlib.sha256()
+    for i in range(len(table)):
+        h.update(repr((table.coords(i), round(float(table.rows[i]["dg_error"]), 6))).encode())
+    return h.hexdigest()[:16]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_one(arms, latest_start_HDR, range_overhang, mode="prune", workers=1):
+    """One cold-cache run; returns a result dict."""
+    primer_tools.configure_cache(None)           # cold, memory-only: measure the hot path, not the disk
+    stats = Counter()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    table = run_search(arms, range_overhang, latest_start_HDR, workers=workers, mode=mode,
+                       cache_path=None, progress_every=None, stats=stats, output="table")
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    candidates = stats["candidates"]
+    return {
+        "latest_start_HDR": latest_start_HDR,
+        "range_overhang": [range_overhang.start, range_overhang.stop],
+        "mode": mode,
+        "workers": workers,
+        "candidates": candidates,
+        "accepted": len(table),
+        "seconds": round(elapsed, 4),
+        "candidates_per_sec": round(candidates / elapsed, 1) if elapsed > 0 else None,
+        "primer3_calls_per_candidate": round(stats["primer3_calls"] / candidates, 4),
+        "lookups_per_candidate": round(stats["thermo_lookups"] / candidates, 4),
+        "peak_python_mb": round(peak / 1e6, 2),               # parent process only
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "checksum": accepted_checksum(table),
+    }
+
+
+def run_benchmark(arms, grids=DEFAULT_GRIDS, modes=("prune", "bruteforce"), workers=1,
+                  out=None, label="", verbose=True):
+    """Run every grid × mode; append results (one JSON object per line) to `out`."""
+    meta = {
+        "label": label,
+        "commit": _git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    results = []
+    for latest_start_HDR, lo, hi in grids:
+        for mode in modes:
+            result = dict(meta, **bench_one(arms, latest_start_HDR, range(lo, hi), mode=mode, workers=workers))
+            results.append(result)
+            if verbose:
+                print(f"{mode:<10} starts={latest_start_HDR:<3} overhangs={lo}-{hi - 1}: "
+                      f"{result['candidates']:>8} cand, {result['accepted']:>6} acc, "
+                      f"{result['candidates_per_sec']:>10} cand/s, "
+                      f"{result['primer3_calls_per_candidate']:.3f} primer3/cand, "
+                      f"peak {result['peak_python_mb']} MB, checksum {result['checksum']}")
+            if out is not None:
+                with open(out, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(result) + "\n")
+    return results
+
+
+def _key(r):
+    return (r["mode"], r["latest_start_HDR"], tuple(r["range_overhang"]), r["workers"])
+
+
+def compare(baseline, current, slowdown=0.10):
+    """
+    Compare two result lists (or JSONL paths); print throughput changes and
+    return the problems: checksum changes and slowdowns above `slowdown`.
+    """
+    def _load(x):
+        if isinstance(x, str):
+            with open(x, encoding="utf-8") as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        return x
+
+    base = {_key(r): r for r in _load(baseline)}           # latest run per key wins
+    problems = []
+    for r in _load(current):
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        change = r["candidates_per_sec"] / b["candidates_per_sec"] - 1
+        print(f"{r['mode']:<10} starts={r['latest_start_HDR']:<3} "
+              f"{b['candidates_per_sec']:>10} -> {r['candidates_per_sec']:>10} cand/s ({change:+.1%})")
+        if r["checksum"] != b["checksum"]:
+            problems.append(f"{_key(r)}: accepted set changed ({b['checksum']} -> {r['checksum']})")
+        if change < -slowdown:
+            problems.append(f"{_key(r)}: {-change:.0%} slower")
+    for p in problems:
+        print("✖", p)
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gc", type=float, default=0.5, help="GC fraction of uniform random arms")
+    parser.add_argument("--realistic", action="store_true",
+                        help="Markov arms trained on the arm files in this folder")
+    parser.add_argument("--grid", action="append", metavar="STARTS,MIN,MAX",
+                        help="latest_start_HDR,min_overhang,max_overhang (repeatable)")
+    parser.add_argument("--mode", action="append", choices=["prune", "bruteforce", "matrix"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--out", help="append results to this JSONL file")
+    parser.add_argument("--compare", help="baseline JSONL to compare against")
+    args = parser.parse_args(argv)
+
+    templates = read_arms() if args.realistic else None
+    arms = synthetic_arms(args.seed, gc=args.gc, templates=templates)
+    grids = [tuple(int(x) for x in g.split(",")) for g in args.grid] if args.grid else DEFAULT_GRIDS
+    results = run_benchmark(arms, grids, modes=args.mode or ("prune", "bruteforce"),
+                            workers=args.workers, out=args.out, label=args.label)
+    if args.compare:
+        return 1 if compare(args.compare, results) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
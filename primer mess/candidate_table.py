@@ -0,0 +1,213 @@
+# candidate_table.py
+"""
+Compact, array-backed table of accepted search candidates.
+
+One candidate is one row of a NumPy structured array: the two HDR start
+positions, the four overhang lengths, and precomputed ΔG / binding-Tm columns
+(~120 bytes instead of a Primers object with eight strings). The primer
+sequences are rebuilt from the coordinates only when a row is looked at:
+
+    table = run_search(arms, range_overhang, latest_start_HDR, output="table")
+    table = table.sort("dg_error")
+    table.report(0)
+    table.show_primers(0)
+    table.save("primers.npz")            # instead of pickling a Primers list
+
+`binding_tm_qc` and `TopK` work chunk by chunk, so run_search can apply the
+QC and keep a ranked shortlist while it runs (``qc=binding_tm_qc, top_k=50``).
+"""
+
+import numpy as np
+
+from primer_tools import (binding_region, build_sequences, calc_hairpin_dg,
+                          calc_heterodimer_dg, calc_homodimer_dg, calc_tm)
+
+
+#primer names in Primers() argument order
+PRIMER_NAMES = ("oh_leftHDR", "oh_rightHDR", "oh_leftAF", "oh_rightAF", "HDRfw", "HDRrv", "AFfw", "AFrv")
+#(label, fwd, rev) of the three primer pairs checked by the search
+PAIRS = (("HDR-only", "oh_leftHDR", "oh_rightHDR"), ("HDR", "HDRfw", "HDRrv"), ("AF", "AFfw", "AFrv"))
+#binding-region Tm is stored for every primer that is part of a pair
+BINDING_TM_PRIMERS = tuple(name for _, fwd, rev in PAIRS for name in (fwd, rev))
+
+#field prefix of each pair and the five ΔGs of a pair, in the order Primers() sums them
+_PAIR_FIELDS = ("hdr_only", "hdr", "af")
+_DG_STATS = ("fwd_hairpin", "fwd_homodimer", "rev_hairpin", "rev_homodimer", "heterodimer")
+DG_FIELDS = tuple(f"dg_{pair}_{stat}" for pair in _PAIR_FIELDS for stat in _DG_STATS)
+LENGTH_FIELDS = tuple(f"len_{name}" for name in PRIMER_NAMES[:4])
+
+CANDIDATE_DTYPE = np.dtype(
+    [("start_left", np.uint16), ("start_right", np.uint16)]
+    + [(field, np.uint8) for field in LENGTH_FIELDS]
+    + [("dg_error", np.float64)]
+    + [(field, np.float32) for field in DG_FIELDS]                          # kcal/mol
+    + [(f"tm_bind_{name}", np.float64) for name in BINDING_TM_PRIMERS]      # °C, full precision for QC bounds
+)
+
+
+def pair_dgs(seqs):
+    """The 15 ΔGs (kcal/mol) Primers() sums into dg_error, for the eight sequences `seqs`."""
+    named = dict(zip(PRIMER_NAMES, seqs))
+    dgs = []
+    for _, fwd, rev in PAIRS:
+        f, r = named[fwd], named[rev]
+        dgs += [calc_hairpin_dg(f) / 1000.0, calc_homodimer_dg(f) / 1000.0,
+                calc_hairpin_dg(r) / 1000.0, calc_homodimer_dg(r) / 1000.0,
+                calc_heterodimer_dg(f, r) / 1000.0]
+    return dgs
+
+
+class CandidateTable:
+    """
+    Accepted candidates as a structured array (`rows`, dtype CANDIDATE_DTYPE).
+
+    Parameters
+    ----------
+    arms : dict
+        Arm sequences the coordinates refer to (see gibson_search.read_arms).
+    rows : numpy.ndarray, optional
+        Existing rows; an empty table by default.
+    """
+
+    def __init__(self, arms, rows=None):
+        self.arms = arms
+        self.rows = np.zeros(0, dtype=CANDIDATE_DTYPE) if rows is None else rows
+
+    @classmethod
+    def from_coords(cls, arms, coords, windows=None):
+        """
+        Build a table from ``(start_left, start_right, oh_leftHDR, oh_rightHDR,
+        oh_leftAF, oh_rightAF)`` tuples, filling the ΔG columns from the (cached)
+        thermodynamics. With a window_index.WindowIndex the sequences and
+        binding-region Tms are table lookups instead of primer3 calls.
+        """
+        rows = np.zeros(len(coords), dtype=CANDIDATE_DTYPE)
+        for i, coord in enumerate(coords):
+            seqs = windows.sequences(*coord) if windows is not None else build_sequences(arms, *coord)
+            dgs = pair_dgs(seqs)
+            named = dict(zip(PRIMER_NAMES, seqs))
+            binding_tms = windows.binding_tms(*coord) if windows is not None else None
+            row = rows[i]
+            row["start_left"], row["start_right"] = coord[:2]
+            for field, length in zip(LENGTH_FIELDS, coord[2:]):
+                row[field] = length
+            row["dg_error"] = (np.array(dgs)**2).sum()
+            for field, dg in zip(DG_FIELDS, dgs):
+                row[field] = dg
+            for name in BINDING_TM_PRIMERS:
+                if binding_tms is not None:
+                    row[f"tm_bind_{name}"] = binding_tms[name]
+                else:
+                    row[f"tm_bind_{name}"] = calc_tm(binding_region(named[name]))
+        return cls(arms, rows)
+
+    @classmethod
+    def concat(cls, arms, tables):
+        return cls(arms, np.concatenate([t.rows for t in tables]) if tables else None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        """A row (numpy.void) for an int, a new CandidateTable for a slice / mask / index array."""
+        if isinstance(index, (int, np.integer)):
+            return self.rows[index]
+        return CandidateTable(self.arms, self.rows[index])
+
+    def __repr__(self):
+        return f"CandidateTable({len(self)} candidates, {self.rows.nbytes / 1024:.0f} kB)"
+
+    def coords(self, i):
+        row = self.rows[i]
+        return (int(row["start_left"]), int(row["start_right"]), *(int(row[f]) for f in LENGTH_FIELDS))
+
+    def sequences(self, i):
+        """Rebuild the eight primer sequences of row `i` as a dict (name -> sequence)."""
+        return dict(zip(PRIMER_NAMES, build_sequences(self.arms, *self.coords(i))))
+
+    def sort(self, by="dg_error"):
+        """New table sorted by a column (stable, so ties keep search order)."""
+        return self[np.argsort(self.rows[by], kind="stable")]
+
+    def to_primers(self, i):
+        """Primers object of row `i` (dg_error taken from the table, nothing is recomputed)."""
+        from gibson_search import Primers
+        coord = self.coords(i)
+        return Primers(*build_sequences(self.arms, *coord), coord[:2], dg_error=self.rows[i]["dg_error"])
+
+    def to_primers_list(self):
+        return [self.to_primers(i) for i in range(len(self))]
+
+    def report(self, i):
+        self.to_primers(i).report()
+
+    def show_primers(self, i):
+        self.to_primers(i).show_primers()
+
+    def save(self, path):
+        np.savez_compressed(path, rows=self.rows, arm_names=list(self.arms), arm_seqs=list(self.arms.values()))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arms = dict(zip(data["arm_names"].tolist(), data["arm_seqs"].tolist()))
+            return cls(arms, data["rows"])
+
+
+def binding_tm_qc(table, tm_min=58.0, tm_max=64.0, max_delta=2.0):
+    """
+    Vectorized binding-Tm part of primers_pass_qc_simple: mask of the rows whose
+    three pairs all have binding Tm in [tm_min, tm_max] with F/R within ±max_delta.
+    Uses the precomputed tm_bind columns, no primer3 calls.
+    """
+    rows = table.rows
+    ok = np.ones(len(rows), dtype=bool)
+    for _, fwd, rev in PAIRS:
+        f_tm = rows[f"tm_bind_{fwd}"]
+        r_tm = rows[f"tm_bind_{rev}"]
+        ok &= (tm_min <= f_tm) & (f_tm <= tm_max) & (tm_min <= r_tm) & (r_tm <= tm_max) & (np.abs(f_tm - r_tm) <= max_delta)
+    return ok
+
+
+class TopK:
+    """
+    The `k` best candidates seen so far, fed one CandidateTable chunk at a time.
+
+    Memory stays O(k + chunk). Ties in the score are broken by search order
+    (start_left, start_right, overhang lengths), so the result does not depend
+    on the order in which shards finish.
+
+    Parameters
+    ----------
+    arms : dict
+        Arm sequences of the tables that will be pushed.
+    k : int
+        Number of candidates to keep.
+    by : str or callable
+        Column to minimize, or a function ``rows -> scores`` (lower is better).
+    """
+
+    def __init__(self, arms, k=50, by="dg_error"):
+        self.arms = arms
+        self.k = k
+        self.by = by
+        self.rows = np.zeros(0, dtype=CANDIDATE_DTYPE)
+
+    def _scores(self, rows):
+        return self.by(rows) if callable(self.by) else rows[self.by]
+
+    def push(self, table):
+        if not len(table):
+            return
+        rows = np.concatenate([self.rows, table.rows])
+        #np.lexsort sorts by the last key first
+        order = np.lexsort([rows[f] for f in reversed(("start_left", "start_right") + LENGTH_FIELDS)]
+                           + [self._scores(rows)])
+        self.rows = rows[order[:self.k]]
+
+    def table(self):
+        """The current shortlist, best first."""
+        return CandidateTable(self.arms, self.rows.copy())
+
+    def __len__(self):
+        return len(self.rows)
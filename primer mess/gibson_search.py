@@ -0,0 +1,484 @@
+# gibson_search.py
+"""
+Overhang search for the Gibson assembly of the HDR arms and the AF insert.
+
+Check file "naming convention.pdf" for the orientation of the eight primers.
+The search space is start_left × start_right × 4 overhang lengths; it is split
+into one shard per (start_left, start_right) and the shards run in a process pool.
+Within a shard the default "prune" mode checks every constraint at the outermost
+loop level where its inputs are fixed and skips whole subtrees on a failure;
+"bruteforce" is the original loop, kept as the reference; "matrix" computes
+every reachable heterodimer in one parallel batch first (see hetero_screen.py).
+
+Usage (from this folder):
+    arms = read_arms()
+    possible_primers = run_search(arms, range(18, 23), latest_start_HDR=30, workers=16)
+    #compact NumPy table instead of one Primers object per hit (see candidate_table.py)
+    table = run_search(arms, range(18, 23), 30, output="table")
+    #binding-Tm QC and the 50 best by dg_error in the same pass, O(k) memory
+    shortlist = run_search(arms, range(18, 23), 30, qc=binding_tm_qc, top_k=50, output="table")
+    #or stream into a resumable on-disk store (see primer_store.py)
+    store = run_search(arms, range(18, 23), 30, store=ResultStore("primers.sqlite"))
+"""
+
+import multiprocessing as mp
+import os
+import signal
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import primer3
+
+import primer_tools
+from candidate_table import CandidateTable, TopK
+from hetero_screen import HeterodimerScreen, search_shard_matrix
+from primer_store import search_params
+from window_index import WindowIndex, reverse_complement
+from primer_tools import (analyze_pair, binding_region, build_sequences, calc_tm, check_pair,
+                          check_heterodimer, check_primer)
+
+
+ARM_NAMES = ("leftHDR", "rightHDR", "leftAF", "rightAF")
+
+
+def read_arms(folder="."):
+    """Read the four arm sequences (leftHDR.txt, ...) into a dict."""
+    folder = Path(folder)
+    return {name: Path(folder, f"{name}.txt").read_text(encoding="utf-8") for name in ARM_NAMES}
+
+
+class Primers:
+    def __init__(self, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF,
+                 HDRfw, HDRrv, AFfw, AFrv, hdr_starts=(0, 0), dg_error=None):
+        self.oh_leftHDR  = oh_leftHDR.upper()
+        self.oh_rightHDR = oh_rightHDR.upper()
+        self.oh_leftAF   = oh_leftAF.upper()
+        self.oh_rightAF  = oh_rightAF.upper()
+        self.HDRfw = HDRfw.upper()
+        self.HDRrv = HDRrv.upper()
+        self.AFfw  = AFfw
+        self.AFrv  = AFrv
+        self.hdr_starts = hdr_starts
+
+        #already known (e.g. from a CandidateTable row) - skip the 15 ΔG lookups
+        if dg_error is not None:
+            self.dg_error = dg_error
+            return
+
+        pairs = [
+            (self.oh_leftHDR, self.oh_rightHDR),  # HDR-only tails
+            (self.HDRfw,      self.HDRrv),        # HDR Gibson pair
+            (self.AFfw,       self.AFrv),         # AF Gibson pair
+        ]
+
+        dGs = []
+        for fwd, rev in pairs:
+            stats = analyze_pair(fwd, rev)
+            dGs += [
+                stats["forward"]["hairpin_dg"],
+                stats["forward"]["homodimer_dg"],
+                stats["reverse"]["hairpin_dg"],
+                stats["reverse"]["homodimer_dg"],
+                stats["heterodimer_dg"],
+            ]
+
+        self.dg_error = (np.array(dGs)**2).sum()
+
+    def report(self):
+        print(f"\n🔬 Primer Pair Report (HDR starts: {self.hdr_starts})\n")
+        pairs = [
+            ("HDR-only", self.oh_leftHDR, self.oh_rightHDR),
+            ("HDR",      self.HDRfw,      self.HDRrv),
+            ("AF",       self.AFfw,       self.AFrv),
+        ]
+
+        for label, fwd, rev in pairs:
+            stats = analyze_pair(fwd, rev)
+            print(f"🧪 {label}")
+            print(f"  FWD (len={len(fwd)}): Tm={stats['forward']['tm']:.1f}°C | "
+                  f"ΔG_hairpin={stats['forward']['hairpin_dg']:.2f} | "
+                  f"ΔG_homodimer={stats['forward']['homodimer_dg']:.2f}")
+            print(f"  REV (len={len(rev)}): Tm={stats['reverse']['tm']:.1f}°C | "
+                  f"ΔG_hairpin={stats['reverse']['hairpin_dg']:.2f} | "
+                  f"ΔG_homodimer={stats['reverse']['homodimer_dg']:.2f}")
+            print(f"  Heterodimer ΔG = {stats['heterodimer_dg']:.2f} kcal/mol\n")
+
+    def show_primers(self):
+        """Pretty-print all eight primer sequences with length and Tm."""
+        primers = {
+            "oh_leftHDR":  self.oh_leftHDR,
+            "oh_rightHDR": self.oh_rightHDR,
+            "oh_leftAF":   self.oh_leftAF,
+            "oh_rightAF":  self.oh_rightAF,
+            "HDRfw":       self.HDRfw,
+            "HDRrv":       self.HDRrv,
+            "AFfw":        self.AFfw,
+            "AFrv":        self.AFrv,
+        }
+
+        print("\n🧬 Primer list")
+        print("┌────────────┬─────────────────────────────────────────┬───────┬──────┐")
+        print("│ Name       │ Sequence                                │  Len  │  Tm  │")
+        print("├────────────┼─────────────────────────────────────────┼───────┼──────┤")
+
+        for name, seq in primers.items():
+            tm_val = primer3.bindings.calc_tm(seq)                 # uses primer3 (full primer)
+            print(f"│ {name:<10} │ {seq:<41} │ {len(seq):>4} │ {tm_val:5.1f} │")
+
+        print("└────────────┴─────────────────────────────────────────┴───────┴──────┘\n")
+
+    def __repr__(self):
+        return f"Primers(ΔG error={self.dg_error:.2f}, HDR starts={self.hdr_starts})"
+
+
+def primers_pass_qc_simple(pr: Primers, verbose: bool = False) -> bool:
+    """
+    Return True if every primer pair in `pr` passes:
+      • binding-region Tm 58–64 °C, F-R within ±2 °C
+      • hairpin ΔG  > −3  kcal/mol
+      • homo- & heterodimer ΔG > −9 kcal/mol
+    Overhang-Tm is **NOT** checked.
+
+    Only the Tm part is evaluated here (the ΔG limits are the search constraints).
+    For search results use candidate_table.binding_tm_qc, which does the same
+    on the precomputed columns.
+    """
+    pairs = [
+        ("HDR-only", pr.oh_leftHDR, pr.oh_rightHDR),
+        ("HDR",      pr.HDRfw,      pr.HDRrv),
+        ("AF",       pr.AFfw,       pr.AFrv),
+    ]
+
+    ok = True
+    for label, fwd, rev in pairs:
+
+        f_tm = calc_tm(binding_region(fwd))
+        r_tm = calc_tm(binding_region(rev))
+        if not (58 <= f_tm <= 64 and 58 <= r_tm <= 64 and abs(f_tm - r_tm) <= 2):
+            ok = False
+            if verbose:
+                print(f"✖ {label}: binding Tm F={f_tm:.1f} °C, R={r_tm:.1f} °C")
+
+
+    if verbose and ok:
+        print("✓ passes simplified QC")
+    return ok
+
+
+def search_shard(arms, start_left, start_right, range_overhang, memo=None, windows=None):
+    """
+    Brute-force all overhang lengths for one (start_left, start_right).
+    This is the original loop, kept as the reference: `memo` and `windows` are unused.
+
+    Returns ``(accepted, stats)`` where `accepted` lists the coordinates
+    ``(start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF)``
+    of the accepted candidates in the order the serial six-deep loop finds them.
+    """
+    accepted = []
+    stats = Counter()
+    for oh_leftHDR in range_overhang:
+        for oh_rightHDR in range_overhang:
+            for oh_leftAF in range_overhang:
+                for oh_rightAF in range_overhang:
+                    seqs = build_sequences(arms, start_left, start_right,
+                                           oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF)
+                    (overhang_leftHDR, overhang_rightHDR, _, _, HDRfw, HDRrv, AFfw, AFrv) = seqs
+                    stats["candidates"] += 1
+                    if check_pair(HDRfw, HDRrv) and check_pair(AFfw, AFrv) and check_pair(overhang_leftHDR, overhang_rightHDR):
+                        accepted.append((start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF))
+    return accepted, stats
+
+
+def search_shard_pruned(arms, start_left, start_right, range_overhang, memo=None, windows=None):
+    """
+    Branch-and-bound version of `search_shard` with the same accepted list.
+
+    check_pair(...) of the three pairs splits into independent constraints:
+
+        oh_leftHDR self        depends on start_left, oh_leftHDR
+        oh_rightHDR self       depends on start_right, oh_rightHDR
+        HDR-only heterodimer   depends on both of the above
+        HDRfw / AFrv self      depends on start_left, oh_leftHDR, oh_rightAF
+        AFfw / HDRrv self      depends on start_right, oh_rightHDR, oh_leftAF
+        HDR / AF heterodimer   depends on everything
+
+    Each one runs once at the outermost loop where its inputs are fixed, and a
+    failure skips the whole subtree below it. ``stats["pruned: <constraint>"]``
+    counts the candidates removed by the first constraint that failed.
+    `memo` caches verdicts by sequence and can be shared between shards;
+    `windows` is the WindowIndex the overhangs are looked up in (built for
+    this shard if not given).
+    """
+    memo = {} if memo is None else memo
+    if windows is None:
+        windows = WindowIndex(arms, range_overhang, max(start_left, start_right) + 1)
+
+    def primer_ok(seq):
+        key = ("primer", seq)
+        if key not in memo:
+            memo[key] = check_primer(seq)
+        return memo[key]
+
+    def hetero_ok(fwd, rev):
+        key = ("hetero", fwd, rev)
+        if key not in memo:
+            memo[key] = check_heterodimer(fwd, rev)
+        return memo[key]
+
+    rc = reverse_complement
+
+    n = len(range_overhang)
+    accepted = []
+    stats = Counter(candidates=n ** 4)
+
+    #every overhang of this shard, looked up once (see build_sequences for the orientation)
+    left_hdr = {a: windows.primer("leftHDR", start_left, a) for a in range_overhang}
+    right_hdr = {b: windows.primer("rightHDR", start_right, b) for b in range_overhang}
+    left_af = {c: windows.primer("leftAF", 0, c) for c in range_overhang}
+    right_af = {d: windows.primer("rightAF", 0, d) for d in range_overhang}
+
+    for oh_leftHDR in range_overhang:
+        overhang_leftHDR = left_hdr[oh_leftHDR]
+        if not primer_ok(overhang_leftHDR):
+            stats["pruned: oh_leftHDR self"] += n ** 3
+            continue
+
+        #HDRfw and AFrv do not depend on the right HDR / left AF overhangs
+        HDRfw = {d: right_af[d] + overhang_leftHDR for d in range_overhang}
+        AFrv = {d: rc(HDRfw[d]) for d in range_overhang}
+        valid_rightAF = [d for d in range_overhang if primer_ok(HDRfw[d]) and primer_ok(AFrv[d])]
+
+        for oh_rightHDR in range_overhang:
+            overhang_rightHDR = right_hdr[oh_rightHDR]
+            if not primer_ok(overhang_rightHDR):
+                stats["pruned: oh_rightHDR self"] += n ** 2
+                continue
+            if not hetero_ok(overhang_leftHDR, overhang_rightHDR):
+                stats["pruned: HDR-only heterodimer"] += n ** 2
+                continue
+
+            for oh_leftAF in range_overhang:
+                AFfw = overhang_rightHDR + left_af[oh_leftAF]
+                HDRrv = rc(AFfw)
+                if not (primer_ok(AFfw) and primer_ok(HDRrv)):
+                    stats["pruned: AFfw/HDRrv self"] += n
+                    continue
+                stats["pruned: HDRfw/AFrv self"] += n - len(valid_rightAF)
+
+                for oh_rightAF in valid_rightAF:
+                    if not hetero_ok(HDRfw[oh_rightAF], HDRrv):
+                        stats["pruned: HDR heterodimer"] += 1
+                        continue
+                    if not hetero_ok(AFfw, AFrv[oh_rightAF]):
+                        stats["pruned: AF heterodimer"] += 1
+                        continue
+                    accepted.append((start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF))
+    return accepted, stats
+
+
+SEARCH_MODES = {"bruteforce": search_shard, "prune": search_shard_pruned, "matrix": search_shard_matrix}
+
+
+def _search_measured(mode, arms, start_left, start_right, range_overhang, memo, windows):
+    """
+    Run one shard and return its accepted candidates as a CandidateTable, with
+    the number of thermodynamics lookups / primer3 calls added to its stats.
+    """
+    cache = primer_tools.get_cache()
+    before = cache.stats()
+    coords, stats = SEARCH_MODES[mode](arms, start_left, start_right, range_overhang, memo, windows)
+    accepted = CandidateTable.from_coords(arms, coords, windows=windows)
+    after = cache.stats()
+    for k in ("hits", "disk_hits", "misses"):
+        stats["thermo_lookups"] += after[k] - before[k]
+    stats["primer3_calls"] += after["misses"] - before["misses"]
+    stats["accepted"] += len(accepted)
+    return accepted, stats
+
+
+def print_search_stats(stats):
+    """Summary of a run_search `stats` Counter: lookups and candidates pruned per constraint."""
+    candidates = stats["candidates"]
+    print(f"{candidates} candidates, {stats['accepted']} accepted, "
+          f"{stats['thermo_lookups']} thermodynamics lookups, {stats['primer3_calls']} primer3 calls")
+    if "qc_passed" in stats:
+        print(f"  {stats['qc_passed']} passed QC")
+    for key in sorted(k for k in stats if k.startswith("pruned: ")):
+        share = 100.0 * stats[key] / candidates if candidates else 0.0
+        print(f"  {key[len('pruned: '):]:<24} {stats[key]:>10}  ({share:.1f} %)")
+
+
+#state of a pool worker, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(arms, range_overhang, cache_path, mode, windows):
+    # Ctrl-C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cache_path is not None:
+        primer_tools.configure_cache(cache_path)
+    _worker.update(arms=arms, range_overhang=range_overhang, mode=mode, memo={}, windows=windows)
+
+
+def _run_shard(job):
+    index, (start_left, start_right) = job
+    accepted, stats = _search_measured(_worker["mode"], _worker["arms"], start_left, start_right,
+                                       _worker["range_overhang"], _worker["memo"], _worker["windows"])
+    primer_tools.get_cache().flush()
+    #only the structured array goes back to the parent, not the arms
+    return index, accepted.rows, stats
+
+
+def make_shards(latest_start_HDR):
+    """All (start_left, start_right) shards in the order of the serial loop."""
+    return [(start_left, start_right)
+            for start_left in range(latest_start_HDR)
+            for start_right in range(latest_start_HDR)]
+
+
+def _format_eta(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+
+def run_search(arms, range_overhang, latest_start_HDR, workers=None, mode="prune",
+               cache_path="thermo_cache.sqlite", progress_every=10.0, stats=None, store=None,
+               output="primers", qc=None, top_k=None, score="dg_error"):
+    """
+    Run the overhang search over all shards in a process pool.
+
+    Parameters
+    ----------
+    arms : dict
+        Arm sequences as returned by `read_arms`.
+    range_overhang : range
+        Overhang lengths tried for each of the four overhangs.
+    latest_start_HDR : int
+        How many bases of the HDR arms can be skipped.
+    workers : int or None
+        Number of processes (default: all cores). ``workers=1`` runs in-process.
+    mode : {"prune", "bruteforce", "matrix"}
+        Shard search, see `search_shard_pruned` / `search_shard` /
+        hetero_screen.search_shard_matrix. All accept exactly the same
+        candidates. "matrix" uses the workers for one batch of heterodimer
+        ΔGs up front and then runs the shards in-process as array lookups.
+    cache_path : str or None
+        SQLite thermodynamics cache shared by the workers (see primer_tools).
+    progress_every : float
+        Seconds between progress lines; ``None`` disables them (and the final summary).
+    stats : collections.Counter, optional
+        Filled with candidate, lookup and per-constraint pruning counts.
+    store : primer_store.ResultStore, optional
+        Stream each finished shard into this store instead of keeping the
+        results in memory. Shards the store already holds are skipped, so
+        calling run_search again with the same store resumes an interrupted run.
+    output : {"primers", "table"}
+        Return a list of Primers or one compact CandidateTable.
+    qc : callable, optional
+        Stage applied to every shard as it arrives: ``qc(table) -> bool mask``,
+        e.g. candidate_table.binding_tm_qc. Rejected rows are dropped before
+        they reach the store, the shortlist or the result.
+    top_k : int, optional
+        Keep only the `top_k` best candidates (lowest `score`) while the search
+        runs, instead of collecting every hit.
+    score : str or callable
+        Ranking for `top_k`: a CandidateTable column or ``rows -> scores``.
+
+    Returns
+    -------
+    list of Primers, CandidateTable or ResultStore
+        Accepted candidates in the same order as the serial loop, whatever the
+        mode, worker count or completion order. With `top_k` the shortlist,
+        best first (the store, if given, still receives every QC-passed hit);
+        otherwise `store` itself if one is given.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {sorted(SEARCH_MODES)}")
+    if output not in ("primers", "table"):
+        raise ValueError("output must be 'primers' or 'table'")
+    shards = make_shards(latest_start_HDR)
+    skipped = set()
+    if store is not None:
+        store.begin_run(search_params(arms, range_overhang, latest_start_HDR))
+        skipped = store.completed_shards()
+        if skipped and progress_every is not None:
+            print(f"Resuming: {len(skipped)}/{len(shards)} shards already in {store.path}")
+    workers = workers or os.cpu_count() or 1
+    per_shard = len(range_overhang) ** 4
+    total = len(shards) * per_shard
+    stats = Counter() if stats is None else stats
+    #every overhang window and binding-region Tm, computed once and shared with the workers
+    windows = WindowIndex(arms, range_overhang, latest_start_HDR)
+    shortlist = TopK(arms, top_k, by=score) if top_k is not None else None
+
+    results = {}
+    done = len(skipped)
+    t0 = last_print = time.monotonic()
+
+    def _progress(force=False):
+        nonlocal last_print
+        now = time.monotonic()
+        if progress_every is None or (not force and now - last_print < progress_every):
+            return
+        last_print = now
+        elapsed = now - t0
+        evaluated = stats["candidates"]
+        remaining = total - evaluated - len(skipped) * per_shard
+        rate = evaluated / elapsed if elapsed > 0 else 0.0
+        eta = remaining / rate if rate > 0 else 0.0
+        print(f"[{done}/{len(shards)} shards] {total - remaining}/{total} candidates, {stats['accepted']} accepted, "
+              f"{rate:.0f} cand/s, elapsed {_format_eta(elapsed)}, ETA {_format_eta(eta)}")
+
+    def _collect(index, shard_accepted, shard_stats):
+        nonlocal done
+        if qc is not None:
+            shard_accepted = shard_accepted[qc(shard_accepted)]
+            shard_stats["qc_passed"] += len(shard_accepted)
+        if store is not None:
+            store.add_shard(shards[index], shard_accepted)
+        if shortlist is not None:
+            shortlist.push(shard_accepted)
+        elif store is None:
+            results[index] = shard_accepted
+        done += 1
+        stats.update(shard_stats)
+        _progress(force=done == len(shards))
+
+    jobs = [(index, shard) for index, shard in enumerate(shards) if shard not in skipped]
+    if workers == 1 or mode == "matrix":
+        if cache_path is not None and primer_tools.get_cache().path != cache_path:
+            primer_tools.configure_cache(cache_path)
+        memo = {}
+        if mode == "matrix" and jobs:
+            cache = primer_tools.get_cache()
+            before = cache.stats()
+            memo["screen"] = HeterodimerScreen(windows, workers=workers)
+            after = cache.stats()
+            for k in ("hits", "disk_hits", "misses"):
+                stats["thermo_lookups"] += after[k] - before[k]
+            stats["primer3_calls"] += after["misses"] - before["misses"]
+        for index, (start_left, start_right) in jobs:
+            _collect(index, *_search_measured(mode, arms, start_left, start_right, range_overhang, memo, windows))
+    else:
+        #Pool.__exit__ terminates the workers, also on Ctrl-C
+        with mp.Pool(workers, initializer=_init_worker,
+                     initargs=(arms, range_overhang, cache_path, mode, windows)) as pool:
+            try:
+                for index, shard_rows, shard_stats in pool.imap_unordered(_run_shard, jobs):
+                    _collect(index, CandidateTable(arms, shard_rows), shard_stats)
+            except KeyboardInterrupt:
+                print(f"Interrupted after {done}/{len(shards)} shards - stopping workers")
+                raise
+
+    if progress_every is not None:
+        print_search_stats(stats)
+    if shortlist is not None:
+        table = shortlist.table()
+    elif store is not None:
+        return store
+    else:
+        table = CandidateTable.concat(arms, [results[index] for index in range(len(shards))])
+    return table if output == "table" else table.to_primers_list()
@@ -0,0 +1,235 @@
+# hetero_screen.py
+"""
+Batch heterodimer screening for the overhang search.
+
+The pruned search asks for one heterodimer ΔG at a time, deep inside the
+loops. `HeterodimerScreen` instead works out up front which (fwd, rev) oligo
+pairs the search can reach (both primers pass their self checks, and for the
+HDR / AF pairs also the HDR-only heterodimer), computes all of them in one
+batch spread over worker processes, and stores the ΔGs in dense matrices
+indexed by window ID. A shard is then a few NumPy lookups:
+
+    table = run_search(arms, range_overhang, latest_start_HDR, mode="matrix", output="table")
+
+`cross_dimer_check` / `cross_dimer_qc` add the check the search never did:
+every primer of a final set against every other one, not just the three
+designed pairs.
+"""
+
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+
+from candidate_table import PRIMER_NAMES
+from primer_tools import HETERODIMER_THRESHOLD, calc_heterodimer_dg_batch, check_primer
+from window_index import WindowIndex, reverse_complement
+
+
+class HeterodimerScreen:
+    """
+    Self-check verdicts and heterodimer ΔG matrices for every shard of a search.
+
+    Window IDs
+    ----------
+    ``fw_id[start_left, a, d]`` numbers the valid (HDRfw, AFrv) windows and
+    ``rv_id[start_right, b, c]`` the valid (AFfw, HDRrv) windows, with
+    a, b, c, d the oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF lengths as
+    offsets into range_overhang. A window is valid if its HDR overhang and
+    both of its primers pass check_primer; invalid windows have ID -1, which
+    points at an all-False padding row/column of the matrices.
+
+    Attributes
+    ----------
+    left_ok, right_ok : numpy.ndarray
+        check_primer of oh_leftHDR ``[start_left, a]`` / oh_rightHDR ``[start_right, b]``.
+    hdr_only_dg : numpy.ndarray
+        Heterodimer ΔG (kcal/mol) of oh_leftHDR/oh_rightHDR, ``[start_left, a, start_right, b]``.
+    hdr_dg, af_dg : numpy.ndarray
+        HDRfw/HDRrv and AFfw/AFrv heterodimer ΔG (kcal/mol), ``[fw_id, rv_id]``.
+        NaN where the search never gets that far.
+    stats : collections.Counter
+        ``pairs`` (heterodimers the search can reach) and ``computed`` (distinct
+        sequence pairs among them).
+
+    Parameters
+    ----------
+    windows : window_index.WindowIndex
+        Overhang windows of the search.
+    workers : int
+        Processes for the heterodimer batch (see calc_heterodimer_dg_batch).
+    """
+
+    def __init__(self, windows, workers=1):
+        self.windows = windows
+        self.lengths = windows.lengths
+        self.stats = Counter()
+        starts = range(windows.latest_start_HDR)
+        n = len(self.lengths)
+        left_af = [windows.primer("leftAF", 0, c) for c in self.lengths]
+        right_af = [windows.primer("rightAF", 0, d) for d in self.lengths]
+
+        self.left = [[windows.primer("leftHDR", s, a) for a in self.lengths] for s in starts]
+        self.right = [[windows.primer("rightHDR", s, b) for b in self.lengths] for s in starts]
+        self.left_ok = np.array([[check_primer(seq) for seq in row] for row in self.left], dtype=bool)
+        self.right_ok = np.array([[check_primer(seq) for seq in row] for row in self.right], dtype=bool)
+
+        #valid windows: (HDRfw, AFrv) for the fw side, (AFfw, HDRrv) for the rv side
+        fw_windows, rv_windows = [], []
+        self.fw_id = np.full((len(starts), n, n), -1, dtype=np.int64)
+        self.rv_id = np.full((len(starts), n, n), -1, dtype=np.int64)
+        for s in starts:
+            for a in range(n):
+                if not self.left_ok[s, a]:
+                    continue
+                for d in range(n):
+                    HDRfw = right_af[d] + self.left[s][a]
+                    AFrv = reverse_complement(HDRfw)
+                    if check_primer(HDRfw) and check_primer(AFrv):
+                        self.fw_id[s, a, d] = len(fw_windows)
+                        fw_windows.append((s, a, HDRfw, AFrv))
+            for b in range(n):
+                if not self.right_ok[s, b]:
+                    continue
+                for c in range(n):
+                    AFfw = self.right[s][b] + left_af[c]
+                    HDRrv = reverse_complement(AFfw)
+                    if check_primer(AFfw) and check_primer(HDRrv):
+                        self.rv_id[s, b, c] = len(rv_windows)
+                        rv_windows.append((s, b, AFfw, HDRrv))
+
+        #HDR-only pairs: every valid oh_leftHDR x valid oh_rightHDR
+        left_idx = np.argwhere(self.left_ok)
+        right_idx = np.argwhere(self.right_ok)
+        pairs = [(self.left[s][a], self.right[t][b]) for s, a in left_idx for t, b in right_idx]
+        self.hdr_only_dg = np.full((len(starts), n, len(starts), n), np.nan)
+        if pairs:
+            dg = np.array(calc_heterodimer_dg_batch(pairs, workers=workers)) / 1000.0
+            dg = dg.reshape(len(left_idx), len(right_idx))
+            self.hdr_only_dg[left_idx[:, 0, None], left_idx[:, 1, None], right_idx[None, :, 0], right_idx[None, :, 1]] = dg
+        self.hdr_only_ok = self.hdr_only_dg >= HETERODIMER_THRESHOLD
+        self.stats["pairs"] += len(pairs)
+
+        #HDR / AF pairs: valid fw x valid rv windows whose HDR-only pair passes
+        fw_s = np.array([w[0] for w in fw_windows], dtype=np.int64)
+        fw_a = np.array([w[1] for w in fw_windows], dtype=np.int64)
+        rv_s = np.array([w[0] for w in rv_windows], dtype=np.int64)
+        rv_b = np.array([w[1] for w in rv_windows], dtype=np.int64)
+        needed = np.argwhere(self.hdr_only_ok[fw_s[:, None], fw_a[:, None], rv_s[None, :], rv_b[None, :]])
+        pairs = [(fw_windows[i][2], rv_windows[j][3]) for i, j in needed]      # HDRfw, HDRrv
+        pairs += [(rv_windows[j][2], fw_windows[i][3]) for i, j in needed]     # AFfw, AFrv
+        dg = np.array(calc_heterodimer_dg_batch(pairs, workers=workers)) / 1000.0
+        self.stats["pairs"] += len(pairs)
+        self.stats["computed"] = len(set(pairs))
+
+        #one padding row/column so that ID -1 looks up NaN / False
+        shape = (len(fw_windows) + 1, len(rv_windows) + 1)
+        self.hdr_dg = np.full(shape, np.nan)
+        self.af_dg = np.full(shape, np.nan)
+        if len(needed):
+            self.hdr_dg[needed[:, 0], needed[:, 1]] = dg[:len(needed)]
+            self.af_dg[needed[:, 0], needed[:, 1]] = dg[len(needed):]
+        self.hdr_ok = self.hdr_dg >= HETERODIMER_THRESHOLD
+        self.af_ok = self.af_dg >= HETERODIMER_THRESHOLD
+
+    def search_shard(self, start_left, start_right):
+        """
+        Accepted coordinates and pruning stats of one shard, with the same
+        order and per-constraint attribution as gibson_search.search_shard_pruned.
+        """
+        n = len(self.lengths)
+        fw = self.fw_id[start_left]           # [a, d]
+        rv = self.rv_id[start_right]          # [b, c]
+        fw4 = fw[:, None, None, :]            # -> [a, b, c, d], the loop order
+        rv4 = rv[None, :, :, None]
+        constraints = [
+            ("oh_leftHDR self", self.left_ok[start_left][:, None, None, None]),
+            ("oh_rightHDR self", self.right_ok[start_right][None, :, None, None]),
+            ("HDR-only heterodimer", self.hdr_only_ok[start_left, :, start_right, :][:, :, None, None]),
+            ("AFfw/HDRrv self", rv4 >= 0),
+            ("HDRfw/AFrv self", fw4 >= 0),
+            ("HDR heterodimer", self.hdr_ok[fw4, rv4]),
+            ("AF heterodimer", self.af_ok[fw4, rv4]),
+        ]
+        stats = Counter(candidates=n ** 4)
+        remaining = np.ones((n,) * 4, dtype=bool)
+        for name, ok in constraints:
+            failed = int((remaining & ~ok).sum())
+            if failed:
+                stats[f"pruned: {name}"] += failed
+            remaining &= ok
+        lengths = np.array(self.lengths)
+        accepted = [(start_left, start_right, *(int(x) for x in lengths[idx])) for idx in np.argwhere(remaining)]
+        return accepted, stats
+
+
+def search_shard_matrix(arms, start_left, start_right, range_overhang, memo=None, windows=None):
+    """
+    `search_shard` through a HeterodimerScreen (same accepted list).
+
+    The screen is kept in ``memo["screen"]``; run_search builds it once for
+    all shards (in parallel), a lone call builds one for this shard.
+    """
+    memo = {} if memo is None else memo
+    if "screen" not in memo:
+        if windows is None:
+            windows = WindowIndex(arms, range_overhang, max(start_left, start_right) + 1)
+        memo["screen"] = HeterodimerScreen(windows)
+    return memo["screen"].search_shard(start_left, start_right)
+
+
+def _named(seqs):
+    return dict(seqs) if isinstance(seqs, dict) else dict(zip(PRIMER_NAMES, seqs))
+
+
+def _cross_pairs(named):
+    #pairs that are complementary by construction (e.g. HDRfw / AFrv, the Gibson overlap) are skipped
+    return [(x, y) for x, y in combinations(PRIMER_NAMES, 2)
+            if reverse_complement(named[x]) not in named[y] and reverse_complement(named[y]) not in named[x]]
+
+
+def cross_dimers(seqs, workers=1):
+    """
+    All-vs-all heterodimer ΔG (kcal/mol) between the eight primers of one set.
+
+    `seqs` is a dict name -> sequence (e.g. CandidateTable.sequences(i)) or the
+    eight sequences in PRIMER_NAMES order. Returns ``{(name1, name2): ΔG}``;
+    pairs where one primer contains the reverse complement of the other are
+    left out, they anneal by design.
+    """
+    named = _named(seqs)
+    pairs = _cross_pairs(named)
+    dgs = calc_heterodimer_dg_batch([(named[x], named[y]) for x, y in pairs], workers=workers)
+    return {pair: dg / 1000.0 for pair, dg in zip(pairs, dgs)}
+
+
+def cross_dimer_check(seqs, threshold=HETERODIMER_THRESHOLD, verbose=False):
+    """True if no two primers of the set form a heterodimer below `threshold` (kcal/mol)."""
+    failed = {pair: dg for pair, dg in cross_dimers(seqs).items() if dg < threshold}
+    if verbose:
+        for (x, y), dg in failed.items():
+            print(f"✖ {x} / {y}: heterodimer ΔG = {dg:.2f} kcal/mol")
+        if not failed:
+            print("✓ no cross-dimers")
+    return not failed
+
+
+def cross_dimer_qc(table, threshold=HETERODIMER_THRESHOLD, workers=1):
+    """
+    cross_dimer_check for every row of a CandidateTable as a bool mask; the
+    ΔGs of all rows go through one batch. Usable as a run_search `qc` stage.
+    """
+    per_row = []
+    pairs = []
+    for i in range(len(table)):
+        named = table.sequences(i)
+        row_pairs = [(named[x], named[y]) for x, y in _cross_pairs(named)]
+        per_row.append(len(row_pairs))
+        pairs += row_pairs
+    dgs = np.array(calc_heterodimer_dg_batch(pairs, workers=workers)) / 1000.0
+    ok = np.ones(len(table), dtype=bool)
+    offset = 0
+    for i, count in enumerate(per_row):
+        ok[i] = (dgs[offset:offset + count] >= threshold).all()
+        offset += count
+    return ok
@@ -0,0 +1,146 @@
+# primer_store.py
+"""
+Append-only SQLite store for overhang-search results.
+
+`run_search(..., store=ResultStore("primers.sqlite"))` streams every finished
+shard into the file in one transaction (its accepted candidates plus a row in
+`shards`), so an interrupted run resumes where it stopped. Queries run in SQL
+and only the requested rows are turned back into Primers:
+
+    store = ResultStore("primers.sqlite")
+    for row in store.top(50):
+        print(row["dg_error"], row["HDRfw"])
+    best = [store.to_primers(row) for row in store.top(3)]
+    in_range = store.binding_tm_between(58, 64, max_delta=2)
+"""
+
+import hashlib
+import json
+import sqlite3
+
+from candidate_table import BINDING_TM_PRIMERS, PAIRS, PRIMER_NAMES
+
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS shards (
+    start_left INTEGER NOT NULL,
+    start_right INTEGER NOT NULL,
+    accepted INTEGER NOT NULL,
+    PRIMARY KEY (start_left, start_right)
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY,
+    start_left INTEGER NOT NULL,
+    start_right INTEGER NOT NULL,
+    {", ".join(f"{name} TEXT NOT NULL" for name in PRIMER_NAMES)},
+    dg_error REAL NOT NULL,
+    {", ".join(f"tm_bind_{name} REAL NOT NULL" for name in BINDING_TM_PRIMERS)}
+);
+CREATE INDEX IF NOT EXISTS candidates_dg_error ON candidates (dg_error);
+CREATE INDEX IF NOT EXISTS candidates_shard ON candidates (start_left, start_right);
+"""
+
+
+def search_params(arms, range_overhang, latest_start_HDR):
+    """Parameters that must match for a store to be resumed (arms are hashed)."""
+    return {
+        "arms": {name: hashlib.sha1(seq.upper().encode()).hexdigest() for name, seq in sorted(arms.items())},
+        "range_overhang": [range_overhang.start, range_overhang.stop, range_overhang.step],
+        "latest_start_HDR": latest_start_HDR,
+    }
+
+
+class ResultStore:
+    """
+    Results of one search, backed by a SQLite file (WAL mode).
+
+    Parameters
+    ----------
+    path : str
+        Database file; created if missing, reopened (for resume/queries) otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60.0)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    ### writing (used by run_search)
+    def begin_run(self, params):
+        """Record the search parameters, or check them against the ones already stored."""
+        stored = self.conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+        encoded = json.dumps(params, sort_keys=True)
+        if stored is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('params', ?)", (encoded,))
+        elif stored["value"] != encoded:
+            raise ValueError(f"{self.path} holds results of a search with different parameters; "
+                             "use a new file to start a fresh run")
+
+    def completed_shards(self):
+        return {(r["start_left"], r["start_right"]) for r in self.conn.execute("SELECT start_left, start_right FROM shards")}
+
+    def add_shard(self, shard, table):
+        """Append the accepted candidates (a CandidateTable) of one shard and mark it complete, atomically."""
+        rows = [self._row(table, i) for i in range(len(table))]
+        columns = ["start_left", "start_right", *PRIMER_NAMES, "dg_error",
+                   *(f"tm_bind_{name}" for name in BINDING_TM_PRIMERS)]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO candidates ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            self.conn.execute("INSERT OR REPLACE INTO shards (start_left, start_right, accepted) VALUES (?, ?, ?)",
+                              (*shard, len(rows)))
+
+    @staticmethod
+    def _row(table, i):
+        row = table[i]
+        seqs = table.sequences(i)
+        return (int(row["start_left"]), int(row["start_right"]),
+                *(seqs[name] for name in PRIMER_NAMES),
+                float(row["dg_error"]),
+                *(float(row[f"tm_bind_{name}"]) for name in BINDING_TM_PRIMERS))
+
+    ### queries (rows are sqlite3.Row, fetched lazily)
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+
+    def query(self, where="1", params=(), order_by="start_left, start_right, id", limit=None):
+        """Iterate over candidate rows; `where`/`order_by` are SQL over the candidates columns."""
+        sql = f"SELECT * FROM candidates WHERE {where} ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.conn.execute(sql, params)
+
+    def all(self):
+        """All candidates in the order of the serial search loop."""
+        return self.query()
+
+    def top(self, n=50, by="dg_error"):
+        """The `n` best candidates by a column (ascending, e.g. lowest dg_error first)."""
+        return self.query(order_by=f"{by}, start_left, start_right, id", limit=n)
+
+    def binding_tm_between(self, tm_min=58.0, tm_max=64.0, max_delta=2.0, order_by="dg_error"):
+        """Candidates whose pairs all have binding Tm in [tm_min, tm_max] and F/R within ±max_delta."""
+        clauses = []
+        params = []
+        for _, fwd, rev in PAIRS:
+            for name in (fwd, rev):
+                clauses.append(f"tm_bind_{name} BETWEEN ? AND ?")
+                params += [tm_min, tm_max]
+            clauses.append(f"ABS(tm_bind_{fwd} - tm_bind_{rev}) <= ?")
+            params.append(max_delta)
+        return self.query(" AND ".join(clauses), params, order_by=order_by)
+
+    def to_primers(self, row):
+        """Rebuild the Primers object of one row."""
+        from gibson_search import Primers
+        return Primers(*(row[name] for name in PRIMER_NAMES), (row["start_left"], row["start_right"]),
+                       dg_error=row["dg_error"])
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,372 @@
+# primer_tools.py
+"""
+Minimal helper functions for primer QC
+
+Requires:
+    pip install primer3-py
+
+All primer3 thermodynamics go through a memo (`ThermoCache`) keyed by the
+sequence(s) and the salt/DNA conditions. The cache has an in-memory LRU tier
+and an optional on-disk SQLite tier (see `configure_cache`) that several
+worker processes can share and that survives a kernel restart.
+"""
+
+import atexit
+import multiprocessing as mp
+import os
+import sqlite3
+from collections import OrderedDict
+
+import primer3  # Python bindings to the Primer3 C core
+from Bio.Seq import Seq
+
+
+#primer3 defaults (salts/dNTPs in mM, oligo in nM) - used when no conditions are given
+DEFAULT_CONDITIONS = {"mv_conc": 50.0, "dv_conc": 1.5, "dntp_conc": 0.6, "dna_conc": 50.0}
+
+
+class ThermoCache:
+    """
+    Two-tier memo for primer3 results.
+
+    Parameters
+    ----------
+    path : str or None
+        SQLite file for the persistent tier. ``None`` keeps the cache in memory only.
+    maxsize : int
+        Number of entries kept in the in-memory LRU tier.
+    flush_every : int
+        New results are written to SQLite in batches of this size (and at exit),
+        so workers do not pay one transaction per primer3 call.
+    """
+
+    def __init__(self, path=None, maxsize=200_000, flush_every=1000):
+        self.path = path
+        self.maxsize = maxsize
+        self.flush_every = flush_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._pending = []
+        self._conn = None
+        self._pid = None
+
+    def _db(self):
+        if self.path is None:
+            return None
+        # a connection must not be shared across fork(), so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")       # concurrent readers + one writer
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS thermo (key TEXT PRIMARY KEY, value REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+            self._pending = []
+        return self._conn
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        if len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def lookup(self, key):
+        """Return the cached value for `key` from either tier, or None."""
+        value = self._lru.get(key)
+        if value is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return value
+
+        db = self._db()
+        if db is not None:
+            row = db.execute("SELECT value FROM thermo WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def put(self, key, value):
+        """Add a freshly computed value (counted as a miss)."""
+        self.misses += 1
+        self._remember(key, value)
+        if self._db() is not None:
+            self._pending.append((key, value))
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def get(self, key, compute):
+        """Return the cached value for `key`, calling `compute()` on a miss."""
+        value = self.lookup(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def flush(self):
+        """Write pending results to the SQLite tier."""
+        if not self._pending or self._conn is None or self._pid != os.getpid():
+            return
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO thermo (key, value) VALUES (?, ?)", self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "size": len(self._lru), "path": self.path}
+
+
+_cache = ThermoCache()
+
+
+def configure_cache(path=None, maxsize=200_000, flush_every=1000):
+    """
+    Replace the module cache, e.g. ``configure_cache("thermo_cache.sqlite")``
+    to share results between workers and across kernel restarts.
+    """
+    global _cache
+    _cache.close()
+    _cache = ThermoCache(path=path, maxsize=maxsize, flush_every=flush_every)
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+@atexit.register
+def _flush_cache():
+    _cache.close()
+
+
+def _conditions(conditions):
+    cond = dict(DEFAULT_CONDITIONS)
+    cond.update(conditions)
+    return cond
+
+
+def _key(kind, cond, *seqs):
+    return "|".join([kind, *(repr(float(cond[k])) for k in sorted(cond)), *seqs])
+
+
+### cached drop-ins for primer3 (same values and units as primer3: Tm in °C, ΔG in cal/mol)
+def calc_tm(seq, **conditions):
+    cond = _conditions(conditions)
+    return _cache.get(_key("tm", cond, seq), lambda: primer3.bindings.calc_tm(seq, **cond))
+
+
+def calc_hairpin_dg(seq, **conditions):
+    cond = _conditions(conditions)
+    return _cache.get(_key("hp", cond, seq), lambda: primer3.bindings.calc_hairpin(seq, **cond).dg)
+
+
+def calc_homodimer_dg(seq, **conditions):
+    cond = _conditions(conditions)
+    return _cache.get(_key("homo", cond, seq), lambda: primer3.bindings.calc_homodimer(seq, **cond).dg)
+
+
+def calc_heterodimer_dg(seq1, seq2, **conditions):
+    cond = _conditions(conditions)
+    return _cache.get(_key("het", cond, seq1, seq2),
+                      lambda: primer3.bindings.calc_heterodimer(seq1, seq2, **cond).dg)
+
+
+def _heterodimer_job(job):
+    seq1, seq2, cond = job
+    return primer3.bindings.calc_heterodimer(seq1, seq2, **cond).dg
+
+
+def calc_heterodimer_dg_batch(pairs, workers=1, chunksize=256, **conditions):
+    """
+    calc_heterodimer_dg for many ``(seq1, seq2)`` pairs at once.
+
+    Pairs that are not cached yet are computed in a pool of `workers`
+    processes and added to the cache, so later calc_heterodimer_dg calls hit.
+    Returns a list of ΔG values (cal/mol) in the order of `pairs`.
+    """
+    cond = _conditions(conditions)
+    keys = [_key("het", cond, seq1, seq2) for seq1, seq2 in pairs]
+    values = [_cache.lookup(key) for key in keys]
+    missing = {}                                  # key -> position of the first pair with it
+    for i, (key, value) in enumerate(zip(keys, values)):
+        if value is None and key not in missing:
+            missing[key] = i
+    jobs = [(*pairs[i], cond) for i in missing.values()]
+    if workers > 1 and len(jobs) > chunksize:
+        with mp.Pool(workers) as pool:
+            computed = pool.map(_heterodimer_job, jobs, chunksize=chunksize)
+    else:
+        computed = [_heterodimer_job(job) for job in jobs]
+    for key, value in zip(missing, computed):
+        _cache.put(key, value)
+    found = dict(zip(missing, computed))
+    return [found[key] if value is None else value for key, value in zip(keys, values)]
+
+
+def analyze_primer(seq, mv=50.0, dv=1.5, dntp=0.0, dna=250.0):
+    seq = seq.upper().replace(" ", "")
+
+    return {
+        "sequence": seq,
+        "tm": calc_tm(seq, mv_conc=mv, dv_conc=dv,
+                      dntp_conc=dntp, dna_conc=dna),
+        "hairpin_dg": calc_hairpin_dg(seq),           # cal/mol, as returned by primer3
+        "homodimer_dg": calc_homodimer_dg(seq),
+    }
+
+
+def analyze_pair(fwd: str, rev: str):
+    """Return ΔG (kcal/mol) for one primer pair."""
+    def _self_stats(seq):
+        return {
+            "hairpin_dg":  calc_hairpin_dg(seq) / 1000.0,
+            "homodimer_dg": calc_homodimer_dg(seq) / 1000.0,
+            "tm": calc_tm(seq),
+        }
+    f = _self_stats(fwd)
+    r = _self_stats(rev)
+    hetero = calc_heterodimer_dg(fwd, rev) / 1000.0
+    return {"forward": f, "reverse": r, "heterodimer_dg": hetero}
+
+
+def binding_region(seq, n=20):
+    """Template-binding part of a primer: the last `n` nt (or the whole primer if shorter)."""
+    return seq[-n:] if len(seq) > n else seq
+
+
+def print_stats(stats):
+    for side in ("forward", "reverse"):
+        s = stats[side]
+        print(f"{side:8}  Tm = {s['tm']:.1f} °C   "
+              f"ΔGhairpin = {s['hairpin_dg']:.1f} kcal/mol   "
+              f"ΔGhomodimer = {s['homodimer_dg']:.1f} kcal/mol ")
+
+    print(f"Heterodimer ΔG = {stats['heterodimer_dg']:.1f} kcal/mol")
+
+
+#acceptance thresholds (kcal/mol) used by check_pair and its components
+HAIRPIN_THRESHOLD = -3
+HOMODIMER_THRESHOLD = -9
+HETERODIMER_THRESHOLD = -9
+
+
+def check_primer(seq):
+    """Self-structure part of check_pair for one primer (hairpin and homodimer ΔG)."""
+    if calc_hairpin_dg(seq) / 1000.0 < HAIRPIN_THRESHOLD:
+        return False
+    if calc_homodimer_dg(seq) / 1000.0 < HOMODIMER_THRESHOLD:
+        return False
+    return True
+
+
+def check_heterodimer(fwd, rev):
+    """Cross-structure part of check_pair."""
+    return calc_heterodimer_dg(fwd, rev) / 1000.0 >= HETERODIMER_THRESHOLD
+
+
+def check_pair(fwd, rev):
+    hairpin_treshold = HAIRPIN_THRESHOLD #kcal/mol
+    homodimer_treshold = HOMODIMER_THRESHOLD
+    heterodimer_threshold = HETERODIMER_THRESHOLD
+
+    stats = analyze_pair(fwd, rev)
+
+    if stats['forward']['hairpin_dg'] < hairpin_treshold:
+        return False
+    if stats['forward']['homodimer_dg'] < homodimer_treshold:
+        return False
+    if stats['reverse']['hairpin_dg'] < hairpin_treshold:
+        return False
+    if stats['reverse']['homodimer_dg'] < homodimer_treshold:
+        return False
+    if stats['heterodimer_dg'] < heterodimer_threshold:
+        return False
+
+    return True
+
+
+def get_snippet(
+    seq: str,
+    *,
+    start: int,
+    length: int,
+    origin: str = "head",
+) -> str:
+    """
+    Extract a subsequence of given length from `seq`.
+
+    Parameters
+    ----------
+    seq : str
+        Full sequence (upper/lower case OK).
+    start : int
+        Offset where to begin (0-based).  Interpretation depends on `origin`.
+    length : int
+        Number of characters to return.
+    origin : {"head", "tail"}
+        • "head" → start is counted from 5' end (index 0).
+        • "tail" → start is counted from 3' end (index len(seq)-1).
+
+    Returns
+    -------
+    str
+        Requested subsequence. Raises ValueError if requested range
+        would go outside the sequence bounds.
+    """
+    seq = seq.upper()
+    n = len(seq)
+
+    if length <= 0:
+        raise ValueError("length must be positive")
+
+    if origin not in {"head", "tail"}:
+        raise ValueError("origin must be 'head' or 'tail'")
+
+    if origin == "head":
+        i0 = start
+    else:  # origin == "tail"
+        i0 = n - start - length
+
+    i1 = i0 + length
+
+    if i0 < 0 or i1 > n:
+        raise ValueError(
+            f"requested range [{i0}:{i1}] lies outside sequence of length {n}"
+        )
+
+    return seq[i0:i1]
+
+
+def build_sequences(arms, start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF):
+    """
+    Return the eight primer sequences of one candidate, in Primers() argument order.
+
+    `arms` maps leftHDR/rightHDR/leftAF/rightAF to their sequences; see file
+    "naming convention.pdf" for the orientation.
+    """
+    overhang_leftHDR = get_snippet(arms["leftHDR"], start=start_left, length=oh_leftHDR, origin="head")
+    #right HDR overhang single primer is reverse complement of plus strand
+    overhang_rightHDR_plus = get_snippet(arms["rightHDR"], start=start_right, length=oh_rightHDR, origin="tail")
+    overhang_rightHDR = str(Seq(overhang_rightHDR_plus).reverse_complement())
+
+    overhang_leftAF = get_snippet(arms["leftAF"], start=0, length=oh_leftAF, origin="head")
+    overhang_rightAF = get_snippet(arms["rightAF"], start=0, length=oh_rightAF, origin="tail")
+
+    HDRfw = overhang_rightAF + overhang_leftHDR
+    AFrv = str(Seq(HDRfw).reverse_complement())
+
+    AFfw  = overhang_rightHDR + overhang_leftAF
+    HDRrv  = str(Seq(AFfw).reverse_complement())
+
+    return (overhang_leftHDR, overhang_rightHDR, overhang_leftAF, overhang_rightAF,
+            HDRfw, HDRrv, AFfw, AFrv)
@@ -0,0 +1,235 @@
+# window_index.py
+"""
+Precomputed index of every oligo window the overhang search can use.
+
+Every candidate oligo is a window of one of the four arms (or its reverse
+complement), and the binding regions of the Gibson primers are windows of an
+arm junction. `WindowIndex` cuts all of them once for the configured starts and
+lengths and computes GC content and nearest-neighbour Tm in NumPy batches:
+SantaLucia (1998) unified parameters with primer3's salt correction, summed
+from cumulative ΔH/ΔS along each arm. For oligos up to 60 nt this is the
+formula primer3.bindings.calc_tm uses (same values up to float rounding), so
+the search loop and the binding-Tm QC only do table lookups and the startup
+cost grows with the arm length, not with the number of combinations.
+"""
+
+import math
+
+import numpy as np
+
+from primer_tools import DEFAULT_CONDITIONS, binding_region, calc_tm
+
+
+_CODE = {base: i for i, base in enumerate("ACGT")}
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+#SantaLucia 1998 unified nearest-neighbour parameters: ΔH (kcal/mol), ΔS (cal/K/mol)
+_NN = {
+    "AA": (-7.9, -22.2), "TT": (-7.9, -22.2),
+    "AT": (-7.2, -20.4), "TA": (-7.2, -21.3),
+    "CA": (-8.5, -22.7), "TG": (-8.5, -22.7),
+    "GT": (-8.4, -22.4), "AC": (-8.4, -22.4),
+    "CT": (-7.8, -21.0), "AG": (-7.8, -21.0),
+    "GA": (-8.2, -22.2), "TC": (-8.2, -22.2),
+    "CG": (-10.6, -27.2), "GC": (-9.8, -24.4),
+    "GG": (-8.0, -19.9), "CC": (-8.0, -19.9),
+}
+_NN_DH = np.zeros(16)
+_NN_DS = np.zeros(16)
+for _pair, (_dh, _ds) in _NN.items():
+    _NN_DH[4 * _CODE[_pair[0]] + _CODE[_pair[1]]] = _dh
+    _NN_DS[4 * _CODE[_pair[0]] + _CODE[_pair[1]]] = _ds
+#initiation with a terminal A·T (codes 0, 3) or G·C (codes 1, 2) pair, per end
+_INIT_DH = np.array([2.3, 0.1, 0.1, 2.3])
+_INIT_DS = np.array([4.1, -2.8, -2.8, 4.1])
+_SYMMETRY_DS = -1.4
+#primer3 switches to a GC%-based formula above this length
+MAX_NN_LENGTH = 60
+
+
+def reverse_complement(seq):
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def _encode(seq):
+    try:
+        return np.array([_CODE[base] for base in seq], dtype=np.int64)
+    except KeyError as e:
+        raise ValueError(f"unsupported base {e.args[0]!r}; WindowIndex needs plain ACGT sequences") from None
+
+
+def _finish_tm(dh, ds, first, last, length, symmetric, conditions):
+    """Tm (°C) from summed NN ΔH/ΔS, vectorized over oligos (primer3 santalucia / santalucia salt)."""
+    cond = dict(DEFAULT_CONDITIONS)
+    cond.update(conditions)
+    divalent, dntp = cond["dv_conc"], cond["dntp_conc"]
+    if divalent == 0:
+        dntp = 0
+    divalent = max(divalent, dntp)
+    monovalent = cond["mv_conc"] + 120 * math.sqrt(divalent - dntp)
+
+    dh = dh + _INIT_DH[first] + _INIT_DH[last]
+    ds = ds + _INIT_DS[first] + _INIT_DS[last]
+    ds = ds + 0.368 * (length - 1) * math.log(monovalent / 1000.0)
+    ds = np.where(symmetric, ds + _SYMMETRY_DS, ds)
+    strands = np.where(symmetric, 1.0, 4.0)
+    return dh * 1000.0 / (ds + 1.987 * np.log(cond["dna_conc"] / (strands * 1e9))) - 273.15
+
+
+def batch_tm(seqs, **conditions):
+    """NN Tm of a list of oligos in one NumPy pass (longer than MAX_NN_LENGTH -> primer3)."""
+    seqs = [s.upper() for s in seqs]
+    if not seqs:
+        return np.zeros(0)
+    lengths = np.array([len(s) for s in seqs])
+    width = lengths.max()
+    codes = np.zeros((len(seqs), width), dtype=np.int64)
+    for i, s in enumerate(seqs):
+        codes[i, :len(s)] = _encode(s)
+    pairs = 4 * codes[:, :-1] + codes[:, 1:]
+    valid = np.arange(width - 1)[None, :] < (lengths - 1)[:, None]
+    dh = np.where(valid, _NN_DH[pairs], 0.0).sum(axis=1)
+    ds = np.where(valid, _NN_DS[pairs], 0.0).sum(axis=1)
+    first = codes[:, 0]
+    last = codes[np.arange(len(seqs)), lengths - 1]
+    symmetric = np.array([s == reverse_complement(s) for s in seqs])
+    tm = _finish_tm(dh, ds, first, last, lengths, symmetric, conditions)
+    for i in np.flatnonzero(lengths > MAX_NN_LENGTH):
+        tm[i] = calc_tm(seqs[i], **conditions)
+    return tm
+
+
+def window_tm(seq, i0, lengths, **conditions):
+    """
+    NN Tm of the windows ``seq[i0:i0 + length]`` (arrays of equal shape), from
+    cumulative ΔH/ΔS sums along `seq`.
+    """
+    seq = seq.upper()
+    i0 = np.asarray(i0)
+    lengths = np.asarray(lengths)
+    codes = _encode(seq)
+    pairs = 4 * codes[:-1] + codes[1:]
+    cum_dh = np.concatenate([[0.0], np.cumsum(_NN_DH[pairs])])
+    cum_ds = np.concatenate([[0.0], np.cumsum(_NN_DS[pairs])])
+    i1 = i0 + lengths - 1                      # index of the last NN pair + 1
+    dh = cum_dh[i1] - cum_dh[i0]
+    ds = cum_ds[i1] - cum_ds[i0]
+    symmetric = np.vectorize(lambda a, n: seq[a:a + n] == reverse_complement(seq[a:a + n]))(i0, lengths)
+    tm = _finish_tm(dh, ds, codes[i0], codes[i0 + lengths - 1], lengths, symmetric, conditions)
+    for idx in zip(*np.nonzero(lengths > MAX_NN_LENGTH)):
+        tm[idx] = calc_tm(seq[i0[idx]:i0[idx] + lengths[idx]], **conditions)
+    return tm
+
+
+def window_gc(seq, i0, lengths):
+    """GC fraction of the windows ``seq[i0:i0 + length]`` from a cumulative GC count."""
+    seq = seq.upper()
+    cum_gc = np.concatenate([[0], np.cumsum([base in "GC" for base in seq])])
+    i0 = np.asarray(i0)
+    lengths = np.asarray(lengths)
+    return (cum_gc[i0 + lengths] - cum_gc[i0]) / lengths
+
+
+class WindowIndex:
+    """
+    All overhang windows for starts ``range(latest_start_HDR)`` and lengths `range_overhang`.
+
+    Attributes
+    ----------
+    oligos : dict
+        ``oligos[arm][(start, length)] -> (plus, primer)``: the window on the
+        given arm strand and the oligo the primer uses (its reverse complement
+        for rightHDR, the window itself otherwise). Starts count from the head
+        for leftHDR/leftAF and from the tail for rightHDR/rightAF, as in
+        get_snippet; the AF arms only have start 0.
+    tm, gc : dict
+        ``tm[arm][start, position[length]]`` NN Tm / GC fraction of each window.
+    binding_tm : dict
+        Binding-region (last 20 nt) Tm of each primer, indexed
+        ``[start_left, oh_leftHDR]`` for oh_leftHDR, ``[start_right, oh_rightHDR]``
+        for oh_rightHDR, ``[start_left, oh_leftHDR, oh_rightAF]`` for HDRfw/AFrv and
+        ``[start_right, oh_rightHDR, oh_leftAF]`` for AFfw/HDRrv (lengths through ``position``).
+    position : dict
+        Overhang length -> its index along the length axis of the tables
+        (``range_overhang`` may have any step).
+    """
+
+    ORIGINS = {"leftHDR": "head", "rightHDR": "tail", "leftAF": "head", "rightAF": "tail"}
+
+    def __init__(self, arms, range_overhang, latest_start_HDR, **conditions):
+        self.range_overhang = range_overhang
+        self.lengths = list(range_overhang)
+        self.min_length = self.lengths[0]
+        self.position = {length: i for i, length in enumerate(self.lengths)}
+        self.latest_start_HDR = latest_start_HDR
+        self.conditions = conditions
+        self.oligos, self.tm, self.gc = {}, {}, {}
+
+        for arm, origin in self.ORIGINS.items():
+            seq = arms[arm].upper()
+            starts = np.arange(latest_start_HDR if arm.endswith("HDR") else 1)
+            start_grid, length_grid = np.meshgrid(starts, self.lengths, indexing="ij")
+            i0 = start_grid if origin == "head" else len(seq) - start_grid - length_grid
+            if (i0 < 0).any() or (i0 + length_grid > len(seq)).any():
+                raise ValueError(f"{arm} ({len(seq)} nt) is too short for {latest_start_HDR} starts "
+                                 f"and overhangs up to {self.lengths[-1]} nt")
+            self.tm[arm] = window_tm(seq, i0, length_grid, **conditions)
+            self.gc[arm] = window_gc(seq, i0, length_grid)
+            self.oligos[arm] = {}
+            for start, length, a in zip(start_grid.ravel(), length_grid.ravel(), i0.ravel()):
+                plus = seq[a:a + length]
+                primer = reverse_complement(plus) if arm == "rightHDR" else plus
+                self.oligos[arm][(int(start), int(length))] = (plus, primer)
+
+        self.binding_tm = self._binding_tms()
+
+    def primer(self, arm, start, length):
+        return self.oligos[arm][(start, length)][1]
+
+    def sequences(self, start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF):
+        """Same as primer_tools.build_sequences, from the index."""
+        overhang_leftHDR = self.primer("leftHDR", start_left, oh_leftHDR)
+        overhang_rightHDR = self.primer("rightHDR", start_right, oh_rightHDR)
+        overhang_leftAF = self.primer("leftAF", 0, oh_leftAF)
+        overhang_rightAF = self.primer("rightAF", 0, oh_rightAF)
+        HDRfw = overhang_rightAF + overhang_leftHDR
+        AFfw = overhang_rightHDR + overhang_leftAF
+        return (overhang_leftHDR, overhang_rightHDR, overhang_leftAF, overhang_rightAF,
+                HDRfw, reverse_complement(AFfw), AFfw, reverse_complement(HDRfw))
+
+    def binding_tms(self, start_left, start_right, oh_leftHDR, oh_rightHDR, oh_leftAF, oh_rightAF):
+        """Binding-region Tm of the six paired primers of one candidate, as a dict."""
+        a, b = self.position[oh_leftHDR], self.position[oh_rightHDR]
+        c, d = self.position[oh_leftAF], self.position[oh_rightAF]
+        bt = self.binding_tm
+        return {
+            "oh_leftHDR": bt["oh_leftHDR"][start_left, a],
+            "oh_rightHDR": bt["oh_rightHDR"][start_right, b],
+            "HDRfw": bt["HDRfw"][start_left, a, d],
+            "HDRrv": bt["HDRrv"][start_right, b, c],
+            "AFfw": bt["AFfw"][start_right, b, c],
+            "AFrv": bt["AFrv"][start_left, a, d],
+        }
+
+    def _binding_tms(self):
+        #the binding region of a Gibson primer crosses the junction of two windows,
+        #so collect every distinct one and run them through batch_tm once
+        n = len(self.lengths)
+        starts = range(self.latest_start_HDR)
+        lists = {name: [] for name in ("oh_leftHDR", "oh_rightHDR", "HDRfw", "AFrv", "AFfw", "HDRrv")}
+        for start in starts:
+            for length in self.lengths:
+                left = self.primer("leftHDR", start, length)
+                right = self.primer("rightHDR", start, length)
+                lists["oh_leftHDR"].append(binding_region(left))
+                lists["oh_rightHDR"].append(binding_region(right))
+                for af_length in self.lengths:
+                    HDRfw = self.primer("rightAF", 0, af_length) + left
+                    AFfw = right + self.primer("leftAF", 0, af_length)
+                    lists["HDRfw"].append(binding_region(HDRfw))
+                    lists["AFrv"].append(binding_region(reverse_complement(HDRfw)))
+                    lists["AFfw"].append(binding_region(AFfw))
+                    lists["HDRrv"].append(binding_region(reverse_complement(AFfw)))
+        shapes = {"oh_leftHDR": (len(starts), n), "oh_rightHDR": (len(starts), n)}
+        return {name: batch_tm(seqs, **self.conditions).reshape(shapes.get(name, (len(starts), n, n)))
+                for name, seqs in lists.items()}
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+State shared between the acquisition service and the web workers.
+
+acquisition_service.py owns the hardware (sensors, SPI, fan GPIO) and is the
+only writer. For every reactor it keeps one memory-mapped file in
+SHARED_STATE_DIR (/dev/shm by default, i.e. RAM) holding the latest sample as
+JSON and the raw history ring buffer. Web workers (app.py with
+ACQUISITION=remote, as many processes as the server likes) map the same files
+read-only and answer /api/status, /api/stream and /api/history from them;
+fan and threshold commands go to the service over a Unix socket
+(CONTROL_SOCKET) as one JSON line each way.
+
+Readers never lock: the header has a sequence counter that the writer makes
+odd while it updates the file and even again when done, and a reader retries
+if the counter was odd or changed while it was reading.
+
+File layout (little-endian):
+    header    64 bytes: magic, version, capacity, seq, ring start, ring length,
+              snapshot ts, snapshot length
+    snapshot  SNAPSHOT_MAX bytes of JSON
+    columns   ts q[capacity], temperature_c d[capacity], ph d[capacity], fan_running b[capacity]
+"""
+
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bioreactor_backend import HistoryBuffer, ReactorView, SampleBroadcaster, Snapshot
+from history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BIOSTATE'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQqI')
+HEADER_SIZE = 64
+SNAPSHOT_MAX = 64 * 1024
+# offsets of the mutable header fields
+_SEQ, _START, _LEN, _SNAP_TS, _SNAP_LEN = 16, 24, 32, 40, 48
+
+
+def state_dir() -> str:
+    return os.environ.get('SHARED_STATE_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+
+def state_path(reactor: str) -> str:
+    return os.path.join(state_dir(), f"bioreactor-{reactor}.state")
+
+
+def control_socket_path() -> str:
+    return os.environ.get('CONTROL_SOCKET') or os.path.join(state_dir(), 'bioreactor-control.sock')
+
+
+class ControlError(Exception):
+    """The acquisition service could not be reached"""
+
+
+class SharedHistoryBuffer(HistoryBuffer):
+    """HistoryBuffer (plus the latest snapshot) in a memory-mapped file.
+
+    `create=True` (the acquisition service) makes a new file of `capacity`
+    samples and writes to it; otherwise the file is opened read-only and its
+    capacity is taken from the header.
+    """
+
+    def __init__(self, path: str, capacity: int = 24 * 60 * 60, create: bool = False):
+        self.path = path
+        self.writable = create
+        if create:
+            capacity = max(1, int(capacity))
+            size = HEADER_SIZE + SNAPSHOT_MAX + 25 * capacity
+            tmp = f"{path}.tmp"
+            header = bytearray(HEADER_SIZE)
+            HEADER.pack_into(header, 0, MAGIC, VERSION, capacity, 0, 0, 0, -1, 0)
+            with open(tmp, 'wb') as f:
+                f.write(header)
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)  # header complete before the file appears: readers never see a half-initialised one
+        with open(path, 'r+b' if create else 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if create else mmap.ACCESS_READ)
+            self._ino = os.fstat(f.fileno()).st_ino
+        magic, version, capacity = struct.unpack_from('<8sII', self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} bioreactor state file")
+        self.capacity = capacity
+        self._view = view = memoryview(self._mm)
+        offset = HEADER_SIZE + SNAPSHOT_MAX
+        self.ts = view[offset:offset + 8 * capacity].cast('q')
+        offset += 8 * capacity
+        self.temperature_c = view[offset:offset + 8 * capacity].cast('d')
+        offset += 8 * capacity
+        self.ph = view[offset:offset + 8 * capacity].cast('d')
+        offset += 8 * capacity
+        self.fan_running = view[offset:offset + capacity].cast('b')
+        self._lock = threading.Lock()          # HistoryBuffer's, within this process
+        self._write_lock = threading.Lock()    # one seqlock section at a time
+
+    # ring position lives in the header so that every process sees it
+    def _get(self, offset: int, fmt: str = '<Q') -> int:
+        return struct.unpack_from(fmt, self._mm, offset)[0]
+
+    def _set(self, offset: int, value: int, fmt: str = '<Q'):
+        struct.pack_into(fmt, self._mm, offset, value)
+
+    @property
+    def _start(self) -> int:
+        return self._get(_START)
+
+    @_start.setter
+    def _start(self, value: int):
+        self._set(_START, value)
+
+    @property
+    def _len(self) -> int:
+        return self._get(_LEN)
+
+    @_len.setter
+    def _len(self, value: int):
+        self._set(_LEN, value)
+
+    def _write(self, fn, *args):
+        # seqlock: odd while the single writer is updating
+        with self._write_lock:
+            seq = self._get(_SEQ)
+            self._set(_SEQ, seq + 1)
+            try:
+                fn(*args)
+            finally:
+                self._set(_SEQ, seq + 2)
+
+    def _read(self, fn, *args):
+        while True:
+            seq = self._get(_SEQ)
+            if not seq & 1:
+                try:
+                    value = fn(*args)
+                except (IndexError, ValueError):
+                    value = None  # torn read of the ring position; retried below
+                if self._get(_SEQ) == seq:
+                    return value
+            time.sleep(0)
+
+    def append(self, ts: int, temperature_c: Optional[float], ph: Optional[float], fan_running: bool):
+        self._write(super().append, ts, temperature_c, ph, fan_running)
+
+    def columns(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None):
+        if self.writable:
+            return super().columns(start_ms, end_ms)
+        return self._read(super().columns, start_ms, end_ms)
+
+    def publish(self, snapshot: Snapshot):
+        """Latest sample for the readers (called by the service for every new snapshot)"""
+        encoded = snapshot.encoded
+        if len(encoded) > SNAPSHOT_MAX:
+            logger.warning(f"Sample of {len(encoded)} bytes does not fit in {self.path}, not published")
+            return
+
+        def write():
+            self._mm[HEADER_SIZE:HEADER_SIZE + len(encoded)] = encoded
+            self._set(_SNAP_LEN, len(encoded), '<I')
+            self._set(_SNAP_TS, -1 if snapshot.ts is None else snapshot.ts, '<q')
+        self._write(write)
+
+    def snapshot_ts(self) -> Optional[int]:
+        """ts of the published sample (one header read; changes with every sample)"""
+        ts = self._get(_SNAP_TS, '<q')
+        return None if ts < 0 else ts
+
+    def read_snapshot(self) -> Tuple[Optional[int], Optional[bytes]]:
+        def read():
+            n = self._get(_SNAP_LEN, '<I')
+            return self.snapshot_ts(), (bytes(self._mm[HEADER_SIZE:HEADER_SIZE + n]) if n else None)
+        return self._read(read)
+
+    def replaced(self) -> bool:
+        """True once the service has been restarted and created a new file at `path`"""
+        try:
+            return os.stat(self.path).st_ino != self._ino
+        except OSError:
+            return False
+
+    def close(self):
+        for name in ('ts', 'temperature_c', 'ph', 'fan_running'):
+            getattr(self, name).release()
+        self._view.release()
+        self._mm.close()
+
+
+class ControlClient:
+    """JSON-line requests to the acquisition service's control socket"""
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 5.0):
+        self.path = path or control_socket_path()
+        self.timeout = timeout
+
+    def call(self, cmd: str, **params) -> Dict:
+        """Response of one command; ControlError if the service is down, ValueError if it refused"""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                sock.sendall(json.dumps(dict(params, cmd=cmd)).encode() + b'\n')
+                with sock.makefile('rb') as f:
+                    line = f.readline()
+        except OSError as e:
+            raise ControlError(f"Acquisition service not reachable at {self.path}: {e}")
+        if not line:
+            raise ControlError("Acquisition service closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+
+class RemoteReactor(ReactorView):
+    """One reactor as seen from a web worker: reads the shared state, sends commands to the service"""
+
+    def __init__(self, name: str, control: ControlClient, history_db: Optional[str] = None):
+        self.name = name
+        self.control = control
+        self.history = SharedHistoryBuffer(state_path(name))
+        self.store = None
+        if history_db:
+            try:
+                self.store = HistoryStore(history_db)
+            except Exception as e:
+                logger.warning(f"History store {history_db} unavailable, serving the last 24h only: {e}")
+        self._snapshot = Snapshot.build({'ts': None})
+        self.broadcaster = SampleBroadcaster()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        # decoded once per sample and worker
+        if self.history.snapshot_ts() != self._snapshot.ts:
+            ts, encoded = self.history.read_snapshot()
+            if encoded is not None:
+                self._snapshot = Snapshot.from_encoded(encoded)
+        return self._snapshot
+
+    def _watch(self):
+        # feeds /api/stream clients of this worker, and follows a restarted service to its new file
+        last = None
+        ticks = 0
+        retired = None  # replaced mapping, closed one check later when no request can still be using it
+        failing = False
+        while not self._stop.wait(0.1):
+            ticks += 1
+            try:
+                if ticks % 50 == 0:
+                    if retired is not None:
+                        self._close(retired)
+                        retired = None
+                    if self.history.replaced():
+                        logger.info(f"Acquisition service restarted, reopening {self.history.path}")
+                        retired, self.history = self.history, SharedHistoryBuffer(self.history.path)
+                if self.history.snapshot_ts() != last:
+                    snapshot = self.snapshot
+                    last = snapshot.ts
+                    self.broadcaster.publish(snapshot.encoded)
+                failing = False
+            except Exception as e:
+                # e.g. the service is restarting and its new file is not complete yet: retried next tick
+                if not failing:
+                    logger.error(f"Reading shared state of reactor '{self.name}' failed, retrying: {e}")
+                failing = True
+        if retired is not None:
+            self._close(retired)
+
+    @staticmethod
+    def _close(history: SharedHistoryBuffer):
+        try:
+            history.close()
+        except BufferError as e:
+            logger.warning(f"Old shared state {history.path} still in use, left to the garbage collector: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name=f"watch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self.store is not None:
+            self.store.close()
+
+    def set_fan(self, running: bool) -> bool:
+        return self.control.call('fan', reactor=self.name, action='start' if running else 'stop')['fan_running']
+
+    def get_fan_threshold(self) -> float:
+        return self.control.call('config', reactor=self.name)['fan_temp_threshold']
+
+    def set_fan_threshold(self, value: float) -> float:
+        return self.control.call('config', reactor=self.name, fan_temp_threshold=value)['fan_temp_threshold']
+
+    def adc_stats(self) -> Dict:
+        return self.control.call('adc', reactor=self.name)['adc']
+
+
+class RemoteRegistry:
+    """ReactorRegistry counterpart for web workers (same get / describe / start / stop)"""
+
+    def __init__(self, control: ControlClient, reactors: List[Dict]):
+        self.control = control
+        self.reactors: Dict[str, RemoteReactor] = {
+            r['name']: RemoteReactor(r['name'], control, r.get('history_db')) for r in reactors
+        }
+
+    @classmethod
+    def from_env(cls, wait: float = 30.0) -> 'RemoteRegistry':
+        """Reactors of the running acquisition service (waits up to `wait` s for it to come up)"""
+        control = ControlClient()
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                return cls(control, control.call('reactors', paths=True)['reactors'])
+            except ControlError as e:
+                if time.monotonic() > deadline:
+                    raise ControlError(f"No acquisition service: {e}")
+                time.sleep(0.5)
+
+    @property
+    def default(self) -> RemoteReactor:
+        return next(iter(self.reactors.values()))
+
+    def get(self, name: Optional[str] = None) -> RemoteReactor:
+        return self.default if name is None else self.reactors[name]
+
+    def describe(self) -> List[Dict]:
+        return self.control.call('reactors')['reactors']
+
+    def start_monitoring(self, interval: float = 1.0):
+        for reactor in self.reactors.values():
+            reactor.start()
+
+    def stop_monitoring(self):
+        for reactor in self.reactors.values():
+            reactor.stop()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Simulated bioreactor hardware for development and load tests.
+
+Replays a sensor trace (a recorded CSV or a generated one) through the same
+interfaces the real hardware uses, optionally faster than real time:
+
+  FakeW1Sysfs   a w1 sysfs tree of DS18B20 probes; a read takes the conversion
+                time and now and then fails its CRC, like the kernel driver
+  TraceSpiDev   an MCP3008 on SPI whose pH channels follow the trace
+  GPIORecorder  an RPi.GPIO stand-in that records every pin change
+
+Run the app on it with
+
+    ACQUISITION=simulated SIM_SPEED=60 python app.py
+
+or build monitors directly (bench_monitor.py does):
+
+    hw = SimulatedHardware(generate_trace(days=1), speed=60)
+    registry = hw.registry()
+
+At speed N one real second is N simulated ones: sensor cadences, DS18B20
+conversion time and the monitor interval shrink by N, and sample timestamps
+come from the simulated clock. speed=0 stops the clock; advance() steps it
+(for soak tests that run as fast as the code allows).
+"""
+
+import bisect
+import csv
+import io
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bioreactor_backend import (BioreactorMonitor, FanController, PHSensor, ReactorRegistry,
+                                TemperatureSensor)
+from mcp3008 import MCP3008, FakeSpiDev
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# two-point pH calibration of the simulated probe (same format as PH_CAL_*)
+DEFAULT_CALIBRATION = {'low_ph': 7.0, 'low_v': 1.70, 'high_ph': 4.0, 'high_v': 2.10}
+
+
+class SimClock:
+    """Simulated wall clock: `speed` simulated seconds per real second, plus manual steps"""
+
+    def __init__(self, speed: float = 1.0, start: Optional[float] = None):
+        self.speed = speed
+        self.start = time.time() if start is None else start
+        self._t0 = time.monotonic()
+        self._offset = 0.0
+
+    def elapsed(self) -> float:
+        """Simulated seconds since the start"""
+        return (time.monotonic() - self._t0) * self.speed + self._offset
+
+    def time(self) -> float:
+        return self.start + self.elapsed()
+
+    def advance(self, seconds: float):
+        self._offset += seconds
+
+    def real(self, seconds: float) -> float:
+        """Real duration of `seconds` simulated ones (0 for a stepped clock)"""
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+
+class Trace:
+    """Temperature / pH over time (seconds from the start), linearly interpolated and looped"""
+
+    def __init__(self, times: List[float], temperature: List[Optional[float]], ph: List[Optional[float]]):
+        if len(times) < 2:
+            raise ValueError("a trace needs at least two points")
+        t0 = times[0]
+        self.times = [t - t0 for t in times]
+        self.duration = self.times[-1] + (self.times[-1] - self.times[-2])
+        self._columns = {
+            name: [(t, v) for t, v in zip(self.times, values) if v is not None]
+            for name, values in (('temperature_c', temperature), ('ph', ph))
+        }
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'Trace':
+        """CSV with ts, temperature_c, ph columns; ts in seconds or epoch ms (e.g. an /api/export download)"""
+        times, temperature, ph = [], [], []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    ts = float(row['ts'])
+                except (KeyError, ValueError):
+                    continue
+                times.append(ts)
+                temperature.append(float(row['temperature_c']) if row.get('temperature_c') else None)
+                ph.append(float(row['ph']) if row.get('ph') else None)
+        if times and times[0] > 1e11:  # epoch milliseconds
+            times = [t / 1000.0 for t in times]
+        return cls(times, temperature, ph)
+
+    def to_csv(self, path: str):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ts', 'temperature_c', 'ph'])
+            for t in self.times:
+                writer.writerow([t, round(self.value('temperature_c', t), 3), round(self.value('ph', t), 3)])
+
+    def value(self, name: str, t: float) -> Optional[float]:
+        points = self._columns[name]
+        if not points:
+            return None
+        t = t % self.duration
+        i = bisect.bisect_right(points, (t, math.inf))
+        if i == 0 or i == len(points):
+            return points[0][1] if i == 0 else points[-1][1]
+        (t1, v1), (t2, v2) = points[i - 1], points[i]
+        return v1 + (v2 - v1) * (t - t1) / (t2 - t1)
+
+    def temperature(self, t: float) -> Optional[float]:
+        return self.value('temperature_c', t)
+
+    def ph(self, t: float) -> Optional[float]:
+        return self.value('ph', t)
+
+    def crossings(self, threshold: float, start: float, end: float, hysteresis: float = 1.0,
+                  step: Optional[float] = None) -> List[float]:
+        """Simulated times in [start, end) where the temperature rises above `threshold`
+        after having been at or below threshold - hysteresis (when FanController starts the fan)"""
+        step = step or max(0.1, min(self.times[1] - self.times[0], 1.0))
+        out = []
+        armed = (self.temperature(start) or 0.0) <= threshold - hysteresis
+        t = start
+        while t < end:
+            temp = self.temperature(t) or 0.0
+            if armed and temp > threshold:
+                out.append(t)
+                armed = False
+            elif temp <= threshold - hysteresis:
+                armed = True
+            t += step
+        return out
+
+
+def generate_trace(days: float = 1.0, step: float = 10.0, seed: int = 0, heat_every: float = 6 * 3600,
+                   heat_duration: float = 1800, heat_delta: float = 5.0) -> Trace:
+    """Synthetic culture: daily temperature and pH cycles, slow random drift, sensor noise,
+    and a heat event (e.g. direct sun on the flask) every `heat_every` seconds."""
+    rng = random.Random(seed)
+    n = max(2, int(days * DAY / step))
+    times, temperature, ph = [], [], []
+    drift_t = drift_ph = 0.0
+    for k in range(n):
+        t = k * step
+        day = t / DAY
+        drift_t = 0.999 * drift_t + rng.gauss(0, 0.02)
+        drift_ph = 0.999 * drift_ph + rng.gauss(0, 0.002)
+        temp = 26.0 + 2.5 * math.sin(2 * math.pi * (day - 0.25)) + drift_t + rng.gauss(0, 0.05)
+        into = t % heat_every if heat_every else heat_duration
+        if into < heat_duration:
+            # quick rise, slow fall
+            temp += heat_delta * min(1.0, into / (0.2 * heat_duration)) * (1 - max(0.0, into - 0.2 * heat_duration) / heat_duration)
+        times.append(t)
+        temperature.append(temp)
+        # photosynthesis raises the pH during the day
+        ph.append(7.6 + 0.4 * math.sin(2 * math.pi * (day - 0.3)) + drift_ph + rng.gauss(0, 0.01))
+    return Trace(times, temperature, ph)
+
+
+def _crc8(data: bytes) -> int:
+    # Dallas/Maxim 1-Wire CRC (x^8 + x^5 + x^4 + 1)
+    crc = 0
+    for byte in data:
+        for _ in range(8):
+            mix = (crc ^ byte) & 1
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+class FakeW1Sysfs:
+    """A directory of DS18B20 probes (28-*/w1_slave) whose reads follow the trace.
+
+    Pass `open` as TemperatureSensor's opener: reads of w1_slave files under
+    `root` block for the (scaled) conversion time and return what the kernel
+    driver would, including scratchpads that fail their CRC (... crc=xx NO).
+    """
+
+    def __init__(self, trace: Trace, clock: SimClock, root: str, probes: int = 1,
+                 conversion_delay: float = 0.75, crc_failure_rate: float = 0.02, seed: int = 0):
+        self.trace = trace
+        self.clock = clock
+        self.root = root
+        self.conversion_delay = conversion_delay
+        self.crc_failure_rate = crc_failure_rate
+        self.rng = random.Random(seed)
+        self.reads = 0
+        self.crc_failures = 0
+        self.probe_ids = [f"28-5100000000{i:02x}" for i in range(probes)]
+        for probe in self.probe_ids:
+            os.makedirs(os.path.join(root, probe), exist_ok=True)
+            with open(os.path.join(root, probe, 'w1_slave'), 'w') as f:
+                f.write(self.w1_slave(25.0, False))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def w1_slave(celsius: float, crc_ok: bool, flip: int = 0) -> str:
+        raw = int(round(celsius * 16)) & 0xFFFF
+        data = bytes([raw & 0xFF, raw >> 8, 0x4b, 0x46, 0x7f, 0xff, 0x0c, 0x10])
+        crc = _crc8(data)
+        if not crc_ok:
+            # a bit flipped on the wire: the CRC no longer matches and t= is wrong
+            data = bytes([data[0] ^ (1 << (flip % 8)), data[1] ^ (1 << (flip // 8 % 3))]) + data[2:]
+        value = int.from_bytes(data[:2], 'little', signed=True)
+        hexdump = ' '.join(f"{b:02x}" for b in data + bytes([crc]))
+        return (f"{hexdump} : crc={crc:02x} {'YES' if crc_ok else 'NO'}\n"
+                f"{hexdump} t={value * 1000 // 16}\n")
+
+    def probe_offset(self, probe: str) -> float:
+        # probes of several simulated reactors read slightly different temperatures
+        return 0.5 * self.probe_ids.index(probe)
+
+    def open(self, path, mode='r', *args, **kwargs):
+        path = os.fspath(path)
+        if not path.startswith(self.root) or os.path.basename(path) != 'w1_slave':
+            return open(path, mode, *args, **kwargs)
+        probe = os.path.basename(os.path.dirname(path))
+        delay = self.clock.real(self.conversion_delay)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.reads += 1
+            crc_ok = self.rng.random() >= self.crc_failure_rate
+            if not crc_ok:
+                self.crc_failures += 1
+            flip = self.rng.randrange(24)
+        celsius = self.trace.temperature(self.clock.elapsed()) + self.probe_offset(probe)
+        return io.StringIO(self.w1_slave(celsius, crc_ok, flip))
+
+
+class TraceSpiDev(FakeSpiDev):
+    """MCP3008 on SPI whose channels are voltages computed from the simulated time"""
+
+    def __init__(self, clock: SimClock, channels: Dict[int, Callable[[float], Optional[float]]],
+                 vref: float = 3.3, noise_counts: float = 1.5, seed: int = 0):
+        super().__init__()
+        self.clock = clock
+        self.channels = channels
+        self.vref = vref
+        self.noise_counts = noise_counts
+        self.rng = random.Random(seed)
+
+    def xfer2(self, data: List[int]) -> List[int]:
+        self.transfers += 1
+        if len(data) != 3 or data[0] != 1:
+            raise ValueError(f"unexpected MCP3008 command {data}")
+        channel = (data[1] >> 4) & 7
+        volts = self.channels[channel](self.clock.elapsed()) if channel in self.channels else None
+        count = 0 if volts is None else volts / self.vref * 1023 + self.rng.gauss(0, self.noise_counts)
+        count = max(0, min(1023, int(round(count))))
+        return [0, (count >> 8) & 3, count & 0xFF]
+
+
+class GPIORecorder:
+    """RPi.GPIO stand-in (BCM numbering) that records (simulated time, pin, state) for every output"""
+
+    BCM = "BCM"
+    OUT = "OUT"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, clock: SimClock):
+        self.clock = clock
+        self.events: List[Tuple[float, int, int]] = []
+        self.state: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, mode):
+        self.state.setdefault(pin, self.LOW)
+
+    def output(self, pin, state):
+        with self._lock:
+            state = self.HIGH if state else self.LOW
+            if self.state.get(pin) != state:
+                self.events.append((self.clock.time(), pin, state))
+            self.state[pin] = state
+
+    def cleanup(self):
+        pass
+
+    def rising_edges(self, pin: int) -> List[float]:
+        """Simulated epoch times at which `pin` went HIGH"""
+        with self._lock:
+            return [t for t, p, s in self.events if p == pin and s == self.HIGH]
+
+
+class SimulatedRegistry(ReactorRegistry):
+    """ReactorRegistry of simulated reactors; the monitor interval runs at the simulation speed"""
+
+    def __init__(self, hardware: 'SimulatedHardware', monitors: List[BioreactorMonitor]):
+        super().__init__(monitors=monitors)
+        self.hardware = hardware
+
+    def start_monitoring(self, interval: float = 2.0):
+        super().start_monitoring(self.hardware.clock.real(interval) or interval)
+
+    def stop_monitoring(self):
+        super().stop_monitoring()
+        self.hardware.close()
+
+
+class SimulatedHardware:
+    """Probes, MCP3008 and fan GPIO of `reactors` simulated reactors, driven by one trace.
+
+    Reactor i has probe i, pH on ADC channel i and its fan on BCM pin 12 + i.
+    """
+
+    def __init__(self, trace: Optional[Trace] = None, speed: float = 1.0, reactors: int = 1,
+                 conversion_delay: float = 0.75, crc_failure_rate: float = 0.02, seed: int = 0,
+                 calibration: Optional[Dict] = None, adc_samples: int = 16, history_db: str = ''):
+        self.trace = trace or generate_trace(seed=seed)
+        self.clock = SimClock(speed)
+        self.calibration = dict(calibration or DEFAULT_CALIBRATION)
+        self.root = tempfile.mkdtemp(prefix='w1-sim-')
+        self.w1 = FakeW1Sysfs(self.trace, self.clock, self.root, reactors, conversion_delay, crc_failure_rate, seed)
+        slope = (self.calibration['high_ph'] - self.calibration['low_ph']) / (self.calibration['high_v'] - self.calibration['low_v'])
+
+        def ph_volts(offset):
+            def volts(t):
+                ph = self.trace.ph(t)
+                return None if ph is None else self.calibration['low_v'] + (ph + offset - self.calibration['low_ph']) / slope
+            return volts
+        self.spi = TraceSpiDev(self.clock, {i: ph_volts(0.05 * i) for i in range(reactors)}, seed=seed)
+        self.adc = MCP3008(self.spi, samples=adc_samples)
+        self.gpio = GPIORecorder(self.clock)
+        self.reactors = reactors
+        self.history_db = history_db
+
+    @classmethod
+    def from_env(cls) -> 'SimulatedHardware':
+        """SIM_TRACE (CSV, default: one generated day), SIM_SPEED, SIM_REACTORS, SIM_SEED, SIM_CRC_FAILURES
+        and SIM_HISTORY_DB (default: history in memory only, so simulated samples never mix with real ones)"""
+        seed = int(os.environ.get('SIM_SEED', '0'))
+        path = os.environ.get('SIM_TRACE')
+        return cls(Trace.from_csv(path) if path else generate_trace(seed=seed),
+                   speed=float(os.environ.get('SIM_SPEED', '1')),
+                   reactors=int(os.environ.get('SIM_REACTORS', '1')),
+                   crc_failure_rate=float(os.environ.get('SIM_CRC_FAILURES', '0.02')),
+                   seed=seed,
+                   history_db=os.environ.get('SIM_HISTORY_DB', ''))
+
+    def fan_pin(self, i: int) -> int:
+        return 12 + i
+
+    def monitor(self, i: int = 0, name: Optional[str] = None, history_db: Optional[str] = None,
+                fan_threshold: Optional[float] = None) -> BioreactorMonitor:
+        """Reactor i on the simulated hardware"""
+        name = name or ('default' if self.reactors == 1 else f"sim-{i + 1}")
+        history_db = self.history_db if history_db is None else history_db
+        if history_db and self.reactors > 1:
+            base, ext = os.path.splitext(history_db)
+            history_db = f"{base}-{name}{ext}"  # one store per reactor
+        temp_sensor = TemperatureSensor(self.w1.probe_ids[i], base_dir=self.root, opener=self.w1.open)
+        temp_sensor.retry_delay = self.clock.real(temp_sensor.retry_delay)
+        monitor = BioreactorMonitor(
+            name,
+            temp_sensor=temp_sensor,
+            ph_sensor=PHSensor(adc_channel=i, adc=self.adc, analog_channels={}, calibration=self.calibration),
+            fan_controller=FanController(self.fan_pin(i), fan_threshold, gpio=self.gpio),
+            history_db=history_db)
+        monitor.clock = self.clock.time
+        for task in monitor.acquisition.tasks.values():
+            task.interval = self.clock.real(task.interval) or task.interval
+        return monitor
+
+    def registry(self) -> SimulatedRegistry:
+        return SimulatedRegistry(self, [self.monitor(i) for i in range(self.reactors)])
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -1,3 +1,13 @@
+// Reactor shown on this page (?reactor=<name>), passed on to every API call
+const reactorName = new URLSearchParams(window.location.search).get('reactor');
+
+function apiUrl(path, params = {}) {
+  const q = new URLSearchParams(params);
+  if (reactorName) q.set('reactor', reactorName);
+  const qs = q.toString();
+  return qs ? `${path}?${qs}` : path;
+}
+
 async function fetchJSON(url, opts = {}) {
   const res = await fetch(url, Object.assign({ headers: { 'Content-Type': 'application/json' } }, opts));
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
@@ -6,7 +16,9 @@ async function fetchJSON(url, opts = {}) {
 
 async function seedHistory(minutes) {
   try {
-    const res = await fetch(`/api/history?minutes=${encodeURIComponent(minutes)}`);
+    // Backend averages into the same 10s buckets the charts plot
+    const bucketS = plotIntervalMs / 1000;
+    const res = await fetch(apiUrl('/api/history', { minutes, bucket: bucketS }));
     if (!res.ok) return;
     const payload = await res.json();
     const rows = payload.data || [];
@@ -16,36 +28,62 @@ async function seedHistory(minutes) {
     // Only keep last 30 minutes in case backend returned more
     const nowMs = Date.now();
     const cutoff = nowMs - windowMs;
-    let lastKept = 0;
     for (const r of rows) {
       const ts = typeof r.ts === 'number' ? r.ts : Date.parse(r.timestamp);
       if (ts >= cutoff) {
-        if (ts - lastKept >= plotIntervalMs) {
-          tempTimes.push(ts);
-          tempValues.push(r.temperature_c != null ? r.temperature_c : null);
-          phTimes.push(ts);
-          phValues.push(r.ph != null ? r.ph : null);
-          lastKept = ts;
-        }
+        tempTimes.push(ts);
+        tempValues.push(r.temperature_c != null ? r.temperature_c : null);
+        phTimes.push(ts);
+        phValues.push(r.ph != null ? r.ph : null);
       }
     }
-    // Snap lastBucket to last historical bucket to honor 10s spacing
-    if (tempTimes.length) {
-      lastBucket = Math.floor(tempTimes[tempTimes.length - 1] / plotIntervalMs);
-    }
-    // Render datasets
-    const nowSec = Date.now() / 1000;
-    if (tempChart) {
-      tempChart.data.datasets[0].data = tempTimes.map((t, i) => ({ x: (t / 1000) - nowSec, y: tempValues[i] }));
-      tempChart.update('none');
+    renderHistory();
+  } catch {}
+}
+
+// Fetch only the buckets newer than the last plotted point (after a reconnect or a sleeping tab)
+async function catchUpHistory() {
+  if (!tempTimes.length) return seedHistory(windowMs / 60000);
+  const since = tempTimes[tempTimes.length - 1];
+  try {
+    const bucketS = plotIntervalMs / 1000;
+    const res = await fetch(apiUrl('/api/history', { minutes: windowMs / 60000, bucket: bucketS, since }));
+    if (!res.ok) return;
+    const rows = (await res.json()).data || [];
+    const cutoff = Date.now() - windowMs;
+    for (const r of rows) {
+      // The bucket holding the cursor starts before it and is already plotted
+      if (r.ts <= since) continue;
+      tempTimes.push(r.ts);
+      tempValues.push(r.temperature_c != null ? r.temperature_c : null);
+      phTimes.push(r.ts);
+      phValues.push(r.ph != null ? r.ph : null);
     }
-    if (phChart) {
-      phChart.data.datasets[0].data = phTimes.map((t, i) => ({ x: (t / 1000) - nowSec, y: phValues[i] }));
-      phChart.update('none');
+    while (tempTimes.length && tempTimes[0] < cutoff) {
+      tempTimes.shift(); tempValues.shift();
+      phTimes.shift(); phValues.shift();
     }
+    renderHistory();
   } catch {}
 }
 
+function renderHistory() {
+  // Snap lastBucket to last historical bucket to honor 10s spacing
+  if (tempTimes.length) {
+    lastBucket = Math.floor(tempTimes[tempTimes.length - 1] / plotIntervalMs);
+  }
+  // Render datasets
+  const nowSec = Date.now() / 1000;
+  if (tempChart) {
+    tempChart.data.datasets[0].data = tempTimes.map((t, i) => ({ x: (t / 1000) - nowSec, y: tempValues[i] }));
+    tempChart.update('none');
+  }
+  if (phChart) {
+    phChart.data.datasets[0].data = phTimes.map((t, i) => ({ x: (t / 1000) - nowSec, y: phValues[i] }));
+    phChart.update('none');
+  }
+}
+
 function setText(id, value) {
   const el = document.getElementById(id);
   if (el) el.textContent = value;
@@ -58,6 +96,27 @@ function setCardState(cardId, state) {
   card.classList.add(state);
 }
 
+// Alerts firing on the reactor (the `alerts` of every sample), most severe first
+function renderAlerts(alerts) {
+  const list = document.getElementById('alerts');
+  if (!list) return;
+  list.replaceChildren();
+  const sorted = (alerts || []).slice().sort((a, b) => (b.severity === 'critical') - (a.severity === 'critical'));
+  for (const a of sorted) {
+    const item = document.createElement('li');
+    item.className = `alert ${a.severity}`;
+    const name = document.createElement('span');
+    name.className = 'alert-name';
+    name.textContent = a.name;
+    const since = document.createElement('span');
+    since.className = 'alert-since';
+    since.textContent = `since ${new Date(a.since).toLocaleTimeString()}`;
+    item.append(name, a.message, since);
+    list.append(item);
+  }
+  list.hidden = sorted.length === 0;
+}
+
 function updateUI(data) {
   const tC = data.temperature_c;
   const tF = data.temperature_f;
@@ -81,25 +140,77 @@ function updateUI(data) {
     else setCardState('card-ph', 'bad');
   }
 
+  renderAlerts(data.alerts);
+
   // Push to charts
   appendToCharts({ tC, pH });
 }
 
+// ts of the last sample shown; /api/status answers 304 (served from the browser cache) until it changes
+let lastSampleTs = null;
+
 async function refresh() {
   try {
-    const data = await fetchJSON('/api/status');
+    const data = await fetchJSON(apiUrl('/api/status'));
+    if (data.ts != null && data.ts === lastSampleTs) return;
+    lastSampleTs = data.ts;
     updateUI(data);
   } catch (e) {
     console.error('Failed to fetch status', e);
   }
 }
 
+// Live updates: Server-Sent Events from /api/stream, polling /api/status as fallback
+let pollTimer = null;
+
+function startPolling() {
+  if (pollTimer) return;
+  refresh();
+  pollTimer = setInterval(refresh, 2000);
+}
+
+function stopPolling() {
+  if (!pollTimer) return;
+  clearInterval(pollTimer);
+  pollTimer = null;
+}
+
+function startStream() {
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+  const es = new EventSource(apiUrl('/api/stream'));
+  es.onopen = () => {
+    stopPolling();
+    catchUpHistory();
+  };
+  es.onmessage = (e) => {
+    try {
+      const data = JSON.parse(e.data);
+      lastSampleTs = data.ts;
+      updateUI(data);
+    } catch (err) {
+      console.error('Bad stream message', err);
+    }
+  };
+  es.onerror = () => {
+    // Stream refused or dropped: poll for a while, then try streaming again
+    es.close();
+    startPolling();
+    setTimeout(startStream, 30000);
+  };
+}
+
 function init() {
   setupCharts();
-  // Load 30 min history first, then start polling
+  // Load 30 min history first, then start live updates
   seedHistory(30).then(() => {
-    refresh();
-    setInterval(refresh, 2000);
+    startStream();
+  });
+  // A tab waking from sleep only fetches what it missed
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'visible') catchUpHistory();
   });
 
   // Fullscreen toggle